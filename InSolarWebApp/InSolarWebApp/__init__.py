@@ -2,8 +2,20 @@
 The flask application package.
 """
 
-from flask import Flask
-app = Flask(__name__)
+from InSolarWebApp.startup import phase, warm_up
 
-import InSolarWebApp.api
+with phase("import_flask"):
+    from flask import Flask
+    app = Flask(__name__)
 
+with phase("import_api"):
+    import InSolarWebApp.api
+
+def warm_app():
+    """ returns the application after warm_up, for WSGI hosts that import a 
+    handler: ptvs_virtualenv_proxy.py calls it when the app settings of the 
+    site set WSGI_ALT_VIRTUALENV_HANDLER = InSolarWebApp.warm_app(), with 
+    the handler InSolarWebApp.app the first request waits for the loading
+    """
+    warm_up()
+    return app
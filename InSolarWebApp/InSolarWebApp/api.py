@@ -5,20 +5,94 @@ Routes and views for the flask application.
 # TODO: correct orientation-180
 
 from InSolarWebApp import app
-from flask import Flask, request
-from azure.storage.table import TableService, Entity
+from flask import request, Response, g
 
 import numpy as np 
 import pandas as pd
-import datetime as dt # used for rounding time
-import pvlib #the library of sandia, the us national laboratories
-import os
-import sys
 import json
+import time
 
-from helper_functions import *
-from radiation_on_azure import *
-from model import *
+from helper_functions import round_time, Resample, ConvertToJSON, ConvertToJSONStream, \
+                             ConvertToDict, ConvertToBinary, EncodeCursor, DecodeCursor, \
+                             RESOLUTIONS, INTERVAL_SECONDS
+from model import fnGetExpectedProduction, fnGetExpectedProductionBatch, \
+                  fnGetExpectedProductionInterpolated, fnBlendRadiation, \
+                  fnGroupInstallations, fnGetPortfolioProduction
+from grid import INTERPOLATION_METHODS
+from radiation_cache import RadiationCache
+from gap_filling import FillGaps, FILL_METHODS
+from ingestion import IngestFrames
+from resources import get_config, reload_config, get_grid, get_inverters, get_table_service, \
+                      get_radiation_backend, get_radiation_store, get_solar_cache, \
+                      get_response_cache, get_portfolio
+from executor import run_cpu, run_model, map_model
+from metrics import registry, timed, observe_stage, start_timings, stop_timings, \
+                    format_server_timing, format_cache_stats, REQUESTS, REQUEST_SECONDS
+from startup import startup_report
+
+def setup_request():
+    """ returns config and radiation backend, the time it took is reported 
+    in the X-Setup-Time header and as stage setup
+    """
+    start = time.time()
+    config = get_config()
+    radiation_backend = get_radiation_backend()
+    g.setup_time = time.time() - start
+    observe_stage("setup", g.setup_time)
+    return config, radiation_backend
+
+def GapFillingZenith(fill, gridpoint, grid, index):
+    """ returns the solar zenith of the gridpoint centre that clear sky gap 
+    filling needs, None for the other methods
+    """
+    if fill != "clearsky":
+        return None
+    geo_long, geo_lat = grid.centre(gridpoint)
+    return get_solar_cache().get(gridpoint, geo_long, geo_lat, index)[0]
+
+def GetRadiationBlock(radiation_backend, grid, neighbours, time_begin, time_end, 
+                      fill, max_gap):
+    """ reads the radiation of the cells around installations at once and 
+    fills its gaps per cell
+    @param neighbours: np array [installation x 4]: gridpoints, see 
+                       Grid.neighbours
+
+    @returns: pd datetimeindex, dict: variable -> np array [time x cell],
+              np array [installation x 4]: columns of the neighbours
+    """
+    cells, columns = np.unique(neighbours, return_inverse = True)
+    with timed("radiation_fetch"):
+        index, radiation = radiation_backend.get_radiation_block(cells, time_begin, time_end)
+    if fill != "none":
+        with timed("gap_filling"):
+            for j, cell in enumerate(cells):
+                df = pd.DataFrame(dict((name, radiation[name][:, j]) for name in radiation), 
+                                  index = index)
+                df = FillGaps(df, fill, max_gap, GapFillingZenith(fill, cell, grid, index))
+                for name in radiation:
+                    radiation[name][:, j] = df[name].values
+    return index, radiation, columns.reshape(neighbours.shape)
+
+@app.before_request
+def start_request():
+    g.request_start = time.time()
+    start_timings()
+
+@app.after_request
+def add_headers(response):
+    timings = stop_timings()
+    if hasattr(g, 'setup_time'):
+        response.headers['X-Setup-Time'] = "%.3f ms" % (1000*g.setup_time)
+    if hasattr(g, 'response_cache'):
+        response.headers['X-Cache'] = g.response_cache
+    if timings and get_config().get('server_timing', False):
+        response.headers['Server-Timing'] = format_server_timing(timings)
+
+    endpoint = request.endpoint or "unknown"
+    REQUESTS.inc(endpoint = endpoint, status = response.status_code)
+    if hasattr(g, 'request_start'):
+        REQUEST_SECONDS.observe(time.time() - g.request_start, endpoint = endpoint)
+    return response
 
 @app.route('/hw', methods = ['GET'])
 def api_hello_world():
@@ -26,15 +100,11 @@ def api_hello_world():
 
 @app.route('/testAzureConnection', methods = ['GET'])
 def test_connection():
-    # read config file
-    config_file = os.path.join(os.path.dirname(os.path.realpath(__file__)), "config.py")
-    config = dict()
-    execfile(config_file, config)
-
     # tests connection with Azure, if succesfull returns one row from table
-    table_service = TableService(account_name=config['account_name'], 
-                                 account_key=config['account_key'])
-    storage_name = config['storage_name']
+    start = time.time()
+    table_service = get_table_service()
+    storage_name = get_config()['storage_name']
+    g.setup_time = time.time() - start
     partition_key = "000000_20130601"
     row_key = "20130601_074500"
     meteo_data = table_service.get_entity(storage_name, partition_key, row_key)
@@ -46,6 +116,65 @@ def test_connection():
                  "extrapolated" : meteo_data.extrapolated}
     return json.dumps(test_json)
 
+@app.route('/reloadConfig', methods = ['POST'])
+def api_reload_config():
+    reload_config()
+    return "config reloaded"
+
+@app.route('/ingestRadiation', methods = ['POST'])
+def api_ingest_radiation():
+    # new radiation frames of the whole grid into the local radiation store,
+    # as {"frames": [{"dateTime": ..., "diffuse": [...], "downwelling": [...]}]}
+    # or a single frame, with a value (or null) for every gridpoint
+    if request.headers['Content-Type'] != 'application/json':
+        return "415 Unsupported Input Media Type: has to be JSON, i.e. Content-Type = application/json"
+    if not get_config().get('radiation_ingestion', False):
+        return "403 Forbidden: radiation ingestion is disabled"
+    store = get_radiation_store()
+    if store is None:
+        return "400 Bad Request: ingestion needs the local radiation store"
+
+    input_data = request.json
+    frames = input_data['frames'] if 'frames' in input_data else [input_data]
+    if not frames:
+        return "400 Bad Request: no frames"
+    index = pd.DatetimeIndex([pd.to_datetime(frame['dateTime'], utc=True) for frame in frames])
+    values = dict((name, np.array([frame[name] for frame in frames], dtype=float).reshape(len(frames), -1))
+                  for name in ("diffuse", "downwelling"))
+    try:
+        with timed("ingestion"):
+            n = run_cpu(IngestFrames, store, index, values)
+    except ValueError as e:
+        return "400 Bad Request: %s" % e
+    return json.dumps({"frames" : n,
+                       "startTime" : index.min().isoformat() if n else None,
+                       "endTime" : index.max().isoformat() if n else None})
+
+@app.route('/cacheStats', methods = ['GET'])
+def api_cache_stats():
+    stats = {"solarPosition" : get_solar_cache().stats(),
+             "response" : get_response_cache().stats()}
+    radiation_backend = get_radiation_backend()
+    if isinstance(radiation_backend, RadiationCache):
+        stats["radiation"] = radiation_backend.stats()
+    return json.dumps(stats)
+
+@app.route('/metrics', methods = ['GET'])
+def api_metrics():
+    # counters and latency histograms in the Prometheus text format
+    caches = {"solarPosition" : get_solar_cache().stats(),
+              "response" : get_response_cache().stats()}
+    radiation_backend = get_radiation_backend()
+    if isinstance(radiation_backend, RadiationCache):
+        caches["radiation"] = radiation_backend.stats()
+    return Response(registry.render() + format_cache_stats(caches),
+                    mimetype = "text/plain; version=0.0.4")
+
+@app.route('/startupReport', methods = ['GET'])
+def api_startup_report():
+    # seconds spent importing and warming up this worker
+    return json.dumps(startup_report())
+
 @app.route('/GetPVProduction', methods = ['POST'])
 def api_json_extract():
     if request.headers['Content-Type'] == 'application/json':
@@ -58,30 +187,336 @@ def api_json_extract():
         orientation = float(input_data['orientation'])
         tilt = float(input_data['tilt'])
         installation_capacity = float(input_data['installationCapacity'])
+        inverter_capacity = float(input_data.get('inverterCapacity', installation_capacity))
+        inverter_name = input_data.get('inverterModel', "default")
+        resolution = input_data.get('resolution', "15min")
+        if resolution not in RESOLUTIONS:
+            return "400 Bad Request: unknown resolution"
+
+        # output format by accepted media type: JSON, newline delimited JSON 
+        # or packed float32 values. Long periods can be streamed as JSON
+        mimetype = request.accept_mimetypes.best_match(["application/json", 
+                                                        "application/x-ndjson", 
+                                                        "application/octet-stream"],
+                                                       "application/json")
+        ndjson = mimetype == "application/x-ndjson"
+        stream = ndjson or (mimetype == "application/json" and bool(input_data.get('stream', False)))
+        if mimetype == "application/octet-stream" and resolution not in INTERVAL_SECONDS:
+            return "400 Bad Request: resolution not available as application/octet-stream"
 
-        # read config file
-        config_file = os.path.join(os.path.dirname(os.path.realpath(__file__)), "config.py")
-        config = dict()
-        execfile(config_file, config)
+        # shared config and radiation backend
+        config, radiation_backend = setup_request()
         pars_grid = config['pars_grid']
+        fill = input_data.get('fill', config.get('gap_fill', "none"))
+        if fill not in FILL_METHODS:
+            return "400 Bad Request: unknown gap filling method"
+        interpolation = input_data.get('interpolation', config.get('interpolation', "nearest"))
+        if interpolation not in INTERPOLATION_METHODS:
+            return "400 Bad Request: unknown interpolation method"
 
         # Calculate gridpoint based on long/lat and grid parameters
-        table_service = TableService(account_name=config['account_name'], 
-                                     account_key=config['account_key'])
-        gridpoint = fnLonLat2GridPoint(pars_grid, geo_long, geo_lat)
-
-        # get radiation from Azure for gridpoint for time interval
-        df = GetRadiationFromAzure(gridpoint, time_begin, time_end, 
-                                   config['storage_name'], table_service)
-            
-        # Calcualte the expected production
-        df = fnGetExpectedProduction(df, geo_long, geo_lat, orientation, tilt, 
-                                     installation_capacity, pars_grid)
+        with timed("grid_lookup"):
+            grid = get_grid()
+            if not grid.contains(geo_long, geo_lat):
+                return "400 Bad Request: location outside of the radiation grid"
+            gridpoint = grid.gridpoint(geo_long, geo_lat)
+
+        inverters = get_inverters()
+        if inverter_name not in inverters:
+            return "400 Bad Request: unknown inverter model"
+        inverter_model = inverters.index(inverter_name)
+
+        # incremental updates: only the slots after the last one the client
+        # received, given as cursor of the previous response or as since
+        incremental = 'cursor' in input_data or 'since' in input_data or bool(input_data.get('incremental', False))
+        since_slot = None
+        if incremental:
+            if resolution != "15min":
+                return "400 Bad Request: incremental updates need resolution 15min"
+            parameters = (gridpoint, orientation, tilt, installation_capacity, 
+                          inverter_capacity, inverter_name, fill)
+            if interpolation != "nearest":
+                parameters += (geo_long, geo_lat, interpolation)
+            last = time_begin - pd.Timedelta(minutes = 15)
+            try:
+                if 'cursor' in input_data:
+                    last = max(last, DecodeCursor(input_data['cursor'], parameters))
+                elif 'since' in input_data:
+                    last = max(last, round_time(pd.to_datetime(input_data['since'], utc=True), 15))
+            except ValueError as e:
+                return "400 Bad Request: %s" % e
+            time_begin = last + pd.Timedelta(minutes = 15)
+            since_slot = last
+
+        # identical requests get the cached response, unless radiation of
+        # the window was written since, see RadiationStore.data_version;
+        # incremental responses carry a cursor, so they are kept apart
+        response_cache = get_response_cache()
+        location = gridpoint if interpolation == "nearest" else (geo_long, geo_lat, interpolation)
+        data_version = None
+        if hasattr(radiation_backend, 'data_version') and time_begin <= time_end:
+            data_version = radiation_backend.data_version(time_begin, time_end)
+        key = response_cache.request_key(time_begin, time_end, location, orientation, 
+                                         tilt, installation_capacity, inverter_capacity,
+                                         inverter_name, resolution, fill, mimetype,
+                                         incremental, since_slot, data_version)
+        if not stream:
+            with timed("response_cache"):
+                output = response_cache.get(key)
+            g.response_cache = "MISS" if output is None else "HIT"
+            if output is not None:
+                return Response(output, mimetype = mimetype)
+
+        if time_begin <= time_end and interpolation != "nearest":
+            # radiation interpolated from the surrounding gridpoints
+            neighbours, weights = grid.neighbours(geo_long, geo_lat, interpolation)
+            index, radiation, columns = GetRadiationBlock(radiation_backend, grid, neighbours, 
+                                                          time_begin, time_end, fill, 
+                                                          config.get('gap_fill_max_slots', 8))
+            with timed("interpolation"):
+                df = pd.DataFrame(dict((name, fnBlendRadiation(radiation[name], columns, weights)[:, 0]) 
+                                       for name in ["diffuse", "downwelling"]), 
+                                  index = index, columns = ["diffuse", "downwelling"])
+        elif time_begin <= time_end:
+            # get radiation for gridpoint for time interval
+            with timed("radiation_fetch"):
+                df = radiation_backend.get_radiation(gridpoint, time_begin, time_end)
+            with timed("gap_filling"):
+                df = FillGaps(df, fill, config.get('gap_fill_max_slots', 8), 
+                              GapFillingZenith(fill, gridpoint, grid, df.index))
+
+        if time_begin <= time_end:
+            # Calcualte the expected production
+            df = run_model(fnGetExpectedProduction, df, geo_long, geo_lat, orientation, tilt, 
+                         installation_capacity, pars_grid, 
+                         gridpoint, get_solar_cache(),
+                         inverter_capacity, inverter_model, inverters, grid)
+        else:
+            # no new slots since the cursor
+            df = pd.DataFrame({"power" : []}, index = pd.DatetimeIndex([], tz = 'UTC'))
+        with timed("resample"):
+            df = Resample(df[["power"]], resolution)
+
+        # the new cursor is the last slot with a value, slots without 
+        # radiation yet are computed again by the next request
+        cursor = None
+        if incremental:
+            valid = np.flatnonzero(pd.notnull(df["power"].values))
+            if len(valid):
+                last = df.index[valid[-1]]
+            cursor = EncodeCursor(last, parameters)
 
         # Convert the resulting dataframe to JSON
-        output =  ConvertToJSON(df)
+        if stream:
+            return Response(ConvertToJSONStream(df, ndjson, resolution = resolution, cursor = cursor), 
+                            mimetype = mimetype)
+        with timed("serialization"):
+            if mimetype == "application/octet-stream":
+                output = run_cpu(ConvertToBinary, df, resolution, cursor)
+            else:
+                output =  run_cpu(ConvertToJSON, df, resolution, cursor)
+        response_cache.put(key, output, time_end)
         
-        return output
+        return Response(output, mimetype = mimetype)
     else:
         return "415 Unsupported Input Media Type: has to be JSON, i.e. Content-Type = application/json"
 
+@app.route('/GetPVProductionBatch', methods = ['POST'])
+def api_json_extract_batch():
+    if request.headers['Content-Type'] == 'application/json':
+        # parse request data, installations may override the time interval
+        input_data = request.json
+        default_begin = input_data.get('dateTimeBegin')
+        default_end = input_data.get('dateTimeEnd')
+        resolution = input_data.get('resolution', "15min")
+        if resolution not in RESOLUTIONS:
+            return "400 Bad Request: unknown resolution"
+
+        # shared config and radiation backend
+        config, radiation_backend = setup_request()
+        solar_cache = get_solar_cache()
+        inverters = get_inverters()
+        fill = input_data.get('fill', config.get('gap_fill', "none"))
+        if fill not in FILL_METHODS:
+            return "400 Bad Request: unknown gap filling method"
+        interpolation = input_data.get('interpolation', config.get('interpolation', "nearest"))
+        if interpolation not in INTERPOLATION_METHODS:
+            return "400 Bad Request: unknown interpolation method"
+
+        # nearest gridpoints of all installations at once
+        installations = input_data['installations']
+        grid = get_grid()
+        longitudes = [float(x['longitude']) for x in installations]
+        latitudes = [float(x['latitude']) for x in installations]
+        gridpoints = grid.gridpoints(longitudes, latitudes, out_of_bounds = 'mask')
+
+        # group installations by gridpoint and time interval, interpolated 
+        # installations by time interval only and share one read of all 
+        # their surrounding gridpoints
+        groups = dict()
+        errors = []
+        for i, installation in enumerate(installations):
+            if gridpoints[i] < 0:
+                errors.append((installation.get('id', i), "location outside of the radiation grid"))
+                continue
+            inverter_name = installation.get('inverterModel', "default")
+            if inverter_name not in inverters:
+                errors.append((installation.get('id', i), "unknown inverter model"))
+                continue
+            installation_capacity = float(installation['installationCapacity'])
+            time_begin = round_time(pd.to_datetime(installation.get('dateTimeBegin', default_begin), utc=True), 15)
+            time_end = round_time(pd.to_datetime(installation.get('dateTimeEnd', default_end), utc=True), 15)
+            key = (gridpoints[i], time_begin, time_end) if interpolation == "nearest" else (time_begin, time_end)
+            groups.setdefault(key, []).append(
+                (installation.get('id', i),
+                 float(installation['orientation']),
+                 float(installation['tilt']),
+                 installation_capacity,
+                 float(installation.get('inverterCapacity', installation_capacity)),
+                 inverters.index(inverter_name),
+                 gridpoints[i], longitudes[i], latitudes[i]))
+
+        def prepare(key):
+            # reads the radiation of a group, returns the arguments of the
+            # model and what the output needs
+            time_begin, time_end = key[-2:]
+            (ids, orientation, tilt, installation_capacity, 
+             inverter_capacity, inverter_model, 
+             group_gridpoints, geo_long, geo_lat) = zip(*groups[key])
+            panels = (np.array(orientation), np.array(tilt), np.array(installation_capacity))
+            inverter = (np.array(inverter_capacity), np.array(inverter_model), inverters)
+
+            if interpolation != "nearest":
+                neighbours, weights = grid.neighbours(geo_long, geo_lat, interpolation)
+                index, radiation, columns = GetRadiationBlock(radiation_backend, grid, neighbours, 
+                                                              time_begin, time_end, fill,
+                                                              config.get('gap_fill_max_slots', 8))
+                args = (index, radiation, columns, weights, np.array(group_gridpoints),
+                        grid) + panels + (solar_cache,) + inverter
+                return args, index, ids, group_gridpoints
+
+            gridpoint = key[0]
+            with timed("radiation_fetch"):
+                df = radiation_backend.get_radiation(gridpoint, time_begin, time_end)
+            with timed("gap_filling"):
+                df = FillGaps(df, fill, config.get('gap_fill_max_slots', 8), 
+                              GapFillingZenith(fill, gridpoint, grid, df.index))
+            geo_long, geo_lat = grid.centre(gridpoint)
+            args = (df, geo_long, geo_lat) + panels + (gridpoint, solar_cache) + inverter
+            return args, df.index, ids, group_gridpoints
+
+        def generate():
+            # one radiation query and one model run per group, one line of
+            # JSON per installation. The groups of a chunk are computed in 
+            # parallel when there is a process pool
+            for installation_id, error in errors:
+                yield json.dumps({"successful" : False,
+                                  "id" : installation_id,
+                                  "error" : error}) + "\n"
+
+            if interpolation == "nearest":
+                function = fnGetExpectedProductionBatch
+            else:
+                function = fnGetExpectedProductionInterpolated
+            keys = sorted(groups)
+            chunk = max(1, config.get('cpu_processes', 0))
+            for begin in range(0, len(keys), chunk):
+                jobs = [prepare(key) for key in keys[begin:begin + chunk]]
+                powers = map_model(function, [job[0] for job in jobs])
+
+                for (args, index, ids, group_gridpoints), power in zip(jobs, powers):
+                    for j, installation_id in enumerate(ids):
+                        output = ConvertToDict(Resample(pd.DataFrame({"power": power[:, j]}, index = index), 
+                                                        resolution), resolution)
+                        output["id"] = installation_id
+                        output["gridpoint"] = int(group_gridpoints[j])
+                        yield json.dumps(output) + "\n"
+
+        return Response(generate(), mimetype = "application/x-ndjson")
+    else:
+        return "415 Unsupported Input Media Type: has to be JSON, i.e. Content-Type = application/json"
+
+@app.route('/GetPVProductionAggregate', methods = ['POST'])
+def api_json_extract_aggregate():
+    if request.headers['Content-Type'] == 'application/json':
+        # parse request data, the installations are given or stored
+        input_data = request.json
+        time_begin = round_time(pd.to_datetime(input_data['dateTimeBegin'], utc=True), 15)
+        time_end = round_time(pd.to_datetime(input_data['dateTimeEnd'], utc=True), 15)
+        resolution = input_data.get('resolution', "15min")
+        if resolution not in RESOLUTIONS:
+            return "400 Bad Request: unknown resolution"
+
+        # shared config and radiation backend
+        config, radiation_backend = setup_request()
+        fill = input_data.get('fill', config.get('gap_fill', "none"))
+        if fill not in FILL_METHODS:
+            return "400 Bad Request: unknown gap filling method"
+        angle_step = float(input_data.get('angleStep', config.get('portfolio_angle_step', 0.0)))
+        if 'portfolioId' in input_data:
+            installations = get_portfolio(input_data['portfolioId'])
+            if installations is None:
+                return "404 Not Found: unknown portfolio"
+        else:
+            installations = input_data['installations']
+        if len(installations) == 0:
+            return "400 Bad Request: no installations"
+
+        # nearest gridpoints of all installations at once, installations 
+        # outside the grid or with unknown inverters are skipped
+        grid = get_grid()
+        inverters = get_inverters()
+        with timed("grid_lookup"):
+            gridpoints = grid.gridpoints([float(x['longitude']) for x in installations],
+                                         [float(x['latitude']) for x in installations],
+                                         out_of_bounds = 'mask')
+        skipped = []
+        valid = []
+        valid_gridpoints = []
+        for i, installation in enumerate(installations):
+            if gridpoints[i] < 0:
+                skipped.append({"id" : installation.get('id', i), 
+                                "error" : "location outside of the radiation grid"})
+            elif installation.get('inverterModel', "default") not in inverters:
+                skipped.append({"id" : installation.get('id', i), 
+                                "error" : "unknown inverter model"})
+            else:
+                valid.append(installation)
+                valid_gridpoints.append(gridpoints[i])
+        if not valid:
+            return "400 Bad Request: no valid installations"
+
+        # installations producing the same power per W of capacity form a 
+        # group, the model runs once per group
+        with timed("grouping"):
+            cells, cell = np.unique(valid_gridpoints, return_inverse = True)
+            installation_capacity = np.array([float(x['installationCapacity']) for x in valid])
+            groups = fnGroupInstallations(cell,
+                                          np.array([float(x['orientation']) for x in valid]),
+                                          np.array([float(x['tilt']) for x in valid]),
+                                          installation_capacity,
+                                          np.array([float(x.get('inverterCapacity', c)) 
+                                                    for x, c in zip(valid, installation_capacity)]),
+                                          np.array([inverters.index(x.get('inverterModel', "default")) 
+                                                    for x in valid]),
+                                          angle_step)
+
+        # radiation of all cells in one read
+        index, radiation, columns = GetRadiationBlock(radiation_backend, grid, cells[:, np.newaxis], 
+                                                      time_begin, time_end, fill,
+                                                      config.get('gap_fill_max_slots', 8))
+        power = run_model(fnGetPortfolioProduction, index, radiation, cells, groups,
+                          grid, get_solar_cache(), inverters)
+
+        with timed("serialization"):
+            df = Resample(pd.DataFrame({"power" : power.sum(axis = 1)}, index = index), resolution)
+            output = ConvertToDict(df, resolution)
+            output["installationCount"] = len(valid)
+            output["cellCount"] = len(cells)
+            output["groupCount"] = len(groups["cell"])
+            output["skipped"] = skipped
+            output = json.dumps(output)
+
+        return Response(output, mimetype = "application/json")
+    else:
+        return "415 Unsupported Input Media Type: has to be JSON, i.e. Content-Type = application/json"
@@ -0,0 +1,290 @@
+"""
+Offline recomputation of the expected production of many installations over
+their whole history, e.g. after a change of the performance ratio, see
+backfill.py next to runserver.py.
+
+The work is split in tasks of one month and a chunk of cells: the radiation
+of the cells is read from the radiation store in one block, the model runs
+on all installations of the chunk at once (fnGetExpectedProductionMatrix)
+and the result is written to its own file
+
+    <output>/month=YYYY-MM/cells-<first>-<last>.csv (or .parquet)
+
+with the columns id, timestamp (UTC, without time zone in parquet) and
+power (W), slots without radiation are left out. Files are written under a
+temporary name and renamed when complete, so a task is done exactly when its
+file exists and an interrupted run continues with the missing files. The
+parameters of a run are kept in <output>/_backfill.json, a run with other
+parameters needs another output.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from grid import Grid
+from helper_functions import SLOTS_PER_DAY
+from model import fnGetExpectedProductionMatrix, fnSolarPositionBlock
+from radiation_store import RadiationStore
+from solar_position import SolarPositionCache, SolarTable
+
+MANIFEST = "_backfill.json"
+SLOTS_PER_YEAR = 365.25 * SLOTS_PER_DAY
+
+# the state of a worker process, see InitWorker
+_worker = dict()
+
+def OutputFormat(requested = "csv"):
+    """ returns the output format, csv or parquet, parquet only when asked
+    for as it needs pyarrow
+
+    @raises: ValueError: for parquet without pyarrow or another format
+    """
+    if requested == "parquet":
+        try:
+            import pyarrow.parquet
+        except ImportError:
+            raise ValueError("parquet output needs pyarrow")
+    elif requested != "csv":
+        raise ValueError("unknown output format %s" % requested)
+    return requested
+
+def ReadInstallations(csv_file, grid, inverters):
+    """ reads installations from a csv file with the columns of the batch
+    API: id, longitude, latitude, orientation, tilt, installationCapacity
+    and optional inverterCapacity and inverterModel
+    @param csv_file: str: path of the csv file, separated by , or ;
+    @param grid: Grid
+    @param inverters: InverterRegistry
+
+    @returns: dict of np arrays (installation): 'id', 'gridpoint',
+              'orientation', 'tilt', 'installation_capacity',
+              'inverter_capacity', 'inverter_model', and a list of
+              (id, error) of the installations left out
+    """
+    df = pd.read_csv(csv_file, sep = None, engine = 'python')
+    if "id" not in df.columns:
+        df["id"] = np.arange(len(df))
+    if "inverterCapacity" not in df.columns:
+        df["inverterCapacity"] = np.nan
+    if "inverterModel" not in df.columns:
+        df["inverterModel"] = "default"
+    df["inverterCapacity"] = df.inverterCapacity.fillna(df.installationCapacity)
+    df["inverterModel"] = df.inverterModel.fillna("default").astype(str)
+
+    gridpoints = grid.gridpoints(df.longitude.values, df.latitude.values, out_of_bounds = 'mask')
+    known = df.inverterModel.map(lambda name: name in inverters).values.astype(bool)
+    valid = (gridpoints >= 0) & known
+    skipped = [(installation_id, "location outside of the radiation grid")
+               for installation_id in df.id.values[gridpoints < 0]]
+    skipped += [(installation_id, "unknown inverter model")
+                for installation_id in df.id.values[(gridpoints >= 0) & ~known]]
+
+    df = df[valid]
+    return {"id" : df.id.values,
+            "gridpoint" : gridpoints[valid],
+            "orientation" : df.orientation.values.astype(float),
+            "tilt" : df.tilt.values.astype(float),
+            "installation_capacity" : df.installationCapacity.values.astype(float),
+            "inverter_capacity" : df.inverterCapacity.values.astype(float),
+            "inverter_model" : np.array([inverters.index(name) for name in df.inverterModel],
+                                        dtype=int)}, skipped
+
+def Months(date_begin, date_end):
+    """ returns the months from date_begin to date_end (inclusive)
+
+    @returns: list of (str YYYY-MM, pd datetime: first slot, pd datetime:
+              last slot), the first and last month cut to the period
+    """
+    begin = pd.Timestamp(date_begin).tz_localize('UTC').normalize()
+    end = pd.Timestamp(date_end).tz_localize('UTC').normalize() + pd.Timedelta(days = 1)
+    months = []
+    month = begin.replace(day = 1)
+    while month < end:
+        following = (month + pd.Timedelta(days = 32)).replace(day = 1)
+        months.append((month.strftime("%Y-%m"), max(month, begin),
+                       min(following, end) - pd.Timedelta(minutes = 15)))
+        month = following
+    return months
+
+def CellChunks(gridpoints, cells_per_task):
+    """ returns the cells with installations in chunks of cells_per_task
+    cells, in gridpoint order, so the chunks of a set of installations are
+    always the same
+    """
+    cells = np.unique(gridpoints)
+    return [cells[i:i + cells_per_task] for i in range(0, len(cells), cells_per_task)]
+
+def TaskPath(output, month, cells, output_format):
+    """ returns the file of the task of a month and a chunk of cells """
+    return os.path.join(output, "month=%s" % month,
+                        "cells-%05d-%05d.%s" % (cells[0], cells[-1], output_format))
+
+def CheckManifest(output, parameters):
+    """ writes the parameters of the run to the output directory, or checks
+    that they are those of the run that wrote it before
+
+    @raises ValueError: when the output was written with other parameters
+    """
+    path = os.path.join(output, MANIFEST)
+    parameters = json.loads(json.dumps(parameters))
+    if os.path.exists(path):
+        with open(path) as f:
+            written = json.load(f)
+        changed = sorted(key for key in parameters if written.get(key) != parameters[key])
+        if changed:
+            raise ValueError("%s was written with other %s, use another output directory"
+                             % (output, ", ".join(changed)))
+        return
+    if not os.path.isdir(output):
+        os.makedirs(output)
+    with open(path, "w") as f:
+        json.dump(parameters, f, indent = 2, sort_keys = True)
+
+def FileHash(path):
+    """ returns the sha1 of the content of a file """
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+def InitWorker(store_path, solar_table_path, pars_grid, inverters):
+    """ opens the radiation store and the solar table in a worker process """
+    n_gridpoints = pars_grid["N_width"] * pars_grid["N_height"]
+    table = SolarTable(solar_table_path, n_gridpoints) if solar_table_path else None
+    _worker["store"] = RadiationStore(store_path, n_gridpoints)
+    # tasks do not share (gridpoint, day) entries, nothing needs keeping
+    _worker["solar_cache"] = SolarPositionCache(1, table)
+    _worker["grid"] = Grid(pars_grid)
+    _worker["inverters"] = inverters
+
+def ComputeTask(args):
+    """ computes the production of a chunk of cells for a month and writes
+    its file, in a worker process, see InitWorker
+
+    @returns: tuple: number of installations, number of slots, number of
+              rows written
+    """
+    (path, output_format, month_begin, month_end, cells, installations,
+     performance_ratio, max_values) = args
+    store = _worker["store"]
+
+    index, radiation = store.get_radiation_block(cells, month_begin, month_end)
+    zenith, azimuth = fnSolarPositionBlock(index, cells, _worker["grid"],
+                                           _worker["solar_cache"])
+    columns = dict(installations)
+    columns["cell"] = np.searchsorted(cells, installations["gridpoint"])
+
+    # blocks of installations, so memory does not grow with the chunk
+    n = len(columns["cell"])
+    step = int(max(1, max_values // max(len(index), 1)))
+    # timestamps per slot, formatted once for csv, formatting every row
+    # takes longer than the model, vectorized like FormatTimestamps
+    timestamps = index.asi8.view("datetime64[ns]")
+    if output_format == "csv":
+        timestamps = np.datetime_as_string(timestamps, unit = 's', timezone = 'UTC').astype(object)
+    frames = []
+    for begin in range(0, n, step):
+        part = dict((name, values[begin:begin + step]) for name, values in columns.items())
+        power = fnGetExpectedProductionMatrix(radiation["downwelling"], radiation["diffuse"],
+                                              zenith, azimuth, part, performance_ratio,
+                                              _worker["inverters"])
+        slot, installation = np.nonzero(~np.isnan(power))
+        frames.append(pd.DataFrame({"id" : part["id"][installation],
+                                    "timestamp" : timestamps[slot],
+                                    "power" : power[slot, installation]},
+                                   columns = ["id", "timestamp", "power"]))
+    df = pd.concat(frames, ignore_index = True) if frames else \
+         pd.DataFrame(columns = ["id", "timestamp", "power"])
+
+    WriteAtomic(df, path, output_format)
+    return n, len(index), len(df)
+
+def WriteAtomic(df, path, output_format):
+    """ writes df to path under a temporary name first, so path only exists
+    when it is complete
+    """
+    if not os.path.isdir(os.path.dirname(path)):
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError:
+            # made by another worker meanwhile
+            if not os.path.isdir(os.path.dirname(path)):
+                raise
+    temporary = "%s.%d.tmp" % (path, os.getpid())
+    if output_format == "parquet":
+        import pyarrow
+        import pyarrow.parquet
+        pyarrow.parquet.write_table(pyarrow.Table.from_pandas(df, preserve_index = False), temporary)
+    else:
+        df.to_csv(temporary, index = False)
+    os.rename(temporary, path)
+
+def Backfill(installations, output, store_path, solar_table_path, pars_grid,
+             inverters, date_begin, date_end, pool, output_format = "csv",
+             cells_per_task = 50, performance_ratio = 0.78, max_values = 1e7,
+             progress = None):
+    """ computes the production of installations from date_begin to
+    date_end into output, the tasks whose file exists are skipped
+    @param installations: dict of np arrays, see ReadInstallations
+    @param output: str: output directory
+    @param store_path: str: directory of the radiation store
+    @param solar_table_path: str: directory of the solar tables, optional
+    @param pars_grid: dict: grid parameters
+    @param inverters: InverterRegistry
+    @param date_begin, date_end: date: first and last day
+    @param pool: multiprocessing.Pool made with initializer InitWorker, or
+                 None to compute in this process
+    @param output_format: str: parquet or csv
+    @param cells_per_task: int: cells computed together
+    @param performance_ratio: float: see fnGTI2DC
+    @param max_values: float: largest block [time x installation] computed
+                       at once
+    @param progress: function called with a dict of the progress after
+                     every task, optional
+
+    @returns: dict: tasks, tasks skipped, installation years computed,
+              rows written and seconds
+    """
+    by_cell = np.argsort(installations["gridpoint"], kind = 'mergesort')
+    sorted_gridpoints = installations["gridpoint"][by_cell]
+    tasks = []
+    skipped = 0
+    for month, month_begin, month_end in Months(date_begin, date_end):
+        for cells in CellChunks(installations["gridpoint"], cells_per_task):
+            path = TaskPath(output, month, cells, output_format)
+            if os.path.exists(path):
+                skipped += 1
+                continue
+            rows = by_cell[np.searchsorted(sorted_gridpoints, cells[0]):
+                           np.searchsorted(sorted_gridpoints, cells[-1], side = 'right')]
+            tasks.append((path, output_format, month_begin, month_end, cells,
+                          dict((name, values[rows]) for name, values in installations.items()),
+                          performance_ratio, max_values))
+
+    if pool is None:
+        InitWorker(store_path, solar_table_path, pars_grid, inverters)
+        results = (ComputeTask(task) for task in tasks)
+    else:
+        results = pool.imap_unordered(ComputeTask, tasks)
+
+    start = time.time()
+    status = {"tasks" : len(tasks) + skipped, "skipped" : skipped, "done" : 0,
+              "installation_years" : 0.0, "rows" : 0, "seconds" : 0.0}
+    for n, n_slots, n_rows in results:
+        status["done"] += 1
+        status["installation_years"] += n * n_slots / SLOTS_PER_YEAR
+        status["rows"] += n_rows
+        status["seconds"] = time.time() - start
+        if progress is not None:
+            progress(status)
+    return status
+
+def InstallationYearsPerMinute(status):
+    """ returns the throughput of a Backfill status """
+    return status["installation_years"] * 60.0 / max(status["seconds"], 1e-9)
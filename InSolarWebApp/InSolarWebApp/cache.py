@@ -0,0 +1,137 @@
+import threading
+import time
+from collections import OrderedDict
+
+class LRUCache(object):
+    """ bounded, thread safe key/value store that evicts the least recently 
+    used entry when full, and counts hits and misses
+    - entries can have an expiry time, expired entries count as a miss
+    - with max_bytes, entries are put with their size and the summed size is
+      bounded too, an entry larger than max_bytes is not stored
+    """
+
+    def __init__(self, max_size, max_bytes = None):
+        """
+        @param max_size: int: maximum number of entries
+        @param max_bytes: int: maximum summed size of the entries, optional
+        """
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default = None):
+        """ returns the value for key, or default when not cached """
+        with self._lock:
+            try:
+                value, expires, size = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires is not None and expires <= time.time():
+                self.bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries[key] = (value, expires, size)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, ttl = None, size = 0):
+        """ stores value for key, evicting the oldest entries when full
+        @param ttl: float: seconds until the entry expires, None never
+        @param size: int: size of value in bytes, counted against max_bytes
+        """
+        expires = None if ttl is None else time.time() + ttl
+        with self._lock:
+            self._remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._entries[key] = (value, expires, size)
+            self.bytes += size
+            while len(self._entries) > self.max_size or \
+                  (self.max_bytes is not None and self.bytes > self.max_bytes):
+                self.bytes -= self._entries.popitem(last = False)[1][2]
+                self.evictions += 1
+
+    def delete(self, key):
+        """ removes key, if cached """
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """ returns dict with size and hit/miss counters """
+        with self._lock:
+            return {"size" : len(self._entries),
+                    "maxSize" : self.max_size,
+                    "bytes" : self.bytes,
+                    "hits" : self.hits,
+                    "misses" : self.misses,
+                    "evictions" : self.evictions,
+                    "expirations" : self.expirations}
+
+class ResponseCache(object):
+    """ caches responses by normalized request
+    - a response for a time window that ended more than final_after seconds 
+      ago does not change anymore and is kept until evicted
+    - other responses, e.g. for windows overlapping now, expire after 
+      ttl seconds as new radiation may still arrive
+    - the cache is bounded by the number of responses and by the summed
+      length of their bodies, so a few responses of long windows cannot
+      take all memory
+    """
+
+    def __init__(self, max_size = 10000, ttl = 60, final_after = 86400,
+                 max_bytes = 64 * 2**20):
+        """
+        @param max_size: int: maximum number of responses
+        @param ttl: float: seconds a response of a recent window is valid
+        @param final_after: float: seconds after which a window is final
+        @param max_bytes: int: maximum summed length of the bodies, None for
+                          no limit
+        """
+        self.cache = LRUCache(max_size, max_bytes)
+        self.ttl = ttl
+        self.final_after = final_after
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def put(self, key, response, time_end):
+        """
+        @param key: tuple: normalized request, see request_key
+        @param response: str: the body of the response to cache
+        @param time_end: pd datetime: end of the requested window (UTC)
+        """
+        final = (time.time() - time_end.value / 1e9) > self.final_after
+        self.cache.put(key, response, None if final else self.ttl, len(response))
+
+    def stats(self):
+        return self.cache.stats()
+
+    @staticmethod
+    def request_key(*parts):
+        """ returns a hashable key, timestamps by their value in ns """
+        return tuple(getattr(part, 'value', part) for part in parts)
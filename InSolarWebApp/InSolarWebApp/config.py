@@ -3,6 +3,36 @@ account_name = 'xxx'
 storage_name = 'xxx' 
 account_key  = 'xxx'
 
+# radiation backend: 'azure' table storage or 'local' radiation store, 
+# see import_radiation.py. A relative store path is taken from this directory
+radiation_backend = 'azure'
+radiation_store_path = 'radiation_store'
+# accept new radiation frames at /ingestRadiation into the local store, see
+# ingestion.py
+radiation_ingestion = False
+
+# maximum number of parallel Azure queries per request, 1 queries in sequence
+# like before, e.g. 8 splits a request in sub-ranges queried in parallel
+azure_query_workers = 1
+
+# number of (gridpoint, day) entries in the solar position cache
+solar_cache_size = 50000
+# precomputed solar geometry per year, written by precompute_solar.py, days
+# that are not in it are computed
+solar_table_path = 'solar_tables'
+
+# number of (gridpoint, day) entries in the radiation cache, 0 disables it
+radiation_cache_size = 50000
+
+# GetPVProduction responses: number cached, summed bytes of their bodies,
+# seconds a response is valid while its window is recent, seconds after which
+# a window is final and kept. The radiation cache uses the same times for its
+# days
+response_cache_size = 10000
+response_cache_bytes = 64 * 2**20
+response_cache_ttl = 60
+response_cache_final_after = 86400
+
 # grid parameters
 pars_grid = {
     "glong_min" : 2.45 , 
@@ -12,3 +42,40 @@ pars_grid = {
     "N_width" : 100, 
     "N_height" : 80  
 }
+
+# inverter efficiency curves that requests can select with inverterModel, 
+# besides "default", e.g. {"name": {"load": [0, ..., 1], "efficiency": [...]}}
+inverter_models = {}
+
+# add a Server-Timing header with the duration of the stages of a request
+server_timing = False
+
+# threads for the model and the serialization in the gevent server, see 
+# serve_async.py
+cpu_workers = 4
+
+# filling of short gaps in the radiation: "none", "interpolate" or 
+# "clearsky", requests can choose with fill. Gaps longer than 
+# gap_fill_max_slots 15-minute slots stay missing
+gap_fill = "none"
+gap_fill_max_slots = 8
+
+# warm_up before serving (see startup.py): days of solar position up to today
+# read from the solar tables for all gridpoints
+warm_up_solar_days = 2
+
+# radiation of an installation: "nearest" gridpoint, or interpolated from the 
+# 4 surrounding gridpoints, "bilinear" or "idw", requests can choose with 
+# interpolation
+interpolation = "nearest"
+
+# /GetPVProductionAggregate: stored portfolios, <id>.json files in this 
+# directory, and the step in degrees in which panel angles are grouped, 0 
+# for exact angles, e.g. 1.0 groups more installations at a small error
+portfolio_path = 'portfolios'
+portfolio_angle_step = 0.0
+
+# worker processes for the model, 0 computes it in the threads of the server.
+# Threads share one core for the model, processes use one core each, see 
+# executor.py
+cpu_processes = 0
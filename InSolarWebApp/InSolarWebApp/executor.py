@@ -0,0 +1,182 @@
+"""
+Runs CPU heavy work, like the model and the serialization, outside the
+thread that serves the request, and concurrent I/O, like the Azure queries
+of one request.
+
+Under the gevent server (serve_async.py) all requests are greenlets in one
+thread, so a request running the model would stop the Azure queries of all
+others. There set_pool installs a pool of native threads for run_cpu, the
+greenlet of the request waits without blocking the others, and
+set_io_pool lets map_io use greenlets instead of threads.
+Without pools, e.g. in the development server, run_cpu calls directly and
+map_io uses threads.
+
+Threads share the GIL, so the model uses one core however many threads
+there are. With set_process_pool, run_model and map_model compute the model
+in worker processes, the arrays of the arguments and results pass through
+shared memory, see shared_arrays.py. Other work, like the serialization,
+stays with run_cpu.
+"""
+
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+_pool = None
+_io_pool = None
+_process_pool = None
+
+def set_pool(pool):
+    """ installs the pool of run_cpu, with an apply method like
+    gevent.threadpool.ThreadPool, None to call directly
+    """
+    global _pool
+    _pool = pool
+
+def set_io_pool(io_pool):
+    """ installs the pools of map_io: a function returning a pool with a map
+    method for a maximum number of workers, like gevent.pool.Pool, None for
+    threads
+    """
+    global _io_pool
+    _io_pool = io_pool
+
+def set_process_pool(process_pool):
+    """ installs the ProcessPool of run_model and map_model, None to compute
+    with run_cpu
+    """
+    global _process_pool
+    _process_pool = process_pool
+
+def run_cpu(function, *args, **kwargs):
+    """ returns function(*args, **kwargs), computed in the pool if there is
+    one, the stage timings are recorded for the calling request
+    """
+    pool = _pool
+    if pool is None:
+        return function(*args, **kwargs)
+
+    from metrics import get_timings, set_timings
+    timings = get_timings()
+    def call():
+        set_timings(timings)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            set_timings(None)
+    return pool.apply(call)
+
+def map_io(function, items, max_workers):
+    """ returns [function(item) for item in items], at most max_workers
+    running at once
+    """
+    if _io_pool is not None:
+        return list(_io_pool(max_workers).map(function, items))
+
+    with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        return list(executor.map(function, items))
+
+def run_model(function, *args, **kwargs):
+    """ returns function(*args, **kwargs) like run_cpu, computed in the
+    process pool if there is one, function has to be a module level function
+    """
+    process_pool = _process_pool
+    if process_pool is None:
+        return run_cpu(function, *args, **kwargs)
+    return run_cpu(process_pool.apply, function, args, kwargs)
+
+def map_model(function, calls):
+    """ returns [function(*args) for args in calls], in parallel in the 
+    process pool if there is one, otherwise in sequence with run_cpu
+    """
+    process_pool = _process_pool
+    if process_pool is None:
+        return [run_cpu(function, *args) for args in calls]
+    return run_cpu(process_pool.map, function, calls)
+
+class _ProcessResource(object):
+    """ stands for a resource of the application that is not passed to 
+    worker processes, the worker uses its own, e.g. the solar cache
+    """
+
+    def __init__(self, getter):
+        self.getter = getter
+
+    def get(self):
+        import resources
+        return getattr(resources, self.getter)()
+
+def _portable(value):
+    from solar_position import SolarPositionCache
+    if isinstance(value, SolarPositionCache):
+        return _ProcessResource("get_solar_cache")
+    return value
+
+def _resolve(value):
+    return value.get() if isinstance(value, _ProcessResource) else value
+
+def _call_in_worker(function, args, kwargs):
+    from metrics import start_timings, stop_timings
+    from shared_arrays import share, unshare
+    args = [_resolve(value) for value in unshare(args)]
+    kwargs = dict((key, _resolve(value)) for key, value in unshare(kwargs).items())
+    start_timings()
+    try:
+        result = function(*args, **kwargs)
+    finally:
+        timings = stop_timings()
+    return share(result), timings
+
+class ProcessPool(object):
+    """ worker processes computing model functions, see run_model
+    - numpy arrays and dataframes of the arguments and results pass through 
+      shared memory, the other arguments are pickled
+    - the solar position cache is not passed, every worker has its own
+    - the stage timings of the workers are recorded for the request
+    """
+
+    def __init__(self, processes):
+        self.processes = processes
+        self._pool = multiprocessing.Pool(processes)
+
+    def apply(self, function, args = (), kwargs = None):
+        """ returns function(*args, **kwargs) computed in a worker """
+        return self.map(function, [args], [kwargs or {}])[0]
+
+    def map(self, function, calls, kwargs = None):
+        """ returns [function(*args) for args in calls] computed in the 
+        workers in parallel
+        """
+        from metrics import observe_stage
+        from shared_arrays import share, unshare, release
+
+        kwargs = kwargs or [{}] * len(calls)
+        shared = [(share([_portable(value) for value in args]), 
+                   share(dict((key, _portable(value)) for key, value in call_kwargs.items())))
+                  for args, call_kwargs in zip(calls, kwargs)]
+        outputs = []
+        error = None
+        try:
+            pending = [self._pool.apply_async(_call_in_worker, (function, args, call_kwargs))
+                       for args, call_kwargs in shared]
+            for result in pending:
+                try:
+                    outputs.append(result.get())
+                except Exception as e:
+                    error = error or e
+        finally:
+            release(shared)
+        if error is not None:
+            release([result for result, timings in outputs])
+            raise error
+
+        results = []
+        for result, timings in outputs:
+            for stage, seconds in timings:
+                observe_stage(stage, seconds)
+            results.append(unshare(result, copy = True))
+            release(result)
+        return results
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
@@ -0,0 +1,138 @@
+import bisect
+import re
+import threading
+import time
+
+import pandas as pd
+
+class FakeEntity(object):
+    """ table entity with its properties as attributes """
+
+    def __init__(self, **properties):
+        self.__dict__.update(properties)
+
+class FakeQueryResult(list):
+    """ list of entities, with x_ms_continuation when more entities follow """
+    pass
+
+class FakeTableService(object):
+    """ in-process stand-in for azure TableService, for testing and
+    benchmarking the radiation queries without network access
+    - supports query_entities with PartitionKey comparisons joined by 'and',
+      top and continuation tokens, get_entity and insert_entity
+    - latency: seconds every call sleeps, to mimic a round trip
+    """
+
+    _condition = re.compile(r"(PartitionKey|RowKey)\s+(eq|ne|gt|ge|lt|le)\s+'([^']*)'")
+
+    def __init__(self, latency = 0.0):
+        self.latency = latency
+        self.n_queries = 0
+        self._keys = []
+        self._entities = []
+        self._lock = threading.Lock()
+
+    def insert_entity(self, table_name, entity):
+        """ inserts an entity, given as dict or object with PartitionKey and RowKey """
+        if isinstance(entity, dict):
+            entity = FakeEntity(**entity)
+        key = (entity.PartitionKey, entity.RowKey)
+        with self._lock:
+            i = bisect.bisect_left(self._keys, key)
+            if i < len(self._keys) and self._keys[i] == key:
+                raise ValueError("entity already exists: %s %s" % key)
+            self._keys.insert(i, key)
+            self._entities.insert(i, entity)
+
+    def get_entity(self, table_name, partition_key, row_key, select = ''):
+        self._wait()
+        key = (partition_key, row_key)
+        i = bisect.bisect_left(self._keys, key)
+        if i == len(self._keys) or self._keys[i] != key:
+            raise KeyError("entity not found: %s %s" % key)
+        return self._entities[i]
+
+    def query_entities(self, table_name, filter = None, select = None, top = None,
+                       next_partition_key = None, next_row_key = None):
+        self._wait()
+        conditions = self._condition.findall(filter or "")
+
+        # start at the continuation token or the lower PartitionKey bound
+        start = (next_partition_key, next_row_key or "") if next_partition_key else None
+        for name, operator, value in conditions:
+            if name == "PartitionKey" and operator in ("ge", "gt", "eq"):
+                start = max(start, (value, "")) if start else (value, "")
+        i = bisect.bisect_left(self._keys, start) if start else 0
+
+        result = FakeQueryResult()
+        while i < len(self._keys):
+            key = self._keys[i]
+            if self._stop(key, conditions):
+                break
+            if self._match(key, conditions):
+                if top is not None and len(result) == top:
+                    result.x_ms_continuation = {"nextpartitionkey" : key[0],
+                                                "nextrowkey" : key[1]}
+                    break
+                result.append(self._entities[i])
+            i += 1
+
+        return result
+
+    def _wait(self):
+        with self._lock:
+            self.n_queries += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    @staticmethod
+    def _match(key, conditions):
+        for name, operator, value in conditions:
+            actual = key[0] if name == "PartitionKey" else key[1]
+            if not {"eq" : actual == value, "ne" : actual != value,
+                    "gt" : actual > value, "ge" : actual >= value,
+                    "lt" : actual < value, "le" : actual <= value}[operator]:
+                return False
+        return True
+
+    @staticmethod
+    def _stop(key, conditions):
+        """ keys are sorted, so stop once past the upper PartitionKey bound """
+        for name, operator, value in conditions:
+            if name != "PartitionKey":
+                continue
+            if (operator == "lt" and key[0] >= value) or \
+               (operator in ("le", "eq") and key[0] > value):
+                return True
+        return False
+
+def LoadFakeTableService(csv_file, gridpoints, latency = 0.0, repeat = 1):
+    """ returns a FakeTableService with the radiation of a MeteoSat csv file,
+    like MeteoSat_29696.csv, copied to every gridpoint
+    @param csv_file: str: csv with columns datetime, diffuse, downwelling
+    @param gridpoints: list: gridpoints to fill
+    @param latency: float: seconds every call sleeps
+    @param repeat: int: the csv is copied repeat times back to back, each 
+                   copy shifted by the whole days the csv spans, to fill 
+                   longer periods
+    """
+    df = pd.read_csv(csv_file)
+    times = pd.DatetimeIndex(pd.to_datetime(df.datetime))
+    days = (times[-1].normalize() - times[0].normalize()).days + 1
+    row_keys = []
+    for copy in range(repeat):
+        shifted = times + pd.Timedelta(days = copy * days)
+        row_keys.extend([x.strftime("%Y%m%d_%H%M%S") for x in shifted])
+    df = pd.concat([df] * repeat)
+
+    table_service = FakeTableService(latency)
+    for gridpoint in gridpoints:
+        for row_key, diffuse, downwelling in zip(row_keys, df.diffuse, df.downwelling):
+            table_service.insert_entity(None, {
+                "PartitionKey" : "%06d_%s" % (gridpoint, row_key[:8]),
+                "RowKey" : row_key,
+                "diffuse" : diffuse,
+                "downwelling" : downwelling,
+                "extrapolated" : 0})
+
+    return table_service
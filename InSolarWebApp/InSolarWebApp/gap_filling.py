@@ -0,0 +1,87 @@
+import numpy as np
+
+# gap filling methods of the radiation, see FillGaps
+FILL_METHODS = ("none", "interpolate", "clearsky")
+
+# clear sky GHI in W/m2 below which a slot is not used as reference for the
+# clear sky index, around sunrise and sunset the index is unstable
+CLEARSKY_MIN = 20.0
+
+def fnClearSkyGHI(zenith):
+    """ returns the Haurwitz clear sky global horizontal irradiance, from
+    the zenith of the solar position cache or its solar tables
+    @param zenith: np array: solar zenith in degrees
+
+    @returns: np array: GHI in W/m2, 0 below the horizon
+    """
+    cos_zenith = np.cos(np.radians(zenith))
+    ghi = np.zeros(np.shape(zenith))
+    up = cos_zenith > 0
+    ghi[up] = 1098.0 * cos_zenith[up] * np.exp(-0.059 / cos_zenith[up])
+    return ghi
+
+def fnGaps(missing, max_gap):
+    """ returns the slots of interior gaps of at most max_gap slots, gaps at
+    the start or end of the period have no value on one side and stay missing
+    @param missing: np array of bool: slots without value
+    @param max_gap: int: longest gap in slots that is filled
+
+    @returns: np array of bool: slots to fill
+    """
+    edges = np.diff(np.concatenate(([0], missing.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    keep = (ends - starts <= max_gap) & (starts > 0) & (ends < len(missing))
+
+    # mark the runs with a cumulative sum of +1 at the start, -1 at the end
+    marks = np.zeros(len(missing) + 1, dtype = np.int32)
+    marks[starts[keep]] += 1
+    marks[ends[keep]] -= 1
+    return np.cumsum(marks[:-1]) > 0
+
+def FillGaps(df, method, max_gap, zenith = None):
+    """ fills short gaps in the radiation, slots without value are NaN
+    - interpolate: linear in time between the values around the gap
+    - clearsky: the clear sky index (radiation / clear sky GHI) is
+      interpolated and scaled with the clear sky GHI of the gap, which
+      follows the course of the sun over longer gaps
+    @param df: pd dataframe: with columns diffuse and downwelling, on the
+               15-minute grid
+    @param method: str: one of FILL_METHODS
+    @param max_gap: int: longest gap in slots that is filled
+    @param zenith: np array: solar zenith of every slot, needed by clearsky
+
+    @returns: pd dataframe: df with filled gaps, df itself if nothing is filled
+    """
+    if method == "none" or len(df) == 0:
+        return df
+    if method not in FILL_METHODS:
+        raise ValueError("unknown gap filling method: %s" % method)
+
+    values = df[["diffuse", "downwelling"]].values
+    missing = np.isnan(values)
+    if not missing.any():
+        return df
+
+    x = np.arange(len(df))
+    if method == "clearsky":
+        clearsky = fnClearSkyGHI(zenith)
+        reference = clearsky > CLEARSKY_MIN
+
+    df = df.copy()
+    for j, column in enumerate(["diffuse", "downwelling"]):
+        fill = fnGaps(missing[:, j], max_gap)
+        if not fill.any():
+            continue
+        filled = values[:, j].copy()
+        valid = ~missing[:, j]
+        if method == "interpolate":
+            filled[fill] = np.interp(x[fill], x[valid], values[valid, j])
+        else:
+            valid &= reference
+            if not valid.any():
+                continue
+            index = values[valid, j] / clearsky[valid]
+            filled[fill] = np.interp(x[fill], x[valid], index) * clearsky[fill]
+        df[column] = filled
+    return df
@@ -0,0 +1,172 @@
+import numpy as np
+
+# radiation of an installation: that of the nearest gridpoint, or interpolated
+# from the 4 surrounding gridpoints, see Grid.neighbours
+INTERPOLATION_METHODS = ("nearest", "bilinear", "idw")
+
+class Grid(object):
+    """ the regular longitude/latitude grid of the MeteoSat radiation
+    - gridpoints are numbered along longitude first: row * N_width + column,
+      with row 0 at glat_min and column 0 at glong_min
+    - the nearest gridpoint is found by arithmetic on the cell size, it is
+      the same gridpoint as the minimum Manhattan city block distance (d1)
+      to the gridpoint centres, ties go to the lower index
+    - locations on a cell edge are decided among the neighbouring centres
+      with the same floating point distances as the full city block search
+    """
+
+    def __init__(self, pars_grid):
+        """
+        @param pars_grid: dict: grid parameters, see config.py
+        """
+        self.glong_min = float(pars_grid["glong_min"])
+        self.glong_max = float(pars_grid["glong_max"])
+        self.glat_min = float(pars_grid["glat_min"])
+        self.glat_max = float(pars_grid["glat_max"])
+        self.N_width = int(pars_grid["N_width"])
+        self.N_height = int(pars_grid["N_height"])
+        self.n_gridpoints = self.N_width * self.N_height
+
+        self.dlong = (self.glong_max - self.glong_min) / self.N_width
+        self.dlat = (self.glat_max - self.glat_min) / self.N_height
+
+        self.long_centres = np.linspace(self.glong_min + 0.5*self.dlong,
+                                        self.glong_max - 0.5*self.dlong,
+                                        self.N_width)
+        self.lat_centres = np.linspace(self.glat_min + 0.5*self.dlat,
+                                       self.glat_max - 0.5*self.dlat,
+                                       self.N_height)
+
+    def contains(self, geo_long, geo_lat):
+        """ returns True for locations within the grid box (bool or array) """
+        geo_long = np.asarray(geo_long, dtype=float)
+        geo_lat = np.asarray(geo_lat, dtype=float)
+        return (geo_long >= self.glong_min) & (geo_long <= self.glong_max) & \
+               (geo_lat >= self.glat_min) & (geo_lat <= self.glat_max)
+
+    def gridpoints(self, geo_long, geo_lat, out_of_bounds = 'clip'):
+        """ returns the nearest gridpoint of every location
+        @param geo_long, geo_lat: np array: locations
+        @param out_of_bounds: str: what to do with locations outside the
+                              grid box: 'clip' to the nearest gridpoint on the
+                              edge, 'mask' as -1 or 'raise' a ValueError
+
+        @returns: np array of int: gridpoints
+        """
+        geo_long = np.atleast_1d(np.asarray(geo_long, dtype=float))
+        geo_lat = np.atleast_1d(np.asarray(geo_lat, dtype=float))
+        if not (np.isfinite(geo_long).all() and np.isfinite(geo_lat).all()):
+            raise ValueError("location is not a number")
+
+        # nearest centre along each axis, rounding half down
+        column = np.ceil((geo_long - self.glong_min) / self.dlong - 1.0)
+        row = np.ceil((geo_lat - self.glat_min) / self.dlat - 1.0)
+        column = np.clip(column, 0, self.N_width - 1).astype(int)
+        row = np.clip(row, 0, self.N_height - 1).astype(int)
+
+        # city block distance to the 3 x 3 neighbouring centres, the first
+        # minimum in gridpoint order wins like argmin over the whole grid
+        offsets = np.array([-1, 0, 1])
+        columns = np.clip(column[:, np.newaxis] + offsets, 0, self.N_width - 1)
+        rows = np.clip(row[:, np.newaxis] + offsets, 0, self.N_height - 1)
+        long_distance = abs(self.long_centres[columns] - geo_long[:, np.newaxis])
+        lat_distance = abs(self.lat_centres[rows] - geo_lat[:, np.newaxis])
+        dist_cityblock = long_distance[:, np.newaxis, :] + lat_distance[:, :, np.newaxis]
+        nearest = dist_cityblock.reshape(len(geo_long), 9).argmin(axis=1)
+
+        n = np.arange(len(geo_long))
+        gridpoints = rows[n, nearest // 3] * self.N_width + columns[n, nearest % 3]
+
+        if out_of_bounds != 'clip':
+            outside = ~self.contains(geo_long, geo_lat)
+            if out_of_bounds == 'raise' and outside.any():
+                raise ValueError("location outside of the grid: %s, %s" %
+                                 (geo_long[outside][0], geo_lat[outside][0]))
+            gridpoints[outside] = -1
+
+        return gridpoints
+
+    def neighbours(self, geo_long, geo_lat, method = 'bilinear'):
+        """ returns the 4 gridpoints around every location, whose centres 
+        enclose it, and their interpolation weights
+        - bilinear: weights by the position between the centres
+        - idw: inverse squared distance in cell units, a location on a 
+          centre gets only that gridpoint
+        - locations between the outer centres and the edge of the grid box
+          get the weights of the nearest centres on the edge
+        @param geo_long, geo_lat: np array: locations
+        @param method: str: 'bilinear' or 'idw'
+
+        @returns: np arrays [location x 4]: gridpoints and weights summing 
+                  to 1, a gridpoint with weight 0 is replaced by the one with
+                  the largest weight, so it needs no read
+        """
+        geo_long = np.atleast_1d(np.asarray(geo_long, dtype=float))
+        geo_lat = np.atleast_1d(np.asarray(geo_lat, dtype=float))
+        if not (np.isfinite(geo_long).all() and np.isfinite(geo_lat).all()):
+            raise ValueError("location is not a number")
+
+        # lower left centre and the position towards the next centre in [0, 1]
+        x = (geo_long - self.long_centres[0]) / self.dlong
+        y = (geo_lat - self.lat_centres[0]) / self.dlat
+        column = np.clip(np.floor(x), 0, max(self.N_width - 2, 0)).astype(int)
+        row = np.clip(np.floor(y), 0, max(self.N_height - 2, 0)).astype(int)
+        # rounded, so locations on a centre do not depend on rounding errors
+        fx = np.clip(np.round(x - column, 9), 0.0, 1.0)
+        fy = np.clip(np.round(y - row, 9), 0.0, 1.0)
+
+        columns = np.minimum(np.column_stack([column, column + 1, column, column + 1]), self.N_width - 1)
+        rows = np.minimum(np.column_stack([row, row, row + 1, row + 1]), self.N_height - 1)
+        gridpoints = rows * self.N_width + columns
+
+        if method == 'bilinear':
+            weights = np.column_stack([(1 - fx) * (1 - fy), fx * (1 - fy), (1 - fx) * fy, fx * fy])
+        elif method == 'idw':
+            dx = np.column_stack([fx, 1 - fx, fx, 1 - fx])
+            dy = np.column_stack([fy, fy, 1 - fy, 1 - fy])
+            distance = dx**2 + dy**2
+            with np.errstate(divide='ignore'):
+                weights = 1.0 / distance
+            on_centre = distance == 0
+            hit = on_centre.any(axis=1)
+            weights[hit] = on_centre[hit]
+            weights /= weights.sum(axis=1)[:, np.newaxis]
+        else:
+            raise ValueError("unknown interpolation method: %s" % method)
+
+        # no reads for gridpoints without weight
+        largest = gridpoints[np.arange(len(gridpoints)), weights.argmax(axis=1)]
+        gridpoints = np.where(weights > 0, gridpoints, largest[:, np.newaxis])
+
+        return gridpoints, weights
+
+    def gridpoint(self, geo_long, geo_lat, out_of_bounds = 'clip'):
+        """ returns the nearest gridpoint of one location, see gridpoints """
+        return int(self.gridpoints(geo_long, geo_lat, out_of_bounds)[0])
+
+    def centres(self, gridpoints):
+        """ returns longitude and latitude of the centres of gridpoints """
+        gridpoints = np.asarray(gridpoints, dtype=int)
+        row, column = gridpoints // self.N_width, gridpoints % self.N_width
+        return self.long_centres[column], self.lat_centres[row]
+
+    def centre(self, gridpoint):
+        """ returns longitude and latitude of the centre of one gridpoint """
+        geo_long, geo_lat = self.centres(gridpoint)
+        return float(geo_long), float(geo_lat)
+
+def fnLonLat2GridPoint(pars_grid, geo_long, geo_lat):
+    """ returns nearest gridpoint for given longitude and latitude
+    - distance is calculated using Manhattan city block distance (d1)
+    - locations outside the grid get the nearest gridpoint on its edge
+    - builds the Grid on every call, use Grid.gridpoint of the shared grid,
+      see resources.get_grid, for repeated lookups
+    """
+    return Grid(pars_grid).gridpoint(geo_long, geo_lat)
+
+def fnGridPoint2LonLat(pars_grid, gridpoint):
+    """ returns longitude and latitude of the centre of a gridpoint
+    - builds the Grid on every call, use Grid.centre of the shared grid, see
+      resources.get_grid, for repeated lookups
+    """
+    return Grid(pars_grid).centre(gridpoint)
@@ -1,7 +1,25 @@
+import numpy as np
 import pandas as pd
 import datetime as dt # used for rounding time
 import sys
 import json
+import struct
+import base64
+import hashlib
+
+# radiation data comes in slots of 15 minutes, days start at 00:00 UTC
+SLOTS_PER_DAY = 96
+SLOT_NS = 15 * 60 * 10**9
+DAY_NS = SLOTS_PER_DAY * SLOT_NS
+HOUR_NS = 4 * SLOT_NS
+
+# output resolutions and their interval in the summary
+RESOLUTIONS = {"15min" : "15 minutes",
+               "hour" : "1 hour",
+               "day" : "1 day",
+               "month" : "1 month"}
+# seconds per interval of the binary format, months are not regular
+INTERVAL_SECONDS = {"15min" : 900, "hour" : 3600, "day" : 86400}
 
 def round_time(time, interval_size):
     """ rounds off time to closest interval
@@ -37,21 +55,100 @@ def perdelta(start, end, delta, include):
             yield curr
             curr += delta
 
-def ConvertToJSON(df):
+def Resample(df, resolution):
+    """ aggregates 15-minute power to hours, days or months (UTC)
+    @param df: pd dataframe: with column 'power' and datetimeindex (UTC)
+    @param resolution: str: one of RESOLUTIONS, 15min returns df
+    
+    @returns: pd dataframe: with the start of every interval as index, 
+              'power': mean power of the slots with data, NaN without, and
+              'energy': production in the interval in Wh
+    """
+    if resolution == "15min":
+        return df
+    
+    ns = df.index.asi8
+    if resolution == "hour":
+        bins = ns // HOUR_NS
+    elif resolution == "day":
+        bins = ns // DAY_NS
+    elif resolution == "month":
+        bins = (np.asarray(df.index.year) - 1970) * 12 + np.asarray(df.index.month) - 1
+    else:
+        raise ValueError("unknown resolution: %s" % resolution)
+    keys, interval = np.unique(bins, return_inverse = True)
+    
+    power = df["power"].values
+    valid = ~np.isnan(power)
+    total = np.bincount(interval, weights = np.where(valid, power, 0))
+    count = np.bincount(interval, weights = valid)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        mean = total / count
+    
+    if resolution == "hour":
+        begin = keys * HOUR_NS
+    elif resolution == "day":
+        begin = keys * DAY_NS
+    else:
+        begin = keys.astype('datetime64[M]').astype('datetime64[ns]').view(np.int64)
+    index = pd.DatetimeIndex(begin).tz_localize('UTC')
+    
+    return pd.DataFrame({"power" : mean, "energy" : total / 4}, index = index, 
+                        columns = ["power", "energy"])
+
+def ConvertToJSON(df, resolution = "15min", cursor = None):
     """ converts a dataframe to JSON
     @param df: pd dataframe: with column 'power' and datetimeindex
+    @param resolution: str: interval of the rows, see Resample
+    @param cursor: str: cursor of incremental requests, see EncodeCursor
     
     @returns: output: JSON
     """
     
-    df["timestamp"] = [str(ts).replace(" ", "T") for ts in df.index]
+    output = ConvertToDict(df, resolution, cursor)
+    
+    return json.dumps(output, sys.stdout)
+
+def ConvertToDict(df, resolution = "15min", cursor = None):
+    """ converts a dataframe to the dictionary that is returned as JSON
+    @param df: pd dataframe: with column 'power' and datetimeindex, and
+               'energy' when resampled
+    @param resolution: str: interval of the rows, see Resample
+    @param cursor: str: cursor of incremental requests, see EncodeCursor
+    
+    @returns: output: dict
+    """
+    
+    df["timestamp"] = FormatTimestamps(df.index)
+    columns = ["timestamp","power"] + (["energy"] if "energy" in df.columns else [])
+
+    output = ConvertToSummary(df, resolution, cursor)
+    output["data"] = df[columns].where((pd.notnull(df)), None).to_dict(orient = "records")
+    
+    return output
+
+def ConvertToSummary(df, resolution = "15min", cursor = None):
+    """ returns the dictionary that is returned as JSON, without data
+    @param df: pd dataframe: with column 'power' and datetimeindex, and
+               'energy' when resampled, may be empty
+    @param resolution: str: interval of the rows, see Resample
+    @param cursor: str: cursor of incremental requests, see EncodeCursor
+    
+    @returns: output: dict
+    """
+    if "energy" in df.columns:
+        energy = df["energy"].sum()
+    else:
+        energy = df["power"].sum()/4
+    
+    timestamp = FormatTimestamps(df.index[[0, -1]]) if len(df) else [None]
 
     output = {"successful" : True,
             "timestamp": {
-                "startTime": str(df.timestamp[0]),
-                "endTime": str(df.timestamp[-1]),
+                "startTime": timestamp[0],
+                "endTime": timestamp[-1],
                 "format" : "ISO-8061",
-                "interval" : "15 minutes"
+                "interval" : RESOLUTIONS[resolution]
                 },
             "power": {
                 "measure": "mean power in interval",
@@ -59,10 +156,147 @@ def ConvertToJSON(df):
                 },
             "recordCount": len(df),
             "sum" : {
-                "value" : round(df["power"].sum()/4, 2), 
+                "value" : round(energy, 2), 
                 "unit" : "Watt hour",
                 "measure" : "total production in period"
-                },
-            "data": df[["timestamp","power"]].where((pd.notnull(df)), None).to_dict(orient = "records")}
+                }}
+    if cursor is not None:
+        output["cursor"] = cursor
+    
+    return output
+
+def ConvertToJSONStream(df, ndjson = False, chunk_size = 2000, resolution = "15min", 
+                        cursor = None):
+    """ converts a dataframe to JSON in chunks, so the whole document is 
+    never in memory
+    - the document is the same as that of ConvertToJSON, byte for byte
+    - only the output is chunked: df itself and the model that computed it
+      hold the whole window, as numpy arrays of 8 bytes per value, while
+      ConvertToJSON also holds a dict per record and the whole document
+    @param df: pd dataframe: with column 'power' and datetimeindex, and
+               'energy' when resampled
+    @param ndjson: bool: newline delimited JSON, the summary on the first 
+                   line followed by one line per record, instead of the 
+                   document of ConvertToJSON
+    @param chunk_size: int: records per chunk
+    @param resolution: str: interval of the rows, see Resample
+    @param cursor: str: cursor of incremental requests, see EncodeCursor
+    
+    @returns: generator of str
+    """
     
-    return json.dumps(output, sys.stdout)
\ No newline at end of file
+    columns = ["power"] + (["energy"] if "energy" in df.columns else [])
+    summary = ConvertToSummary(df, resolution, cursor)
+    if ndjson:
+        yield json.dumps(summary) + "\n"
+        separator = "\n"
+    else:
+        # the keys in the order of the document of ConvertToJSON, the data
+        # is written where the placeholder is
+        placeholder = "\x00data\x00"
+        summary["data"] = placeholder
+        head, tail = json.dumps(summary).split(json.dumps(placeholder))
+        yield head + "["
+        separator = ", "
+
+    # records as the dicts of ConvertToDict, with the same key order
+    keys = list(dict((key, None) for key in ["timestamp"] + columns))
+    record = "{" + ", ".join('"%s": %%s' % key for key in keys) + "}"
+    values = [df[column].values for column in columns]
+    for begin in range(0, len(df), chunk_size):
+        end = min(begin + chunk_size, len(df))
+        chunk = {"timestamp" : ['"%s"' % timestamp for timestamp in FormatTimestamps(df.index[begin:end])]}
+        for column, value in zip(columns, values):
+            chunk[column] = ["null" if v != v else repr(v) for v in value[begin:end].tolist()]
+        records = separator.join([record % fields for fields in zip(*[chunk[key] for key in keys])])
+        if ndjson:
+            yield records + "\n"
+        else:
+            yield (", " if begin > 0 else "") + records
+
+    if not ndjson:
+        yield "]" + tail
+
+def ConvertToBinary(df, resolution = "15min", cursor = None):
+    """ converts a dataframe to a compact binary format:
+    - 4 bytes: "INSP"
+    - uint32, little endian: length of the JSON header in bytes
+    - JSON header: the summary of ConvertToJSON, with startTime and 
+      interval also as "startEpoch" and "intervalSeconds", and "dtype"
+    - recordCount float32 values, little endian: power in W, NaN if missing,
+      the i-th value is for startEpoch + i * intervalSeconds
+    clients read it with e.g. numpy.frombuffer(body, "<f4", count, offset),
+    see ConvertFromBinary
+    @param df: pd dataframe: with column 'power' and datetimeindex
+    @param resolution: str: interval of the rows, see Resample, not month 
+                       as its intervals differ in length
+    @param cursor: str: cursor of incremental requests, see EncodeCursor
+    
+    @returns: output: bytes
+    """
+    if resolution not in INTERVAL_SECONDS:
+        raise ValueError("resolution %s has no fixed interval" % resolution)
+    
+    summary = ConvertToSummary(df, resolution, cursor)
+    summary["startEpoch"] = df.index[0].value // 10**9 if len(df) else None
+    summary["intervalSeconds"] = INTERVAL_SECONDS[resolution]
+    summary["dtype"] = "<f4"
+    header = json.dumps(summary).encode("utf-8")
+    
+    power = df["power"].values.astype("<f4")
+    return b"INSP" + struct.pack("<I", len(header)) + header + power.tobytes()
+
+def ConvertFromBinary(body):
+    """ reads the binary format of ConvertToBinary
+    @param body: bytes: the response
+    
+    @returns: dict: the JSON header, np array of float32: power in W
+    """
+    if body[:4] != b"INSP":
+        raise ValueError("not the binary format of ConvertToBinary")
+    length = struct.unpack("<I", body[4:8])[0]
+    header = json.loads(body[8:8 + length].decode("utf-8"))
+    power = np.frombuffer(body, header["dtype"], header["recordCount"], 8 + length)
+    return header, power
+
+def FormatTimestamps(index):
+    """ formats the timestamps of a UTC datetimeindex vectorized, the same 
+    as str(ts).replace(" ", "T"), e.g. 2015-05-02T15:45:00+00:00
+    
+    @returns: list of str
+    """
+    if index.tz is None or str(index.tz) != 'UTC':
+        return [str(ts).replace(" ", "T") for ts in index]
+    
+    timestamp = np.datetime_as_string(index.asi8.view('datetime64[ns]'), unit = 's')
+    return np.core.defchararray.add(timestamp.astype(str), "+00:00").tolist()
+
+def EncodeCursor(timestamp, parameters):
+    """ returns the cursor of an incremental request: an opaque token with 
+    the last slot the client received and a digest of the installation, so
+    a cursor is not accepted for another installation
+    @param timestamp: pd timestamp: last slot with a value (UTC)
+    @param parameters: tuple: installation parameters of the request
+    
+    @returns: str
+    """
+    digest = hashlib.sha1(repr(parameters).encode("utf-8")).hexdigest()[:12]
+    token = "%d:%s" % (timestamp.value // 10**9, digest)
+    return base64.urlsafe_b64encode(token.encode("utf-8")).decode("ascii")
+
+def DecodeCursor(cursor, parameters):
+    """ returns the timestamp of a cursor of EncodeCursor
+    @param cursor: str: token
+    @param parameters: tuple: installation parameters of the request
+    
+    @returns: pd timestamp (UTC)
+    @raises: ValueError: if the cursor is invalid or of another installation
+    """
+    try:
+        seconds, digest = base64.urlsafe_b64decode(str(cursor)).decode("ascii").split(":")
+        seconds = int(seconds)
+    except (TypeError, ValueError):
+        raise ValueError("invalid cursor")
+    if digest != hashlib.sha1(repr(parameters).encode("utf-8")).hexdigest()[:12]:
+        raise ValueError("cursor of another installation")
+    return pd.Timestamp(seconds * 10**9, tz = 'UTC')
@@ -0,0 +1,76 @@
+"""
+Ingestion of new MeteoSat radiation into the local radiation store, as
+frames: the radiation of the whole grid at one 15-minute timestamp.
+
+A frame is written with one vectorized write per variable into the memory
+mapped arrays of the store, see RadiationStore.write_frames, instead of one
+write per gridpoint. The store counts the writes per day, so the cached
+radiation and responses of exactly the days written are computed again, in
+this and every other process reading the store, without a restart, see
+RadiationCache and RadiationStore.data_version.
+
+Frames come from csv files in the format of the MeteoSat csv files, with a
+row per gridpoint and timestamp (see import_radiation.py), or as JSON at
+/ingestRadiation.
+"""
+
+import numpy as np
+import pandas as pd
+
+from helper_functions import SLOT_NS
+from metrics import INGESTED_FRAMES
+
+def FramesFromRows(df, n_gridpoints, dayfirst = False):
+    """ returns the frames of rows of radiation
+    - columns: datetime or time, longlat (the gridpoint), diffuse and
+      downwelling
+    - timestamps are rounded to the nearest 15-minute slot, gridpoints
+      without a row are NaN
+    @param df: pd dataframe: one row per gridpoint and timestamp
+    @param n_gridpoints: int: number of gridpoints, N_width * N_height
+    @param dayfirst: bool: dates are written day first, e.g. 5-10-2015
+
+    @returns: pd datetimeindex, dict: variable -> np array [time x gridpoint]
+    """
+    time_column = "datetime" if "datetime" in df.columns else "time"
+    times = pd.DatetimeIndex(pd.to_datetime(df[time_column], dayfirst = dayfirst))
+    ns = ((times.asi8 + SLOT_NS // 2) // SLOT_NS) * SLOT_NS
+    gridpoints = df["longlat"].values.astype(int)
+    if len(gridpoints) and (gridpoints.min() < 0 or gridpoints.max() >= n_gridpoints):
+        raise ValueError("gridpoint outside of the grid")
+
+    unique_ns, row = np.unique(ns, return_inverse = True)
+    values = dict()
+    for name in ("diffuse", "downwelling"):
+        values[name] = np.empty((len(unique_ns), n_gridpoints)) * np.nan
+        values[name][row, gridpoints] = df[name].values
+    return pd.DatetimeIndex(unique_ns).tz_localize('UTC'), values
+
+def ReadFramesCSV(csv_file, n_gridpoints, dayfirst = False):
+    """ reads the frames of a MeteoSat csv file with the radiation of many
+    gridpoints, see FramesFromRows
+    @param csv_file: str: path of the csv file, separated by , or ;
+
+    @returns: pd datetimeindex, dict: variable -> np array [time x gridpoint]
+    """
+    df = pd.read_csv(csv_file, sep = None, engine = 'python')
+    return FramesFromRows(df, n_gridpoints, dayfirst)
+
+def IngestFrames(store, index, values, flush = True):
+    """ writes frames into the radiation store, readers see them with their
+    next request
+    - flushing writes the store to disk, it takes most of the time of a
+      frame and is only needed to survive a crash of the machine
+    @param store: RadiationStore
+    @param index: pd datetimeindex: timestamps (UTC) on the 15-minute grid
+    @param values: dict: variable -> np array [time x gridpoint], NaN keeps
+                   the radiation written before
+    @param flush: bool: flush the store after writing
+
+    @returns: int: number of frames written
+    """
+    store.write_frames(index, values)
+    if flush:
+        store.flush()
+    INGESTED_FRAMES.inc(len(index))
+    return len(index)
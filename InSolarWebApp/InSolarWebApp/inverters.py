@@ -0,0 +1,81 @@
+import numpy as np
+
+# the % load of the inverter= power dc/inverter rated power (inverter capacity)
+DEFAULT_LOAD = [0,0.05,0.1,0.15,0.2,0.3,0.4,0.5,0.6,0.7,0.8,0.9,1]
+# the inverter efficiency: Pac=eff*Pdc
+DEFAULT_EFFICIENCY = [0,0.9,0.94,0.95,0.953,0.96,0.965,0.9675,0.965,0.965,0.9625,0.96,0.9575]
+
+# number of steps in the efficiency lookup tables
+LUT_STEPS = 1000
+
+class InverterRegistry(object):
+    """ named inverter efficiency curves, evaluated with dense lookup tables
+    - every curve is sampled at LUT_STEPS + 1 equidistant loads from 0 to its
+      highest load, the efficiency at a load is interpolated linearly between
+      the two neighbouring samples, found by arithmetic instead of a search
+    - curves with their loads on the sample points, like the default curve
+      with steps of 0.05, give the same efficiency as np.interp
+    - below 0 and above the highest load the efficiency is held constant
+    - all tables are stacked, so installations with different inverters are
+      evaluated in one pass
+    """
+
+    def __init__(self):
+        self.names = []
+        self._tables = np.zeros((0, LUT_STEPS + 2))
+        self._scale = np.zeros(0)
+        self.register("default", DEFAULT_LOAD, DEFAULT_EFFICIENCY)
+
+    def register(self, name, load, efficiency):
+        """ adds or replaces an inverter model
+        @param name: str: name of the model
+        @param load: list: increasing loads, DC power / inverter capacity
+        @param efficiency: list: efficiency at each load
+        """
+        load = np.asarray(load, dtype=float)
+        samples = np.linspace(0, load[-1], LUT_STEPS + 1)
+        # one extra sample, so the upper neighbour of the last sample exists
+        table = np.append(np.interp(samples, load, efficiency), efficiency[-1])
+
+        if name in self.names:
+            i = self.names.index(name)
+            self._tables[i] = table
+            self._scale[i] = LUT_STEPS / load[-1]
+        else:
+            self.names.append(name)
+            self._tables = np.vstack([self._tables, table])
+            self._scale = np.append(self._scale, LUT_STEPS / load[-1])
+
+    def index(self, name):
+        """ returns the index of an inverter model, for efficiency and DC2AC """
+        try:
+            return self.names.index(name)
+        except ValueError:
+            raise ValueError("unknown inverter model: %s" % name)
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def efficiency(self, load, model = 0):
+        """ returns the inverter efficiency
+        @param load: np array: DC power / inverter capacity
+        @param model: int or np array of int broadcasting with load: index
+                      of the inverter model
+
+        @returns: np array: efficiency, same shape as load
+        """
+        position = np.asarray(load, dtype=float) * self._scale[model]
+        position = np.clip(position, 0, LUT_STEPS)
+        position = np.where(np.isnan(position), 0, position)
+        i = position.astype(int)
+        fraction = position - i
+
+        lower = self._tables[model, i]
+        upper = self._tables[model, i + 1]
+        return lower + (upper - lower) * fraction
+
+    def DC2AC(self, DC, inverter_capacity, model = 0):
+        """ returns the AC power of the inverter, for DC power (W) """
+        return self.efficiency(DC / inverter_capacity, model) * DC
+
+default_inverters = InverterRegistry()
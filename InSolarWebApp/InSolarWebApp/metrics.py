@@ -0,0 +1,234 @@
+"""
+Counters and latency histograms of the hot path, rendered in the Prometheus
+text exposition format at /metrics.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from werkzeug.local import Local, release_local
+
+# upper bounds of the histogram buckets in seconds, +Inf is added
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _format_labels(names, values, extra = ()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for name, value in pairs) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter(object):
+    """ monotonically increasing count, per combination of label values """
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = dict()
+        self._lock = threading.Lock()
+
+    def inc(self, amount = 1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return ["%s%s %s" % (self.name, _format_labels(self.labels, key), _format_value(value))
+                for key, value in values]
+
+class Gauge(Counter):
+    """ value that is set, per combination of label values """
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram(object):
+    """ distribution of observed values in cumulative buckets, per
+    combination of label values
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels = (), buckets = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values = dict()
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def render(self):
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append("%s_bucket%s %d" % (self.name,
+                                                 _format_labels(self.labels, key, [("le", _format_value(bound))]),
+                                                 cumulative))
+            lines.append("%s_sum%s %r" % (self.name, _format_labels(self.labels, key), total))
+            lines.append("%s_count%s %d" % (self.name, _format_labels(self.labels, key), cumulative))
+        return lines
+
+class Registry(object):
+    """ the metrics of the process, a metric is created on first use and
+    returned again for the same name
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def counter(self, name, help, labels = ()):
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, help, labels = ()):
+        return self._get(Gauge, name, help, labels)
+
+    def histogram(self, name, help, labels = (), buckets = DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help, labels, buckets)
+
+    def render(self):
+        """ returns all metrics in the Prometheus text format """
+        lines = []
+        for metric in self._metrics:
+            lines.append("# HELP %s %s" % (metric.name, metric.help))
+            lines.append("# TYPE %s %s" % (metric.name, metric.kind))
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def _get(self, kind, name, *args):
+        with self._lock:
+            for metric in self._metrics:
+                if metric.name == name:
+                    return metric
+            metric = kind(name, *args)
+            self._metrics.append(metric)
+            return metric
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram("insolar_stage_seconds",
+                                   "Latency of the stages of a request", ("stage",))
+REQUEST_SECONDS = registry.histogram("insolar_request_seconds",
+                                     "Latency of requests until the response is returned",
+                                     ("endpoint",))
+REQUESTS = registry.counter("insolar_requests_total", "Requests by endpoint and status",
+                            ("endpoint", "status"))
+AZURE_QUERIES = registry.counter("insolar_azure_queries_total", "Azure table queries")
+AZURE_PAGES = registry.counter("insolar_azure_pages_total",
+                               "Pages of at most 1000 entities read from the Azure table")
+AZURE_ENTITIES = registry.counter("insolar_azure_entities_total",
+                                  "Entities read from the Azure table")
+AZURE_BYTES = registry.counter("insolar_azure_response_bytes_total",
+                               "Bytes of Azure table response bodies")
+AZURE_PAGE_SECONDS = registry.histogram("insolar_azure_page_seconds",
+                                        "Latency of one page of an Azure table query")
+STARTUP_SECONDS = registry.gauge("insolar_startup_seconds",
+                                 "Seconds spent in the phases of the worker startup", ("phase",))
+INGESTED_FRAMES = registry.counter("insolar_ingested_frames_total",
+                                  "Whole grid radiation frames written to the radiation store")
+
+# stage timings of the request handled by the current thread or greenlet
+_local = Local()
+
+def start_timings():
+    """ starts collecting the stage timings of the current request """
+    _local.timings = []
+
+def stop_timings():
+    """ returns the stage timings of the current request as a list of
+    (stage, seconds), summed per stage in order of first occurrence, and
+    stops collecting
+    """
+    timings = getattr(_local, 'timings', None) or []
+    release_local(_local)
+    totals = dict()
+    order = []
+    for stage, seconds in timings:
+        if stage not in totals:
+            order.append(stage)
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return [(stage, totals[stage]) for stage in order]
+
+def get_timings():
+    """ returns the list collecting the stage timings of the current request,
+    None when not collecting
+    """
+    return getattr(_local, 'timings', None)
+
+def set_timings(timings):
+    """ collects stage timings in the list of get_timings, e.g. of a request
+    handled by another thread, None to stop
+    """
+    if timings is None:
+        release_local(_local)
+    else:
+        _local.timings = timings
+
+def observe_stage(stage, seconds):
+    """ records seconds spent in stage, in the histogram and the timings of
+    the current request
+    """
+    STAGE_SECONDS.observe(seconds, stage = stage)
+    timings = getattr(_local, 'timings', None)
+    if timings is not None:
+        timings.append((stage, seconds))
+
+@contextmanager
+def timed(stage):
+    """ times the enclosed block as stage, see observe_stage """
+    start = time.time()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.time() - start)
+
+def format_server_timing(timings):
+    """ returns the Server-Timing header value, durations in ms """
+    return ", ".join("%s;dur=%.3f" % (stage, 1000*seconds) for stage, seconds in timings)
+
+def format_cache_stats(caches):
+    """ returns cache statistics in the Prometheus text format
+    @param caches: dict: cache name -> stats() of an LRUCache
+    """
+    lines = []
+    for field in ["hits", "misses", "evictions", "expirations"]:
+        name = "insolar_cache_%s_total" % field
+        lines.append("# HELP %s Cache %s" % (name, field))
+        lines.append("# TYPE %s counter" % name)
+        for cache in sorted(caches):
+            lines.append('%s{cache="%s"} %d' % (name, cache, caches[cache][field]))
+    lines.append("# HELP insolar_cache_entries Entries in the cache")
+    lines.append("# TYPE insolar_cache_entries gauge")
+    for cache in sorted(caches):
+        lines.append('insolar_cache_entries{cache="%s"} %d' % (cache, caches[cache]["size"]))
+    return "\n".join(lines) + "\n"
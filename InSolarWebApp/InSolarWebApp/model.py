@@ -1,15 +1,23 @@
 import numpy as np 
-import pandas as pd
-import datetime as dt # used for rounding time
-import pvlib #the library of sandia, the us national laboratories
-import os
+import time
 
-from helper_functions import *
+from solar_position import fnSunPosition
+from grid import Grid
+from inverters import default_inverters
+from metrics import timed, observe_stage
 
 def fnGetExpectedProduction(df, geo_long, geo_lat, orientation, tilt,
-                            installation_capacity, pars_grid):
+                            installation_capacity, pars_grid, 
+                            gridpoint = None, solar_cache = None,
+                            inverter_capacity = None, inverter_model = 0, 
+                            inverters = None, grid = None):
     """ Calculates the expected PV production 
+    - with a solar_cache the solar position of the centre of gridpoint is used,
+      from grid, the shared Grid, or one built from pars_grid
+    - the inverter capacity is the installation capacity unless given, the 
+      inverter_model is an index in inverters, see fnDC2AC
     """
+    import pvlib # loaded on first use, see startup.py
     
     ## MeteoSat radiation to GTI        
     def Meteosat2GTI_sandia(geo_lat, geo_long, df):
@@ -19,56 +27,380 @@ def fnGetExpectedProduction(df, geo_long, geo_lat, orientation, tilt,
                 df_ID: the dataframe of the meteosat data for the spesific toon id.
         output: GTI the pandas series with the GTI of the spesific toon id
         '''
-        tz=pvlib.location.pytz.timezone('Europe/Amsterdam')
-        location=pvlib.location.Location(geo_lat,geo_long,'Europe/Amsterdam')
-        
-        sun_position = pvlib.solarposition.ephemeris(df.index,location)
-        sun_position.index=sun_position.index.tz_convert('utc')
+        with timed("solar_position"):
+            if solar_cache is None:
+                zenith, azimuth = fnSunPosition(df.index, geo_lat, geo_long)
+            else:
+                centre_long, centre_lat = (grid or Grid(pars_grid)).centre(gridpoint)
+                zenith, azimuth = solar_cache.get(gridpoint, centre_long, centre_lat, 
+                                                  df.index)
+        start = time.time()
         beam=pvlib.irradiance.beam_component(tilt,
                                              orientation,
-                                             sun_position.zenith,
-                                             sun_position.azimuth,
-                                             df.downwelling)
+                                             zenith,
+                                             azimuth,
+                                             df.downwelling.values)
         DIA=pvlib.irradiance.isotropic(tilt,df.diffuse)
         GTI=beam+DIA
+        observe_stage("gti", time.time() - start)
         return GTI
     
     df['GTI'] = Meteosat2GTI_sandia(geo_lat, geo_long, df).tolist()
 
+    start = time.time()
+
     ## GTI to DC
     performance_ratio = 0.78
-    
-    def fnGTI2DC(GTI, installation_capacity, performance_ratio = 0.78):
-        '''
-        inputs:
-            GTI the tilted irradiance in W/m2 (in series or value)
-        output: the dc power of the system in W (series or value)
-        '''
-        
-        DC = installation_capacity * GTI * performance_ratio/1000
-    
-        return DC
-    
-    inverter_capacity = installation_capacity
     df['DC'] = fnGTI2DC(df.GTI, installation_capacity, performance_ratio).tolist()
     
     ## DC to AC, i.e. expected production
-    def fnDC2AC(DC,inverter_capacity):
-        '''
-        input: PDC: the produced DC power from the pannels (pandas series) 
-               cap: the inverter capacity. If we dont have it we can make assumptions based on system capacity 
-                    However without it we cannot include correctly the losses on the inverter. Espesially in low radiation there are big
-        output: Pac: the AC power, output of the inverter (pandas series)
-        '''
-        #the % load of the inverter= power dc/inverter rated power (inverter capacity)
-        load = [0,0.05,0.1,0.15,0.2,0.3,0.4,0.5,0.6,0.7,0.8,0.9,1]        
-        #the inverter efficiency: Pac=eff*Pdc
-        efficiency = [0,0.9,0.94,0.95,0.953,0.96,0.965,0.9675,0.965,0.965,0.9625,0.96,0.9575]
-        #creates the serries of the power AC    
-        power = np.interp(DC/inverter_capacity,load,efficiency) *  DC
-        return power
-        
-    inverter_capacity = installation_capacity    
-    df['power'] = fnDC2AC(df.DC,inverter_capacity).tolist()
-
-    return df
\ No newline at end of file
+    if inverter_capacity is None:
+        inverter_capacity = installation_capacity    
+    df['power'] = fnDC2AC(df.DC,inverter_capacity, inverter_model, inverters).tolist()
+    observe_stage("dc_ac", time.time() - start)
+
+    return df
+
+def fnGTI2DC(GTI, installation_capacity, performance_ratio = 0.78):
+    '''
+    inputs:
+        GTI the tilted irradiance in W/m2 (in series or value)
+    output: the dc power of the system in W (series or value)
+    '''
+    
+    DC = installation_capacity * GTI * performance_ratio/1000
+
+    return DC
+
+def fnDC2AC(DC,inverter_capacity, inverter_model = 0, inverters = None):
+    '''
+    input: PDC: the produced DC power from the pannels (pandas series) 
+           cap: the inverter capacity. If we dont have it we can make assumptions based on system capacity 
+                However without it we cannot include correctly the losses on the inverter. Espesially in low radiation there are big
+           inverter_model: index of the inverter efficiency curve in inverters (int or array)
+           inverters: InverterRegistry, default the curve below
+    output: Pac: the AC power, output of the inverter (pandas series)
+    '''
+    #the % load of the inverter= power dc/inverter rated power (inverter capacity)
+    #with the inverter efficiency: Pac=eff*Pdc, see inverters.DEFAULT_EFFICIENCY
+    if inverters is None:
+        inverters = default_inverters
+    power = inverters.DC2AC(DC, inverter_capacity, inverter_model)
+    return power
+
+def fnGTIMatrix(zenith, azimuth, downwelling, diffuse, cell, orientation, tilt):
+    """ calculates the global tilted irradiance of many panels at once
+    - same model as pvlib beam_component + isotropic in Meteosat2GTI_sandia
+    - the trigonometry of the sun is done once per cell, per panel only
+      multiplications and additions remain
+    @param zenith, azimuth: np array [time x cell]: solar position in degrees
+    @param downwelling, diffuse: np array [time x cell]: radiation in W/m2
+    @param cell: np array of int (installation): column of the installation 
+                 in the radiation block
+    @param orientation, tilt: np array (installation): panel angles in degrees
+
+    @returns: np array: GTI [time x installation]
+    """
+    zenith = np.radians(zenith)
+    azimuth = np.radians(azimuth)
+    orientation = np.radians(orientation)
+    tilt = np.radians(tilt)
+
+    # cos(azimuth - orientation) = cos(az)cos(or) + sin(az)sin(or)
+    sin_zenith = np.sin(zenith)
+    projection = (sin_zenith * np.cos(azimuth))[:, cell] * (np.sin(tilt) * np.cos(orientation))
+    projection += (sin_zenith * np.sin(azimuth))[:, cell] * (np.sin(tilt) * np.sin(orientation))
+    projection += np.cos(zenith)[:, cell] * np.cos(tilt)
+
+    GTI = np.multiply(downwelling[:, cell], projection, out = projection)
+    with np.errstate(invalid='ignore'):
+        GTI[GTI < 0] = 0
+    GTI += diffuse[:, cell] * ((1 + np.cos(tilt)) * 0.5)
+    
+    return GTI
+
+def fnGetExpectedProductionMatrix(downwelling, diffuse, zenith, azimuth, 
+                                  installations, performance_ratio = 0.78,
+                                  inverters = None):
+    """ Calculates the expected PV production of many installations on a 
+    block of radiation of many cells
+    @param downwelling, diffuse: np array [time x cell]: radiation in W/m2
+    @param zenith, azimuth: np array [time x cell]: solar position in degrees
+    @param installations: table (dict of np arrays or structured array) with
+                          one row per installation and columns 'cell' (column 
+                          in the radiation block), 'orientation', 'tilt', 
+                          'installation_capacity' and optional 
+                          'inverter_capacity' (default installation_capacity)
+                          and 'inverter_model' (index in inverters, default 0)
+    @param performance_ratio: float
+    @param inverters: InverterRegistry, default inverters.default_inverters
+
+    @returns: np array: power in W [time x installation]
+    """
+    cell = np.asarray(installations['cell'], dtype=int)
+    installation_capacity = np.asarray(installations['installation_capacity'], dtype=float)
+    if _has_column(installations, 'inverter_capacity'):
+        inverter_capacity = np.asarray(installations['inverter_capacity'], dtype=float)
+    else:
+        inverter_capacity = installation_capacity
+    if _has_column(installations, 'inverter_model'):
+        inverter_model = np.asarray(installations['inverter_model'], dtype=int)
+    else:
+        inverter_model = 0
+
+    with timed("gti"):
+        GTI = fnGTIMatrix(np.asarray(zenith, dtype=float), np.asarray(azimuth, dtype=float),
+                          np.asarray(downwelling, dtype=float), np.asarray(diffuse, dtype=float),
+                          cell, 
+                          np.asarray(installations['orientation'], dtype=float),
+                          np.asarray(installations['tilt'], dtype=float))
+    with timed("dc_ac"):
+        DC = fnGTI2DC(GTI, installation_capacity, performance_ratio)
+        power = fnDC2AC(DC, inverter_capacity, inverter_model, inverters)
+
+    return power
+
+def _has_column(table, name):
+    """ returns True if the dict or structured array has column name """
+    names = getattr(getattr(table, 'dtype', None), 'names', None)
+    return name in (names if names is not None else table)
+
+def fnGetExpectedProductionBatch(df, geo_long, geo_lat, orientation, tilt,
+                                 installation_capacity, 
+                                 gridpoint = None, solar_cache = None,
+                                 inverter_capacity = None, inverter_model = None,
+                                 inverters = None):
+    """ Calculates the expected PV production for several installations 
+    sharing the radiation of one gridpoint
+    @param df: pd dataframe: with downwelling, diffuse and datetimeindex
+    @param geo_long, geo_lat: float: location used for the solar position
+    @param orientation, tilt, installation_capacity: np array (installation)
+    @param gridpoint, solar_cache: optional, cache key and solar position cache
+    @param inverter_capacity, inverter_model: optional np array (installation),
+                                              see fnGetExpectedProductionMatrix
+    @param inverters: InverterRegistry
+
+    @returns: np array: power in W [time x installation]
+    """
+    with timed("solar_position"):
+        if solar_cache is None:
+            zenith, azimuth = fnSunPosition(df.index, geo_lat, geo_long)
+        else:
+            zenith, azimuth = solar_cache.get(gridpoint, geo_long, geo_lat, df.index)
+
+    installations = {"cell" : np.zeros(len(orientation), dtype=int),
+                     "orientation" : orientation,
+                     "tilt" : tilt,
+                     "installation_capacity" : installation_capacity}
+    if inverter_capacity is not None:
+        installations["inverter_capacity"] = inverter_capacity
+    if inverter_model is not None:
+        installations["inverter_model"] = inverter_model
+    power = fnGetExpectedProductionMatrix(df.downwelling.values[:, np.newaxis],
+                                          df.diffuse.values[:, np.newaxis],
+                                          zenith[:, np.newaxis], azimuth[:, np.newaxis],
+                                          installations, inverters = inverters)
+
+    return power
+
+def fnBlendRadiation(values, neighbours, weights):
+    """ interpolates radiation of cells to installations
+    - cells without radiation in a slot are left out and the weights of the
+      others scaled up, NaN if none of the cells has radiation
+    @param values: np array [time x cell]: radiation
+    @param neighbours: np array of int [installation x k]: columns in values
+    @param weights: np array [installation x k]: weights summing to 1
+
+    @returns: np array: radiation [time x installation]
+    """
+    total = np.zeros((values.shape[0], neighbours.shape[0]))
+    weight = np.zeros_like(total)
+    for k in range(neighbours.shape[1]):
+        column = values[:, neighbours[:, k]]
+        valid = ~np.isnan(column)
+        total += np.where(valid, column, 0) * weights[:, k]
+        weight += valid * weights[:, k]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(weight > 0, total / weight, np.nan)
+
+def fnSolarPositionBlock(index, gridpoints, grid, solar_cache = None):
+    """ returns the solar position of the centres of gridpoints
+    @param index: pd datetimeindex: timestamps (UTC)
+    @param gridpoints: np array of int: gridpoints
+    @param grid: Grid
+    @param solar_cache: optional, solar position cache
+
+    @returns: np arrays [time x gridpoint]: zenith, azimuth in degrees
+    """
+    with timed("solar_position"):
+        positions = []
+        for gridpoint, geo_long, geo_lat in zip(gridpoints, *grid.centres(gridpoints)):
+            if solar_cache is None:
+                positions.append(fnSunPosition(index, geo_lat, geo_long))
+            else:
+                positions.append(solar_cache.get(gridpoint, geo_long, geo_lat, index))
+        zenith = np.column_stack([p[0] for p in positions])
+        azimuth = np.column_stack([p[1] for p in positions])
+    return zenith, azimuth
+
+def fnGetExpectedProductionInterpolated(index, radiation, neighbours, weights, 
+                                        gridpoints, grid, orientation, tilt,
+                                        installation_capacity, solar_cache = None,
+                                        inverter_capacity = None, inverter_model = None,
+                                        inverters = None):
+    """ Calculates the expected PV production for installations with the 
+    radiation interpolated from the surrounding cells, see Grid.neighbours
+    - the solar position is that of the centre of the nearest gridpoint
+    @param index: pd datetimeindex: timestamps (UTC)
+    @param radiation: dict: 'diffuse' and 'downwelling' np array [time x cell]
+    @param neighbours, weights: np array [installation x 4]: columns in the 
+                                radiation and their weights
+    @param gridpoints: np array of int (installation): nearest gridpoints
+    @param grid: Grid
+    @param orientation, tilt, installation_capacity: np array (installation)
+    @param solar_cache: optional, solar position cache
+    @param inverter_capacity, inverter_model: optional np array (installation),
+                                              see fnGetExpectedProductionMatrix
+    @param inverters: InverterRegistry
+
+    @returns: np array: power in W [time x installation]
+    """
+    unique_gridpoints, cell = np.unique(gridpoints, return_inverse = True)
+    zenith, azimuth = fnSolarPositionBlock(index, unique_gridpoints, grid, solar_cache)
+
+    with timed("interpolation"):
+        downwelling = fnBlendRadiation(radiation['downwelling'], neighbours, weights)
+        diffuse = fnBlendRadiation(radiation['diffuse'], neighbours, weights)
+
+    installations = {"cell" : np.arange(len(cell)),
+                     "orientation" : orientation,
+                     "tilt" : tilt,
+                     "installation_capacity" : installation_capacity}
+    if inverter_capacity is not None:
+        installations["inverter_capacity"] = inverter_capacity
+    if inverter_model is not None:
+        installations["inverter_model"] = inverter_model
+    return fnGetExpectedProductionMatrix(downwelling, diffuse, 
+                                         zenith[:, cell], azimuth[:, cell],
+                                         installations, inverters = inverters)
+
+def fnGroupInstallations(cell, orientation, tilt, installation_capacity, 
+                         inverter_capacity, inverter_model, angle_step = 0.0):
+    """ groups installations that produce the same power per W of capacity:
+    same cell, inverter model, ratio of installation to inverter capacity 
+    and panel angles
+    - with angle_step > 0 the angles are grouped in steps of angle_step 
+      degrees, the angles of a group are the capacity weighted mean of its
+      installations
+    @param cell, inverter_model: np array of int (installation)
+    @param orientation, tilt, installation_capacity, inverter_capacity: 
+           np array (installation)
+    @param angle_step: float: degrees, 0 groups equal angles only
+
+    @returns: dict of np arrays (group): 'cell', 'orientation', 'tilt', 
+              'installation_capacity' and 'inverter_capacity' summed over 
+              the group, 'inverter_model', and 'group' (installation): the 
+              group of every installation
+    """
+    cell = np.asarray(cell, dtype=int)
+    orientation = np.asarray(orientation, dtype=float)
+    tilt = np.asarray(tilt, dtype=float)
+    installation_capacity = np.asarray(installation_capacity, dtype=float)
+    inverter_capacity = np.asarray(inverter_capacity, dtype=float)
+    inverter_model = np.asarray(inverter_model, dtype=int)
+
+    if angle_step > 0:
+        orientation_key = np.round(orientation / angle_step)
+        tilt_key = np.round(tilt / angle_step)
+    else:
+        orientation_key, tilt_key = orientation, tilt
+    ratio_key = np.round(installation_capacity / inverter_capacity, 6)
+
+    # consecutive equal keys after sorting form a group
+    keys = [tilt_key, orientation_key, ratio_key, inverter_model, cell]
+    order = np.lexsort(keys)
+    new_group = np.zeros(len(cell), dtype=bool)
+    new_group[:1] = True
+    for key in keys:
+        sorted_key = key[order]
+        new_group[1:] |= sorted_key[1:] != sorted_key[:-1]
+    group = np.empty(len(cell), dtype=int)
+    group[order] = np.cumsum(new_group) - 1
+    n_groups = int(group.max()) + 1 if len(group) else 0
+
+    first = order[new_group]
+    capacity = np.bincount(group, installation_capacity, n_groups)
+    mean_orientation = orientation[first]
+    mean_tilt = tilt[first]
+    if angle_step > 0:
+        weighted = capacity > 0
+        mean_orientation[weighted] = (np.bincount(group, orientation * installation_capacity, n_groups)
+                                      / np.where(weighted, capacity, 1))[weighted]
+        mean_tilt[weighted] = (np.bincount(group, tilt * installation_capacity, n_groups)
+                               / np.where(weighted, capacity, 1))[weighted]
+
+    return {"cell" : cell[first],
+            "orientation" : mean_orientation,
+            "tilt" : mean_tilt,
+            "installation_capacity" : capacity,
+            "inverter_capacity" : np.bincount(group, inverter_capacity, n_groups),
+            "inverter_model" : inverter_model[first],
+            "group" : group}
+
+def fnGetAggregatedProduction(downwelling, diffuse, zenith, azimuth, groups, 
+                              n_cells, performance_ratio = 0.78, inverters = None,
+                              max_values = 1e7):
+    """ Calculates the summed expected production per cell of groups of 
+    installations, see fnGroupInstallations
+    - the power of a group is that of one installation with the summed 
+      capacities, as it scales with the capacity at a fixed capacity ratio
+    - groups are computed in blocks of at most max_values values and added 
+      to their cell, so memory does not grow with the number of groups
+    @param downwelling, diffuse: np array [time x cell]: radiation in W/m2
+    @param zenith, azimuth: np array [time x cell]: solar position in degrees
+    @param groups: dict of np arrays (group), see fnGetExpectedProductionMatrix
+    @param n_cells: int: number of cells
+    @param performance_ratio: float
+    @param inverters: InverterRegistry
+    @param max_values: float: largest block [time x group] computed at once
+
+    @returns: np array: power in W [time x cell], NaN where radiation is 
+              missing
+    """
+    n_slots = np.shape(downwelling)[0]
+    power = np.zeros((n_slots, n_cells))
+
+    # groups by cell, so every block adds to consecutive runs of one cell
+    order = np.argsort(groups["cell"], kind = 'mergesort')
+    step = int(max(1, max_values // max(n_slots, 1)))
+    for begin in range(0, len(order), step):
+        part = order[begin:begin + step]
+        block = dict((name, np.asarray(groups[name])[part]) 
+                     for name in ["cell", "orientation", "tilt", "installation_capacity",
+                                  "inverter_capacity", "inverter_model"])
+        block_power = fnGetExpectedProductionMatrix(downwelling, diffuse, zenith, azimuth,
+                                                    block, performance_ratio, inverters)
+        cell = block["cell"]
+        starts = np.flatnonzero(np.concatenate(([True], cell[1:] != cell[:-1])))
+        power[:, cell[starts]] += np.add.reduceat(block_power, starts, axis = 1)
+
+    return power
+
+def fnGetPortfolioProduction(index, radiation, cells, groups, grid, 
+                             solar_cache = None, inverters = None):
+    """ Calculates the summed expected production per cell of groups of 
+    installations, with the solar position of the cell centres
+    @param index: pd datetimeindex: timestamps (UTC)
+    @param radiation: dict: 'diffuse' and 'downwelling' np array [time x cell]
+    @param cells: np array of int: gridpoints of the cells
+    @param groups: dict of np arrays, see fnGroupInstallations
+    @param grid: Grid
+    @param solar_cache: optional, solar position cache
+    @param inverters: InverterRegistry
+
+    @returns: np array: power in W [time x cell]
+    """
+    zenith, azimuth = fnSolarPositionBlock(index, cells, grid, solar_cache)
+    return fnGetAggregatedProduction(radiation['downwelling'], radiation['diffuse'],
+                                     zenith, azimuth, groups, len(cells), 
+                                     inverters = inverters)
@@ -0,0 +1,205 @@
+import numpy as np
+import pandas as pd
+import time
+
+from helper_functions import SLOTS_PER_DAY, SLOT_NS, DAY_NS
+from cache import LRUCache
+
+class RadiationCache(object):
+    """ radiation backend that keeps the radiation of a gridpoint per UTC day
+    in memory, in front of another backend
+    - a request only reads the days that are not cached, consecutive missing
+      days in one read, and stitches them to the cached days
+    - days that ended more than final_after seconds ago are kept until
+      evicted, more recent days expire after ttl seconds as radiation may
+      still arrive
+    - with a backend that counts the writes per day, like RadiationStore,
+      a day is read again as soon as it was written, by any process
+    """
+
+    VARIABLES = ("diffuse", "downwelling")
+
+    def __init__(self, backend, max_size = 50000, ttl = 60, final_after = 86400):
+        """
+        @param backend: radiation backend with get_radiation
+        @param max_size: int: maximum number of (gridpoint, day) entries
+        @param ttl: float: seconds a recent day is valid
+        @param final_after: float: seconds after the end of a day it is final
+        """
+        self.backend = backend
+        self.cache = LRUCache(max_size)
+        self.ttl = ttl
+        self.final_after = final_after
+
+    def get_radiation(self, gridpoint, time_begin, time_end):
+        """ returns radiation for gridpoint for time interval, like the backend
+        @param gridpoint: gridpoint [0:7999]
+        @param time_begin: pd datetime: begin of time interval
+        @param time_end: pd datetime: end of interval (included)
+
+        @returns: pd dataframe: with diffuse and downwelling radiation
+        """
+        index = pd.date_range(time_begin, time_end, freq = '15min')
+        ns = index.asi8
+        if len(ns) == 0 or (ns % SLOT_NS).any():
+            # not on the 15 minute grid, cannot be served per day
+            return self.backend.get_radiation(gridpoint, time_begin, time_end)
+
+        days = ns // DAY_NS
+        unique_days = np.unique(days)
+        versions = self._versions(unique_days)
+
+        blocks = dict()
+        missing = []
+        for day, version in zip(unique_days, versions):
+            block = self._get(gridpoint, day, version)
+            if block is None:
+                missing.append(day)
+            else:
+                blocks[day] = block
+        for day_begin, day_end in _consecutive(missing):
+            blocks.update(self._fetch(gridpoint, day_begin, day_end, versions, unique_days))
+
+        positions = np.searchsorted(unique_days, days)
+        stacked = np.array([blocks[day] for day in unique_days])
+        values = stacked[positions, (ns % DAY_NS) // SLOT_NS]
+
+        return pd.DataFrame(values, index = index, columns = self.VARIABLES)
+
+    def get_radiation_block(self, gridpoints, time_begin, time_end):
+        """ returns radiation for several gridpoints for time interval, like
+        the backend, the days that are not cached are read for all 
+        gridpoints missing them in one read of the backend
+        @param gridpoints: np array of int: gridpoints
+        @param time_begin: pd datetime: begin of time interval
+        @param time_end: pd datetime: end of interval (included)
+
+        @returns: pd datetimeindex, dict: variable -> np array [time x gridpoint]
+        """
+        index = pd.date_range(time_begin, time_end, freq = '15min')
+        ns = index.asi8
+        if len(ns) == 0 or (ns % SLOT_NS).any():
+            return self.backend.get_radiation_block(gridpoints, time_begin, time_end)
+
+        days = ns // DAY_NS
+        unique_days = np.unique(days)
+        versions = self._versions(unique_days)
+
+        # gridpoints by run of missing days
+        blocks = dict()
+        missing = dict()
+        for gridpoint in np.unique(gridpoints):
+            missing_days = []
+            for day, version in zip(unique_days, versions):
+                block = self._get(gridpoint, day, version)
+                if block is None:
+                    missing_days.append(day)
+                else:
+                    blocks[(gridpoint, day)] = block
+            for run in _consecutive(missing_days):
+                missing.setdefault(run, []).append(gridpoint)
+        for (day_begin, day_end), group in sorted(missing.items()):
+            blocks.update(self._fetch_block(group, day_begin, day_end, versions, unique_days))
+
+        positions = np.searchsorted(unique_days, days)
+        stacked = np.array([[blocks[(gridpoint, day)] for day in unique_days] 
+                            for gridpoint in gridpoints])
+        stacked = stacked[:, positions, (ns % DAY_NS) // SLOT_NS]
+
+        return index, dict((name, stacked[:, :, j].T) for j, name in enumerate(self.VARIABLES))
+
+    def invalidate(self, gridpoint, day):
+        """ forgets the cached radiation of gridpoint on day (days since epoch) """
+        self.cache.delete((gridpoint, day))
+
+    def data_version(self, time_begin, time_end):
+        """ returns the data version of the backend, see 
+        RadiationStore.data_version, None if the backend has none
+        """
+        if not hasattr(self.backend, 'data_version'):
+            return None
+        return self.backend.data_version(time_begin, time_end)
+
+    def _versions(self, days):
+        """ returns the write counters of the backend for days, zeros if the
+        backend has none
+        """
+        if not hasattr(self.backend, 'versions'):
+            return np.zeros(len(days), dtype=np.int64)
+        versions = self.backend.versions(days[0], days[-1])
+        return versions[days - days[0]]
+
+    def _get(self, gridpoint, day, version):
+        """ returns the cached day, None if not cached or written since """
+        entry = self.cache.get((gridpoint, day))
+        if entry is None:
+            return None
+        if entry[0] != version:
+            self.cache.delete((gridpoint, day))
+            return None
+        return entry[1]
+
+    def stats(self):
+        return self.cache.stats()
+
+    def _fetch(self, gridpoint, day_begin, day_end, versions, days):
+        """ reads whole days from the backend and caches them, with their 
+        versions read before
+
+        @returns: dict: day -> array [slot x variable]
+        """
+        time_begin = pd.Timestamp(int(day_begin) * DAY_NS, tz = 'UTC')
+        time_end = pd.Timestamp(int(day_end + 1) * DAY_NS - SLOT_NS, tz = 'UTC')
+        df = self.backend.get_radiation(gridpoint, time_begin, time_end)
+
+        return self._store(gridpoint, day_begin, df[list(self.VARIABLES)].values,
+                           versions, days)
+
+    def _fetch_block(self, gridpoints, day_begin, day_end, versions, days):
+        """ reads whole days of several gridpoints from the backend at once 
+        and caches them, with their versions read before
+
+        @returns: dict: (gridpoint, day) -> array [slot x variable]
+        """
+        time_begin = pd.Timestamp(int(day_begin) * DAY_NS, tz = 'UTC')
+        time_end = pd.Timestamp(int(day_end + 1) * DAY_NS - SLOT_NS, tz = 'UTC')
+        index, values = self.backend.get_radiation_block(gridpoints, time_begin, time_end)
+
+        blocks = dict()
+        for j, gridpoint in enumerate(gridpoints):
+            read = self._store(gridpoint, day_begin, 
+                               np.column_stack([values[name][:, j] for name in self.VARIABLES]),
+                               versions, days)
+            blocks.update(((gridpoint, day), block) for day, block in read.items())
+        return blocks
+
+    def _store(self, gridpoint, day_begin, values, versions, days):
+        """ caches whole days of radiation of a gridpoint
+        @param values: np array [slot x variable]: from the first slot of 
+                       day_begin
+        @param versions, days: np arrays: the version of every day
+
+        @returns: dict: day -> array [slot x variable]
+        """
+        n_days = len(values) // SLOTS_PER_DAY
+        values = values.reshape(n_days, SLOTS_PER_DAY, len(self.VARIABLES))
+
+        blocks = dict()
+        now = time.time()
+        for i in range(n_days):
+            day = day_begin + i
+            final = now - (day + 1) * DAY_NS / 1e9 > self.final_after
+            blocks[day] = values[i].copy()
+            version = versions[np.searchsorted(days, day)]
+            self.cache.put((gridpoint, day), (version, blocks[day]), None if final else self.ttl)
+        return blocks
+
+def _consecutive(days):
+    """ returns (first, last) of every run of consecutive days """
+    runs = []
+    for day in days:
+        if runs and day == runs[-1][1] + 1:
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return [tuple(run) for run in runs]
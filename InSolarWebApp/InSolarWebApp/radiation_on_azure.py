@@ -1,55 +1,11 @@
 import numpy as np 
 import pandas as pd
 import datetime as dt # used for rounding time
-import pvlib #the library of sandia, the us national laboratories
+import time
 
-from helper_functions import *
-
-def perdelta(start, end, delta, include):
-    """ returns generator for list of datetimes between start and end, 
-    in steps defined by delta
-    """
-    curr = start
-    if include:
-        while curr <= end:
-            yield curr
-            curr += delta
-    else:
-        while curr < end:
-            yield curr
-            curr += delta
-
-def fnLonLat2GridPoint(pars_grid, geo_long, geo_lat):
-    """ returns nearest gridpoint for given longitude and latitude
-    - distance is calculated using Manhattan city block distance (d1)
-    """
-    glong_min = pars_grid["glong_min"]
-    glong_max = pars_grid["glong_max"]
-    glat_min = pars_grid["glat_min"]
-    glat_max = pars_grid["glat_max"]
-    N_width = pars_grid["N_width"]
-    N_height = pars_grid["N_height"]  
-    
-    # set up grid
-    dlong = (glong_max - glong_min)/ N_width
-    dlat = (glat_max - glat_min)/ N_height
-          
-    long_grid = np.linspace(glong_min + 0.5*dlong,
-                             glong_max - 0.5*dlong,
-                             N_width)
-    
-    lat_grid = np.linspace(glat_min + 0.5*dlat,
-                             glat_max - 0.5*dlat,
-                             N_height)
-    
-    # calc distance               
-    long_distance = np.tile(abs(long_grid - geo_long), N_height)
-    lat_distance = np.repeat(abs(lat_grid - geo_lat) ,N_width)
-    dist_cityblock = long_distance + lat_distance
-    
-    # return index
-    gridpoint = dist_cityblock.argmin() 
-    return gridpoint
+from helper_functions import SLOT_NS
+from executor import map_io
+from metrics import AZURE_QUERIES, AZURE_PAGES, AZURE_ENTITIES, AZURE_PAGE_SECONDS
 
 def DoAzureQuery(table_service, storage_name, query_azure):
     """ performs the azure query and returns the timestamp and radiations
@@ -61,9 +17,9 @@ def DoAzureQuery(table_service, storage_name, query_azure):
     
     Azure returns a continuation token if a query returns more than 1000 
     entities. This functions will query while a continuation token is returned.
+    The pages, entities and page latencies are counted in metrics.
     """
     # initialize    
-    i=0
     next_pk = None
     next_rk = None
     diffuse = []
@@ -71,14 +27,17 @@ def DoAzureQuery(table_service, storage_name, query_azure):
     timestamp = []
 
     # make query, while checking for contiunation token
+    AZURE_QUERIES.inc()
     while True:
+        start = time.time()
         entities = table_service.query_entities(storage_name, 
                                                 query_azure, 
                                                 next_partition_key = next_pk, 
                                                 next_row_key = next_rk, 
                                                 top=1000)
-        i+=1
-        print i
+        AZURE_PAGE_SECONDS.observe(time.time() - start)
+        AZURE_PAGES.inc()
+        AZURE_ENTITIES.inc(len(entities))
         for entity in entities:
             timestamp.append(str(entity.RowKey))
             diffuse.extend([float(entity.diffuse)])
@@ -94,38 +53,168 @@ def DoAzureQuery(table_service, storage_name, query_azure):
     
     return timestamp, diffuse, downwelling
 
-def GetRadiationFromAzure(gridpoint, time_begin, time_end, storage_name, table_service):
+def fnPartitionKey(gridpoint, date):
+    """ returns the partition key of a gridpoint and day, e.g. 000001_20130101 """
+    return "{0:s}_{1:s}".format('%06d' %gridpoint, str(date).replace("-",""))
+
+def DoAzureQueryConcurrent(table_service, storage_name, gridpoint, date_begin, 
+                           date_end, max_workers, days_per_query = 10):
+    """ queries the partitions of gridpoint from date_begin up to and 
+    including date_end with parallel queries
+    @ param table_service:  This is the main class managing Table resources.
+    @ param storage_name: str: name of the table storage
+    @ param gridpoint: gridpoint [0:7999]
+    @ param date_begin, date_end: date: first and last day
+    @ param max_workers: int: maximum number of queries running at once
+    @ param days_per_query: int: days per sub-range, 10 days of 96 entities 
+      fit in one page of 1000
+    
+    @ returns: lists with timestamp, diffuse and downwelling, ordered by time
+    """
+    # split the partition range in consecutive sub-ranges
+    queries = []
+    day = date_begin
+    while day <= date_end:
+        day_next = min(day + dt.timedelta(days=days_per_query), 
+                       date_end + dt.timedelta(days=1))
+        queries.append("PartitionKey ge '{0:s}' and PartitionKey lt '{1:s}'"\
+                            .format(fnPartitionKey(gridpoint, day), 
+                                    fnPartitionKey(gridpoint, day_next)))
+        day = day_next
+
+    def query(query_azure):
+        return DoAzureQuery(table_service, storage_name, query_azure)
+
+    if max_workers <= 1 or len(queries) <= 1:
+        results = [query(query_azure) for query_azure in queries]
+    else:
+        results = map_io(query, queries, min(max_workers, len(queries)))
+
+    # map keeps the order of the sub-ranges, so the result is ordered by time
+    timestamp = []
+    diffuse = []
+    downwelling = []
+    for result in results:
+        timestamp.extend(result[0])
+        diffuse.extend(result[1])
+        downwelling.extend(result[2])
+
+    return timestamp, diffuse, downwelling
+
+def fnRowKeys2Time(row_keys):
+    """ converts RowKeys to nanoseconds since epoch, vectorized
+    @ param row_keys: list of str: RowKeys YYYYMMDD_HHMMSS, UTC
+    
+    @ returns: np array of int64
+    """
+    if len(row_keys) == 0:
+        return np.zeros(0, dtype=np.int64)
+    
+    # the characters of every RowKey as digits
+    digits = np.array(row_keys, dtype='S15').view(np.uint8).reshape(-1, 15)
+    digits = digits.astype(np.int64) - ord('0')
+    def number(first, last):
+        return np.dot(digits[:, first:last], 10**np.arange(last - first - 1, -1, -1))
+    year, month, day = number(0, 4), number(4, 6), number(6, 8)
+    hour, minute, second = number(9, 11), number(11, 13), number(13, 15)
+    
+    # days since 1970-01-01 of the proleptic Gregorian calendar, with years 
+    # starting in March so the leap day is the last day of the year
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * ((month + 9) % 12) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    days = era * 146097 + day_of_era - 719468
+    
+    return (((days * 24 + hour) * 60 + minute) * 60 + second) * 10**9
+
+def AssembleRadiation(index, timestamp, diffuse, downwelling):
+    """ places the radiation returned by Azure at the timestamps of index
+    @param index: pd datetimeindex: UTC timestamps in steps of 15 minutes
+    @param timestamp: list of str: RowKeys
+    @param diffuse, downwelling: lists: radiation, same order as timestamp
+    
+    @returns: pd dataframe: with diffuse and downwelling radiation, NaN 
+              where Azure returned nothing
+    """
+    values = np.empty((len(index), 2)) * np.nan
+    
+    if len(index) > 0 and len(timestamp) > 0:
+        # slot of every entity, counted from the first timestamp of index
+        offset = fnRowKeys2Time(timestamp) - index.asi8[0]
+        slot = offset // SLOT_NS
+        valid = (offset % SLOT_NS == 0) & (slot >= 0) & (slot < len(index))
+        values[slot[valid], 0] = np.asarray(diffuse, dtype=float)[valid]
+        values[slot[valid], 1] = np.asarray(downwelling, dtype=float)[valid]
+    
+    return pd.DataFrame(values, index = index, columns = ["diffuse", "downwelling"])
+
+def GetRadiationFromAzure(gridpoint, time_begin, time_end, storage_name, table_service,
+                          max_workers = 1):
     """ queries Azure table and writes to dataframe
     @param gridpoint: gridpoint [0:7999]
     @param time_begin: pd datetime: begin of time interval 
     @param time_end: pd datetime: end of interval
     @param table_name: str: name of azure table 
+    @param max_workers: int: with more than 1 the period is queried in 
+                        parallel sub-ranges, see DoAzureQueryConcurrent
 
     @returns: pd dataframe: with direct and diffuse radiation for gridpoint/time range
     """
 
     date_begin = time_begin.date()
     date_end = time_end.date()
-    partition_begin = "{0:s}_{1:s}".format('%06d' %gridpoint, str(date_begin).replace("-",""))
-    partition_end   = "{0:s}_{1:s}".format('%06d' %gridpoint, str(date_end + dt.timedelta(days=1)).replace("-",""))
-    datetimes = [x for x in perdelta(time_begin, time_end, dt.timedelta(minutes=15), include = True)]
-    
-    # pre-allocate dataframe with all datetimes
-    df = pd.DataFrame(index  = datetimes)
+    partition_begin = fnPartitionKey(gridpoint, date_begin)
+    partition_end   = fnPartitionKey(gridpoint, date_end + dt.timedelta(days=1))
     
     # get data from Azure for partitions range, e.g. 000001_20130101-000001_20140629
     query_azure = "PartitionKey ge '{0:s}' and PartitionKey lt '{1:s}'"\
                                         .format(partition_begin, partition_end)
     
-    timestamp, diffuse, downwelling = DoAzureQuery(table_service, storage_name, query_azure)   
-    
-    # insert in data frame
-    df_azure = pd.DataFrame({"downwelling": downwelling, "diffuse": diffuse})
-    timestamp = [pd.to_datetime(x.replace("_", ""), format =  '%Y%m%d%H%M%S') for x in timestamp]
-    df_azure.index = pd.DatetimeIndex(timestamp , tz = "UTC")
+    if max_workers > 1:
+        timestamp, diffuse, downwelling = DoAzureQueryConcurrent(table_service, storage_name, 
+                                                                 gridpoint, date_begin, 
+                                                                 date_end, max_workers)
+    else:
+        timestamp, diffuse, downwelling = DoAzureQuery(table_service, storage_name, query_azure)   
     
-    # merge and select data within request interval
-    df = pd.merge(df, df_azure, how='left', left_index=True, right_index = True)
-    df = df.ix[time_begin:time_end]
+    # place in the data frame of all datetimes of the request interval
+    index = pd.date_range(time_begin, time_end, freq = '15min')
+    df = AssembleRadiation(index, timestamp, diffuse, downwelling)
+
+    return df
+
+class AzureRadiationBackend(object):
+    """ radiation backend reading from the Azure table, see RadiationStore
+    for the local alternative
+    """
+
+    def __init__(self, table_service, storage_name, max_workers = 1):
+        self.table_service = table_service
+        self.storage_name = storage_name
+        self.max_workers = max_workers
+
+    def get_radiation(self, gridpoint, time_begin, time_end):
+        return GetRadiationFromAzure(gridpoint, time_begin, time_end, 
+                                     self.storage_name, self.table_service,
+                                     self.max_workers)
+
+    def get_radiation_block(self, gridpoints, time_begin, time_end):
+        """ reads several gridpoints with one query each, up to max_workers 
+        at once, see RadiationStore.get_radiation_block
+        """
+        def query(gridpoint):
+            return GetRadiationFromAzure(gridpoint, time_begin, time_end,
+                                         self.storage_name, self.table_service)
+        gridpoints = list(gridpoints)
+        if self.max_workers <= 1 or len(gridpoints) <= 1:
+            frames = [query(gridpoint) for gridpoint in gridpoints]
+        else:
+            frames = map_io(query, gridpoints, min(self.max_workers, len(gridpoints)))
 
-    return df
\ No newline at end of file
+        index = pd.date_range(time_begin, time_end, freq = '15min')
+        values = dict((name, np.column_stack([df[name].values for df in frames]) if frames 
+                             else np.zeros((len(index), 0)))
+                      for name in ["diffuse", "downwelling"])
+        return index, values
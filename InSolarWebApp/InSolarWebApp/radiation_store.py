@@ -0,0 +1,317 @@
+import numpy as np
+import pandas as pd
+import os
+import threading
+
+from helper_functions import SLOTS_PER_DAY, SLOT_NS, DAY_NS
+
+class RadiationStore(object):
+    """ local store with the MeteoSat radiation of all gridpoints
+    - one directory per year, with a memory mapped .npy array
+      [gridpoint x 15-minute slot] for diffuse and downwelling, so the data
+      of one gridpoint for a year is a single contiguous read
+    - present.npy [gridpoint x day] marks the days that have been written,
+      slots of other days read as NaN
+    - versions.npy [day] counts the writes to every day, caches keep the
+      version of what they read and read again when it changed, also when
+      another process wrote, see RadiationCache
+    - values are stored as float32
+    """
+
+    VARIABLES = ("diffuse", "downwelling")
+
+    def __init__(self, path, n_gridpoints = 8000):
+        """
+        @param path: str: root directory of the store
+        @param n_gridpoints: int: number of gridpoints, N_width * N_height
+        """
+        self.path = path
+        self.n_gridpoints = n_gridpoints
+        self._arrays = dict()
+        self._lock = threading.Lock()
+
+    def get_radiation(self, gridpoint, time_begin, time_end):
+        """ reads radiation for gridpoint for time interval
+        @param gridpoint: gridpoint [0:7999]
+        @param time_begin: pd datetime: begin of time interval
+        @param time_end: pd datetime: end of interval (included)
+
+        @returns: pd dataframe: with diffuse and downwelling radiation
+        """
+        index = pd.date_range(time_begin, time_end, freq = '15min')
+        values = self.read(gridpoint, index)
+
+        return pd.DataFrame(values, index = index, columns = self.VARIABLES)
+
+    def read(self, gridpoint, index):
+        """ reads radiation for gridpoint at the timestamps of index
+        @param gridpoint: gridpoint [0:7999]
+        @param index: pd datetimeindex: timestamps (UTC)
+
+        @returns: dict: variable -> np array, NaN where there is no data
+        """
+        ns = index.asi8
+        values = dict((name, np.empty(len(ns)) * np.nan) for name in self.VARIABLES)
+
+        years = np.asarray(index.year)
+        on_grid = (ns % SLOT_NS) == 0
+        for year in np.unique(years):
+            present = self._array(year, "present")
+            if present is None:
+                continue
+            positions = np.flatnonzero((years == year) & on_grid)
+            slots = (ns[positions] - _year_start(year)) // SLOT_NS
+            written = present[gridpoint, slots // SLOTS_PER_DAY]
+            positions, slots = positions[written], slots[written]
+            if len(slots) == 0:
+                continue
+
+            # read the covering range at once, it is contiguous on disk
+            first, last = slots.min(), slots.max()
+            for name in self.VARIABLES:
+                block = self._array(year, name)[gridpoint, first:last + 1]
+                values[name][positions] = block[slots - first]
+
+        return values
+
+    def get_radiation_block(self, gridpoints, time_begin, time_end):
+        """ reads radiation for several gridpoints for time interval at once
+        @param gridpoints: np array of int: gridpoints
+        @param time_begin: pd datetime: begin of time interval
+        @param time_end: pd datetime: end of interval (included)
+
+        @returns: pd datetimeindex, dict: variable -> np array [time x gridpoint]
+        """
+        index = pd.date_range(time_begin, time_end, freq = '15min')
+        return index, self.read_block(gridpoints, index)
+
+    def read_block(self, gridpoints, index):
+        """ reads radiation for several gridpoints at the timestamps of index,
+        the covering range of all gridpoints in one read per year
+        @param gridpoints: np array of int: gridpoints
+        @param index: pd datetimeindex: timestamps (UTC)
+
+        @returns: dict: variable -> np array [time x gridpoint], NaN where 
+                  there is no data
+        """
+        gridpoints = np.asarray(gridpoints, dtype=int)
+        ns = index.asi8
+        values = dict((name, np.empty((len(ns), len(gridpoints))) * np.nan) 
+                      for name in self.VARIABLES)
+
+        years = np.asarray(index.year)
+        on_grid = (ns % SLOT_NS) == 0
+        for year in np.unique(years):
+            present = self._array(year, "present")
+            if present is None:
+                continue
+            positions = np.flatnonzero((years == year) & on_grid)
+            if len(positions) == 0:
+                continue
+            slots = (ns[positions] - _year_start(year)) // SLOT_NS
+            # [time x gridpoint]
+            written = present[gridpoints][:, slots // SLOTS_PER_DAY].T
+
+            first, last = slots.min(), slots.max()
+            for name in self.VARIABLES:
+                block = self._array(year, name)[gridpoints, first:last + 1]
+                values[name][positions] = np.where(written, block[:, slots - first].T, np.nan)
+
+        return values
+
+    def write(self, gridpoint, index, values):
+        """ writes radiation for gridpoint
+        - days that were not written before are first cleared to NaN
+        @param gridpoint: gridpoint [0:7999]
+        @param index: pd datetimeindex: timestamps (UTC) on the 15-minute grid
+        @param values: dict: variable -> np array, same length as index
+        """
+        ns = index.asi8
+        if (ns % SLOT_NS).any():
+            raise ValueError("timestamps have to be on the 15 minute grid")
+
+        years = np.asarray(index.year)
+        for year in np.unique(years):
+            positions = np.flatnonzero(years == year)
+            slots = (ns[positions] - _year_start(year)) // SLOT_NS
+            days = np.unique(slots // SLOTS_PER_DAY)
+
+            present = self._array(year, "present", writable = True)
+            arrays = [self._array(year, name, writable = True) for name in self.VARIABLES]
+            for day in days[~present[gridpoint, days]]:
+                for array in arrays:
+                    array[gridpoint, day*SLOTS_PER_DAY:(day + 1)*SLOTS_PER_DAY] = np.nan
+            for name, array in zip(self.VARIABLES, arrays):
+                array[gridpoint, slots] = np.asarray(values[name])[positions]
+            present[gridpoint, days] = True
+            self._array(year, "versions", writable = True)[days] += 1
+
+    def write_frames(self, index, values):
+        """ writes radiation of all gridpoints at once, one frame of the
+        whole grid per timestamp
+        - days that were not written before are first cleared to NaN for the
+          gridpoints that had no data on them
+        @param index: pd datetimeindex: timestamps (UTC) on the 15-minute grid
+        @param values: dict: variable -> np array [time x gridpoint], NaN
+                       where a gridpoint has no data, which keeps what was
+                       written before
+        """
+        ns = index.asi8
+        if (ns % SLOT_NS).any():
+            raise ValueError("timestamps have to be on the 15 minute grid")
+        for name in self.VARIABLES:
+            if np.shape(values[name]) != (len(ns), self.n_gridpoints):
+                raise ValueError("%s has to be [time x gridpoint], %d x %d"
+                                 % (name, len(ns), self.n_gridpoints))
+
+        years = np.asarray(index.year)
+        for year in np.unique(years):
+            positions = np.flatnonzero(years == year)
+            slots = (ns[positions] - _year_start(year)) // SLOT_NS
+            days = np.unique(slots // SLOTS_PER_DAY)
+
+            present = self._array(year, "present", writable = True)
+            arrays = [self._array(year, name, writable = True) for name in self.VARIABLES]
+            for day in days:
+                new = np.flatnonzero(~present[:, day])
+                for array in arrays:
+                    array[new, day*SLOTS_PER_DAY:(day + 1)*SLOTS_PER_DAY] = np.nan
+            for name, array in zip(self.VARIABLES, arrays):
+                new = np.asarray(values[name])[positions].T
+                array[:, slots] = np.where(np.isnan(new), array[:, slots], new)
+            present[:, days] = True
+            # after the data, so a reader never keeps a day half written 
+            self._array(year, "versions", writable = True)[days] += 1
+
+    def versions(self, day_begin, day_end):
+        """ returns the write counters of the days from day_begin to day_end
+        (days since epoch, inclusive), 0 for days never written
+
+        @returns: np array of int
+        """
+        days = np.arange(day_begin, day_end + 1)
+        versions = np.zeros(len(days), dtype=np.int64)
+        years = np.asarray(pd.DatetimeIndex(days * DAY_NS).year)
+        for year in np.unique(years):
+            array = self._array(year, "versions")
+            if array is None:
+                continue
+            positions = np.flatnonzero(years == year)
+            versions[positions] = array[days[positions] - _year_start(year) // DAY_NS]
+        return versions
+
+    def data_version(self, time_begin, time_end):
+        """ returns a number that changes whenever radiation of a day of the
+        time interval is written
+        """
+        return int(self.versions(time_begin.value // DAY_NS, time_end.value // DAY_NS).sum())
+
+    def allocate(self, year):
+        """ creates the arrays of a year, e.g. before several processes write 
+        to it
+        """
+        for name in ("present", "versions") + tuple(self.VARIABLES):
+            self._array(year, name, writable = True)
+        self.flush()
+
+    def flush(self):
+        """ writes changes of all open arrays to disk """
+        with self._lock:
+            for array in self._arrays.values():
+                if array.mode != 'r':
+                    array.flush()
+
+    def _array(self, year, name, writable = False):
+        """ returns the memory mapped array of a year, None if it does not
+        exist and writable is False
+        """
+        key = (year, name, writable)
+        with self._lock:
+            if key in self._arrays:
+                return self._arrays[key]
+
+            filename = os.path.join(self.path, str(year), name + ".npy")
+            if os.path.exists(filename):
+                array = np.load(filename, mmap_mode = 'r+' if writable else 'r')
+            elif writable:
+                n_days = (_year_start(year + 1) - _year_start(year)) // DAY_NS
+                if name == "present":
+                    shape, dtype = (self.n_gridpoints, n_days), np.bool_
+                elif name == "versions":
+                    shape, dtype = (n_days,), np.int64
+                else:
+                    shape, dtype = (self.n_gridpoints, n_days * SLOTS_PER_DAY), np.float32
+                if not os.path.isdir(os.path.dirname(filename)):
+                    os.makedirs(os.path.dirname(filename))
+                array = np.lib.format.open_memmap(filename, mode = 'w+',
+                                                  dtype = dtype, shape = shape)
+            else:
+                # do not remember, the year may be written later on
+                return None
+
+            self._arrays[key] = array
+            return array
+
+def _year_start(year):
+    """ returns nanoseconds since epoch of 1 January 00:00 UTC of year """
+    return pd.Timestamp("%d-01-01" % year).value
+
+def ImportRadiationCSV(store, csv_file, gridpoint = None, dayfirst = False):
+    """ imports a MeteoSat csv file into the radiation store
+    - columns: datetime or time, diffuse, downwelling and, if gridpoint is
+      not given, the gridpoint in column longlat
+    - timestamps are rounded to the nearest 15-minute slot
+    @param store: RadiationStore
+    @param csv_file: str: path of the csv file, separated by , or ;
+    @param gridpoint: int: gridpoint of all rows, optional
+    @param dayfirst: bool: dates are written day first, e.g. 5-10-2015
+
+    @returns: int: number of rows imported
+    """
+    df = pd.read_csv(csv_file, sep = None, engine = 'python')
+    time_column = "datetime" if "datetime" in df.columns else "time"
+    times = pd.DatetimeIndex(pd.to_datetime(df[time_column], dayfirst = dayfirst))
+    ns = ((times.asi8 + SLOT_NS // 2) // SLOT_NS) * SLOT_NS
+    df.index = pd.DatetimeIndex(ns).tz_localize('UTC')
+
+    if gridpoint is not None:
+        df["longlat"] = gridpoint
+    for point, rows in df.groupby("longlat"):
+        store.write(int(point), rows.index,
+                    dict((name, rows[name].values) for name in store.VARIABLES))
+    store.flush()
+
+    return len(df)
+
+def ImportRadiationAzure(store, table_service, storage_name, gridpoints,
+                         date_begin, date_end):
+    """ imports radiation from the Azure table into the radiation store
+    @param store: RadiationStore
+    @param table_service: azure TableService
+    @param storage_name: str: name of the table storage
+    @param gridpoints: list: gridpoints to import
+    @param date_begin, date_end: date: first and last day to import
+
+    @returns: int: number of entities imported
+    """
+    from radiation_on_azure import DoAzureQuery, fnRowKeys2Time
+
+    n_entities = 0
+    for gridpoint in gridpoints:
+        query_azure = "PartitionKey ge '{0:06d}_{1:s}' and PartitionKey lt '{0:06d}_{2:s}'"\
+                            .format(gridpoint,
+                                    pd.Timestamp(date_begin).strftime("%Y%m%d"),
+                                    (pd.Timestamp(date_end) + pd.Timedelta(days = 1)).strftime("%Y%m%d"))
+        timestamp, diffuse, downwelling = DoAzureQuery(table_service, storage_name, query_azure)
+        if not timestamp:
+            continue
+
+        index = pd.DatetimeIndex(fnRowKeys2Time(timestamp)).tz_localize('UTC')
+        on_grid = (index.asi8 % SLOT_NS) == 0
+        store.write(gridpoint, index[on_grid],
+                    {"diffuse" : np.asarray(diffuse)[on_grid],
+                     "downwelling" : np.asarray(downwelling)[on_grid]})
+        n_entities += len(timestamp)
+    store.flush()
+
+    return n_entities
@@ -0,0 +1,199 @@
+"""
+Application wide resources: the parsed config file and the clients built
+from it, shared by all requests and threads.
+"""
+
+import json
+import os
+import re
+import threading
+
+from cache import ResponseCache
+from grid import Grid
+from inverters import InverterRegistry
+from metrics import AZURE_BYTES
+from radiation_on_azure import AzureRadiationBackend
+from radiation_store import RadiationStore
+from radiation_cache import RadiationCache
+from solar_position import SolarPositionCache, SolarTable
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "config.py")
+
+_lock = threading.RLock()
+_config = None
+_table_service = None
+_grid = None
+_inverters = None
+_radiation_backend = None
+_solar_cache = None
+_response_cache = None
+_portfolios = dict()
+
+def get_config():
+    """ returns the config, the config file is read on first use """
+    global _config
+    with _lock:
+        if _config is None:
+            config = dict()
+            execfile(CONFIG_FILE, config)
+            _config = config
+        return _config
+
+def reload_config():
+    """ reads the config file again, clients are rebuilt on next use
+    - the radiation cache is rebuilt with the radiation backend, the other 
+      caches are kept
+    """
+    global _config, _table_service, _grid, _inverters, _radiation_backend
+    with _lock:
+        _config = None
+        _table_service = None
+        _grid = None
+        _inverters = None
+        _radiation_backend = None
+        return get_config()
+
+def get_grid():
+    """ returns the radiation grid of the config file """
+    global _grid
+    with _lock:
+        if _grid is None:
+            _grid = Grid(get_config()['pars_grid'])
+        return _grid
+
+def get_inverters():
+    """ returns the inverter models: the default and those of the config """
+    global _inverters
+    with _lock:
+        if _inverters is None:
+            inverters = InverterRegistry()
+            for name, curve in sorted(get_config().get('inverter_models', {}).items()):
+                inverters.register(name, curve['load'], curve['efficiency'])
+            _inverters = inverters
+        return _inverters
+
+def get_table_service():
+    """ returns the shared TableService
+    - its requests session keeps connections alive, pooled up to the
+      number of parallel queries
+    - the bytes of all responses are counted in metrics
+    - the Azure SDK is imported on first use, a local radiation store does
+      not need it
+    """
+    global _table_service
+    with _lock:
+        if _table_service is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from azure.storage.table import TableService
+
+            config = get_config()
+            pool_size = max(10, config.get('azure_query_workers', 1))
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections = pool_size, pool_maxsize = pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.hooks['response'].append(_count_response_bytes)
+            _table_service = TableService(account_name=config['account_name'],
+                                          account_key=config['account_key'],
+                                          request_session=session)
+        return _table_service
+
+def set_table_service(table_service):
+    """ replaces the shared TableService, e.g. by a FakeTableService to run
+    without Azure, the radiation backend is rebuilt on next use
+    """
+    global _table_service, _radiation_backend
+    with _lock:
+        _table_service = table_service
+        _radiation_backend = None
+
+def _count_response_bytes(response, *args, **kwargs):
+    AZURE_BYTES.inc(len(response.content))
+
+def get_radiation_backend():
+    """ returns the radiation backend selected in the config file, behind
+    the radiation cache unless radiation_cache_size is 0
+    """
+    global _radiation_backend
+    with _lock:
+        if _radiation_backend is None:
+            config = get_config()
+            if config.get('radiation_backend', 'azure') == 'local':
+                path = os.path.join(os.path.dirname(CONFIG_FILE), config['radiation_store_path'])
+                pars_grid = config['pars_grid']
+                backend = RadiationStore(path, pars_grid["N_width"]*pars_grid["N_height"])
+            else:
+                backend = AzureRadiationBackend(get_table_service(), config['storage_name'],
+                                                config.get('azure_query_workers', 1))
+            if config.get('radiation_cache_size', 0) > 0:
+                backend = RadiationCache(backend, config['radiation_cache_size'],
+                                         config.get('response_cache_ttl', 60),
+                                         config.get('response_cache_final_after', 86400))
+            _radiation_backend = backend
+        return _radiation_backend
+
+def get_radiation_store():
+    """ returns the local radiation store of the radiation backend, None
+    if the radiation is read from Azure
+    """
+    backend = get_radiation_backend()
+    store = backend.backend if isinstance(backend, RadiationCache) else backend
+    return store if isinstance(store, RadiationStore) else None
+
+def get_solar_cache():
+    """ returns the solar position cache of gridpoint centres, reading from 
+    the solar tables of precompute_solar.py when they exist
+    """
+    global _solar_cache
+    with _lock:
+        if _solar_cache is None:
+            config = get_config()
+            table = None
+            if config.get('solar_table_path'):
+                path = os.path.join(os.path.dirname(CONFIG_FILE), config['solar_table_path'])
+                pars_grid = config['pars_grid']
+                table = SolarTable(path, pars_grid["N_width"]*pars_grid["N_height"])
+            _solar_cache = SolarPositionCache(config.get('solar_cache_size', 50000), table)
+        return _solar_cache
+
+def get_response_cache():
+    """ returns the cache of GetPVProduction responses """
+    global _response_cache
+    with _lock:
+        if _response_cache is None:
+            config = get_config()
+            _response_cache = ResponseCache(config.get('response_cache_size', 10000),
+                                            config.get('response_cache_ttl', 60),
+                                            config.get('response_cache_final_after', 86400),
+                                            config.get('response_cache_bytes', 64 * 2**20))
+        return _response_cache
+
+def get_portfolio(portfolio_id):
+    """ returns the installations of a stored portfolio, a list of dicts like
+    the installations of /GetPVProductionBatch
+    - a portfolio is the JSON file <portfolio_id>.json in portfolio_path,
+      with a list of installations or {"installations": [...]}
+    - files are parsed again when they changed
+
+    @returns: list, None if there is no such portfolio
+    """
+    if not re.match(r"^[A-Za-z0-9_\-]+$", str(portfolio_id)):
+        return None
+    path = os.path.join(os.path.dirname(CONFIG_FILE), get_config().get('portfolio_path', 'portfolios'),
+                        "%s.json" % portfolio_id)
+    try:
+        modified = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _lock:
+        cached = _portfolios.get(path)
+        if cached is not None and cached[0] == modified:
+            return cached[1]
+    with open(path) as f:
+        installations = json.load(f)
+    if isinstance(installations, dict):
+        installations = installations['installations']
+    with _lock:
+        _portfolios[path] = (modified, installations)
+    return installations
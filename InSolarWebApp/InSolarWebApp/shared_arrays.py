@@ -0,0 +1,100 @@
+"""
+Passes numpy arrays and dataframes to other processes through memory mapped
+files in shared memory (/dev/shm where it exists), instead of pickling their
+data through a pipe. Only the path, dtype and shape are pickled.
+"""
+
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+# smaller arrays are pickled, a file costs more than copying them
+MIN_SHARED_BYTES = 64 * 1024
+
+class SharedArray(object):
+    """ a numpy array in a memory mapped file """
+
+    def __init__(self, array):
+        fd, self.path = tempfile.mkstemp(prefix = "insolar_", suffix = ".dat", dir = SHM_DIR)
+        os.close(fd)
+        self.dtype = array.dtype.str
+        self.shape = array.shape
+        mapped = np.memmap(self.path, dtype = self.dtype, mode = 'w+', shape = self.shape)
+        mapped[...] = array
+        del mapped
+
+    def load(self, copy = False):
+        """ returns the array, mapped copy on write, or copied into memory """
+        mapped = np.memmap(self.path, dtype = self.dtype, mode = 'c', shape = self.shape)
+        return np.array(mapped) if copy else mapped
+
+    def release(self):
+        """ removes the file, arrays loaded without copy stay valid on posix """
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+class SharedFrame(object):
+    """ a dataframe with its columns and index in shared arrays """
+
+    def __init__(self, df):
+        self.columns = list(df.columns)
+        self.values = [share(df[column].values) for column in self.columns]
+        self.index = share(df.index.asi8) if isinstance(df.index, pd.DatetimeIndex) else df.index
+        self.tz = str(df.index.tz) if getattr(df.index, 'tz', None) is not None else None
+
+    def load(self, copy = False):
+        index = unshare(self.index, copy)
+        if not isinstance(index, pd.Index):
+            index = pd.DatetimeIndex(index)
+            if self.tz is not None:
+                index = index.tz_localize('UTC').tz_convert(self.tz)
+        return pd.DataFrame(dict((column, unshare(values, copy))
+                                 for column, values in zip(self.columns, self.values)),
+                            index = index, columns = self.columns)
+
+    def release(self):
+        release(self.values)
+        release(self.index)
+
+def share(value):
+    """ returns value with large numpy arrays and dataframes, also within
+    tuples, lists and dicts, replaced by shared handles, see unshare
+    """
+    if isinstance(value, np.ndarray) and value.dtype != object and value.nbytes >= MIN_SHARED_BYTES:
+        return SharedArray(value)
+    if isinstance(value, pd.DataFrame):
+        return SharedFrame(value)
+    if isinstance(value, (tuple, list)):
+        return type(value)(share(item) for item in value)
+    if isinstance(value, dict):
+        return dict((key, share(item)) for key, item in value.items())
+    return value
+
+def unshare(value, copy = False):
+    """ returns value with the shared handles of share replaced by the arrays
+    and dataframes, mapped or with copy copied into memory
+    """
+    if isinstance(value, (SharedArray, SharedFrame)):
+        return value.load(copy)
+    if isinstance(value, (tuple, list)):
+        return type(value)(unshare(item, copy) for item in value)
+    if isinstance(value, dict):
+        return dict((key, unshare(item, copy)) for key, item in value.items())
+    return value
+
+def release(value):
+    """ removes the files of the shared handles in value """
+    if isinstance(value, (SharedArray, SharedFrame)):
+        value.release()
+    elif isinstance(value, (tuple, list)):
+        for item in value:
+            release(item)
+    elif isinstance(value, dict):
+        for item in value.values():
+            release(item)
@@ -0,0 +1,190 @@
+import numpy as np 
+import pandas as pd
+
+from helper_functions import SLOTS_PER_DAY, SLOT_NS, DAY_NS
+from cache import LRUCache
+from radiation_store import RadiationStore, _year_start
+from radiation_cache import _consecutive
+
+def fnSunPosition(index, geo_lat, geo_long):
+    """ returns solar zenith and azimuth in degrees for a datetimeindex
+    @param index: pd datetimeindex: timestamps (UTC)
+    @param geo_lat, geo_long: float: location
+
+    @returns: np arrays: zenith, azimuth
+    """
+    import pvlib # loaded on first use, see startup.py
+    location = pvlib.location.Location(geo_lat, geo_long, 'Europe/Amsterdam')
+    sun_position = pvlib.solarposition.ephemeris(index, location)
+    
+    return sun_position.zenith.values, sun_position.azimuth.values
+
+class SolarTable(RadiationStore):
+    """ precomputed solar geometry of the gridpoint centres, for every 
+    15-minute slot, see precompute_solar.py
+    - same layout as the radiation store: per year a memory mapped array
+      [gridpoint x slot] per variable and present.npy [gridpoint x day]
+    - values are float32, differences with the ephemeris are about 1e-5 
+      degree
+    - the clear sky irradiance is not stored, gap filling derives it from 
+      the zenith, see gap_filling.fnClearSkyGHI
+    """
+
+    VARIABLES = ("zenith", "azimuth")
+
+    def compute(self, gridpoint, geo_long, geo_lat, year):
+        """ computes and writes the solar position of a gridpoint for a year
+        @param gridpoint: gridpoint [0:7999]
+        @param geo_long, geo_lat: float: centre of the gridpoint
+        @param year: int: year
+        """
+        n_slots = (_year_start(year + 1) - _year_start(year)) // SLOT_NS
+        index = pd.date_range(pd.Timestamp(_year_start(year), tz = 'UTC'),
+                              periods = n_slots, freq = '15min')
+        zenith, azimuth = fnSunPosition(index, geo_lat, geo_long)
+        self.write(gridpoint, index, {"zenith" : zenith, "azimuth" : azimuth})
+
+    def is_complete(self, gridpoint, year):
+        """ returns True if all days of year are present for gridpoint """
+        present = self._array(year, "present")
+        return present is not None and bool(present[gridpoint].all())
+
+    def written(self, day_begin, day_end):
+        """ returns a bool array [gridpoint], True where any day from 
+        day_begin to day_end (inclusive, days since epoch) is present
+        """
+        written = np.zeros(self.n_gridpoints, dtype = bool)
+        for day in range(int(day_begin), int(day_end) + 1):
+            year = pd.Timestamp(day * DAY_NS).year
+            present = self._array(year, "present")
+            if present is not None:
+                written |= present[:, day - _year_start(year) // DAY_NS]
+        return written
+
+class SolarPositionCache(object):
+    """ caches the solar position of gridpoint centres
+    - an entry holds zenith and azimuth for the 96 15-minute slots of one UTC 
+      day, keyed by (gridpoint, day number since epoch)
+    - missing days are read from the solar table, if given, and otherwise
+      computed with one ephemeris call per run of consecutive missing days
+    """
+
+    def __init__(self, max_size = 50000, table = None):
+        """
+        @param max_size: int: maximum number of (gridpoint, day) entries
+        @param table: SolarTable: precomputed solar geometry, optional
+        """
+        self.cache = LRUCache(max_size)
+        self.table = table
+
+    def get(self, gridpoint, geo_long, geo_lat, index):
+        """ returns solar position for the centre of a gridpoint
+        @param gridpoint: int: gridpoint, used as cache key
+        @param geo_long, geo_lat: float: centre of the gridpoint
+        @param index: pd datetimeindex: timestamps (UTC)
+
+        @returns: np arrays: zenith, azimuth
+        """
+        ns = index.asi8
+        if len(ns) == 0 or (ns % SLOT_NS).any():
+            # not on the 15 minute grid, cannot be served from the cache
+            return fnSunPosition(index, geo_lat, geo_long)
+
+        days = ns // DAY_NS
+        slots = (ns % DAY_NS) // SLOT_NS
+        unique_days = np.unique(days)
+
+        blocks = dict()
+        missing = []
+        for day in unique_days:
+            block = self.cache.get((gridpoint, day))
+            if block is None:
+                missing.append(day)
+            else:
+                blocks[day] = block
+        # runs of consecutive missing days, days cached in between are not
+        # read or computed again
+        if missing and self.table is not None:
+            for day_begin, day_end in _consecutive(missing):
+                blocks.update(self._read(gridpoint, day_begin, day_end))
+            missing = [day for day in missing if day not in blocks]
+        for day_begin, day_end in _consecutive(missing):
+            blocks.update(self._compute(gridpoint, geo_long, geo_lat, 
+                                        day_begin, day_end))
+
+        positions = np.searchsorted(unique_days, days)
+        stacked = np.array([blocks[day] for day in unique_days])
+        return stacked[positions, 0, slots], stacked[positions, 1, slots]
+
+    def precompute(self, gridpoints, pars_grid, date_begin, date_end):
+        """ fills the cache for gridpoints over a period, e.g. a whole year
+        @param gridpoints: list: gridpoints to compute
+        @param pars_grid: dict: grid parameters
+        @param date_begin, date_end: date: first and last day to compute
+        """
+        from grid import Grid
+
+        grid = Grid(pars_grid)
+        day_begin = pd.Timestamp(date_begin).value // DAY_NS
+        day_end = pd.Timestamp(date_end).value // DAY_NS
+        for gridpoint in gridpoints:
+            geo_long, geo_lat = grid.centre(gridpoint)
+            self._compute(gridpoint, geo_long, geo_lat, day_begin, day_end)
+
+    def preload(self, gridpoints, date_begin, date_end):
+        """ fills the cache for gridpoints over a period from the solar table, 
+        days that are not in the table are left out
+        @param gridpoints: list: gridpoints to read
+        @param date_begin, date_end: date: first and last day to read
+
+        @returns: int: number of (gridpoint, day) entries read
+        """
+        if self.table is None:
+            return 0
+        day_begin = pd.Timestamp(date_begin).value // DAY_NS
+        day_end = pd.Timestamp(date_end).value // DAY_NS
+        written = self.table.written(day_begin, day_end)
+        return sum(len(self._read(gridpoint, day_begin, day_end)) 
+                   for gridpoint in gridpoints if written[gridpoint])
+
+    def stats(self):
+        return self.cache.stats()
+
+    def _read(self, gridpoint, day_begin, day_end):
+        """ reads the days from day_begin to day_end (inclusive) that are in 
+        the solar table and stores them
+
+        @returns: dict: day -> array [zenith/azimuth x slot]
+        """
+        n_days = int(day_end - day_begin + 1)
+        index = pd.date_range(pd.Timestamp(int(day_begin) * DAY_NS, tz = 'UTC'),
+                              periods = n_days * SLOTS_PER_DAY, freq = '15min')
+        values = self.table.read(gridpoint, index)
+        zenith = values["zenith"].reshape(n_days, SLOTS_PER_DAY)
+        azimuth = values["azimuth"].reshape(n_days, SLOTS_PER_DAY)
+
+        blocks = dict()
+        for i in np.flatnonzero(~np.isnan(zenith).any(axis = 1)):
+            day = day_begin + i
+            blocks[day] = np.array([zenith[i], azimuth[i]])
+            self.cache.put((gridpoint, day), blocks[day])
+        return blocks
+
+    def _compute(self, gridpoint, geo_long, geo_lat, day_begin, day_end):
+        """ computes and stores all days from day_begin to day_end (inclusive)
+        
+        @returns: dict: day -> array [zenith/azimuth x slot]
+        """
+        n_days = int(day_end - day_begin + 1)
+        index = pd.date_range(pd.Timestamp(int(day_begin) * DAY_NS, tz = 'UTC'),
+                              periods = n_days * SLOTS_PER_DAY, freq = '15min')
+        zenith, azimuth = fnSunPosition(index, geo_lat, geo_long)
+        zenith = zenith.reshape(n_days, SLOTS_PER_DAY)
+        azimuth = azimuth.reshape(n_days, SLOTS_PER_DAY)
+
+        blocks = dict()
+        for i in range(n_days):
+            day = day_begin + i
+            blocks[day] = np.array([zenith[i], azimuth[i]])
+            self.cache.put((gridpoint, day), blocks[day])
+        return blocks
@@ -0,0 +1,88 @@
+"""
+Startup of a worker: the seconds spent in the phases of importing and
+warming up the application, reported at /startupReport and in /metrics.
+
+Heavy libraries that not every request needs, like pvlib and the Azure SDK,
+are imported on first use. numpy and pandas are used by every request and
+are imported with the package. warm_up loads the others, together with the
+config, the grid, the radiation backend and the caches, so the first request
+does not wait for them. It is called by runserver.py and serve_async.py
+before they accept requests. A WSGI host only calls it when it is configured
+with the handler InSolarWebApp.warm_app(), see there.
+"""
+
+import time
+from contextlib import contextmanager
+
+from metrics import STARTUP_SECONDS
+
+# time this module was imported, the first thing the application imports
+_started = time.time()
+_phases = []
+_ready = None
+
+@contextmanager
+def phase(name):
+    """ times the enclosed block as a phase of the startup """
+    start = time.time()
+    try:
+        yield
+    finally:
+        seconds = time.time() - start
+        _phases.append((name, seconds))
+        STARTUP_SECONDS.set(seconds, phase = name)
+
+def warm_up():
+    """ loads everything the first request would otherwise wait for:
+    - the config, grid and inverter curves
+    - the radiation backend, with the Azure SDK or the radiation store
+    - the solar tables of the last warm_up_solar_days days of all gridpoints
+    - pvlib, pandas and the serialization, by computing one day of one
+      installation
+    """
+    global _ready
+    import numpy as np
+    import pandas as pd
+    from resources import get_config, get_grid, get_inverters, get_radiation_backend, \
+                          get_solar_cache, get_response_cache
+
+    with phase("warm_up_config"):
+        config = get_config()
+        grid = get_grid()
+        inverters = get_inverters()
+        get_response_cache()
+
+    with phase("warm_up_radiation_backend"):
+        get_radiation_backend()
+
+    with phase("warm_up_solar_tables"):
+        solar_cache = get_solar_cache()
+        days = config.get('warm_up_solar_days', 0)
+        if days > 0:
+            today = pd.Timestamp(time.time() * 10**9).normalize()
+            solar_cache.preload(range(grid.n_gridpoints),
+                                today - pd.Timedelta(days = days - 1), today)
+
+    with phase("warm_up_model"):
+        from model import fnGetExpectedProduction
+        from helper_functions import ConvertToJSON
+
+        gridpoint = grid.n_gridpoints // 2
+        geo_long, geo_lat = grid.centre(gridpoint)
+        index = pd.date_range("2015-06-21", periods = 96, freq = "15min", tz = "UTC")
+        df = pd.DataFrame({"diffuse" : np.zeros(len(index)),
+                           "downwelling" : np.zeros(len(index))}, index = index)
+        df = fnGetExpectedProduction(df, geo_long, geo_lat, 180.0, 30.0, 1000.0,
+                                     config['pars_grid'], inverters = inverters, grid = grid)
+        ConvertToJSON(df[["power"]])
+
+    _ready = time.time()
+    STARTUP_SECONDS.set(_ready - _started, phase = "total")
+
+def startup_report():
+    """ returns the startup phases as a dict: seconds per phase in order,
+    and the seconds from the import of the application until warm_up ended,
+    None if it did not run
+    """
+    return {"phases" : [{"phase" : name, "seconds" : seconds} for name, seconds in _phases],
+            "readySeconds" : None if _ready is None else _ready - _started}
@@ -0,0 +1,92 @@
+"""
+This script recomputes the expected production of all installations of a
+csv file over a period from the local radiation store, e.g. after a change
+of the model parameters
+
+    python backfill.py installations.csv output --begin 2015-01-01 --end 2015-12-31 --processes 8
+    python backfill.py installations.csv output_pr80 --begin 2015-01-01 --end 2015-12-31 --performance-ratio 0.80
+
+The csv has the columns of the batch API: id, longitude, latitude,
+orientation, tilt, installationCapacity and optional inverterCapacity and
+inverterModel. The results are written per month, as csv or with --format
+parquet as parquet (needs pyarrow), see InSolarWebApp/backfill.py. Files
+that are complete are skipped, so an interrupted run continues where it
+stopped. The throughput is reported in installation-years per minute.
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+
+from InSolarWebApp.backfill import Backfill, CheckManifest, FileHash, InitWorker, \
+                                   InstallationYearsPerMinute, OutputFormat, ReadInstallations
+from InSolarWebApp.grid import Grid
+from InSolarWebApp.resources import CONFIG_FILE, get_config, get_inverters
+
+def Report(status):
+    """ writes the progress to stderr about every percent of the tasks """
+    step = max(1, (status["tasks"] - status["skipped"]) // 100)
+    if status["done"] % step == 0 or status["done"] + status["skipped"] == status["tasks"]:
+        sys.stderr.write("%d of %d tasks, %.1f installation-years in %.1f s, %.1f installation-years/min\n"
+                         % (status["done"] + status["skipped"], status["tasks"],
+                            status["installation_years"], status["seconds"],
+                            InstallationYearsPerMinute(status)))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "recompute the production of installations")
+    parser.add_argument("installations", help = "csv file with the installations")
+    parser.add_argument("output", help = "output directory")
+    parser.add_argument("--begin", required = True, help = "first day, YYYY-MM-DD")
+    parser.add_argument("--end", required = True, help = "last day, YYYY-MM-DD")
+    parser.add_argument("--store", help = "store directory, default radiation_store_path of config.py")
+    parser.add_argument("--solar-tables", help = "solar table directory, default solar_table_path of config.py")
+    parser.add_argument("--format", choices = ["csv", "parquet"], default = "csv",
+                        help = "output format, parquet needs pyarrow")
+    parser.add_argument("--performance-ratio", type = float, default = 0.78, help = "see fnGTI2DC")
+    parser.add_argument("--cells-per-task", type = int, default = 50,
+                        help = "gridpoints computed together, the unit of resuming")
+    parser.add_argument("--max-values", type = float, default = 1e7,
+                        help = "largest block [time x installation] computed at once")
+    parser.add_argument("--processes", type = int, default = multiprocessing.cpu_count())
+    args = parser.parse_args()
+
+    config = get_config()
+    pars_grid = config['pars_grid']
+    root = os.path.dirname(CONFIG_FILE)
+    store_path = args.store or os.path.join(root, config['radiation_store_path'])
+    solar_table_path = args.solar_tables or \
+                       (config.get('solar_table_path') and os.path.join(root, config['solar_table_path']))
+    try:
+        output_format = OutputFormat(args.format)
+    except ValueError as e:
+        sys.exit(str(e))
+    inverters = get_inverters()
+
+    installations, skipped = ReadInstallations(args.installations, Grid(pars_grid), inverters)
+    for installation_id, error in skipped:
+        sys.stderr.write("skipped installation %s: %s\n" % (installation_id, error))
+    try:
+        CheckManifest(args.output, {"installations" : FileHash(args.installations),
+                                    "performance_ratio" : args.performance_ratio,
+                                    "cells_per_task" : args.cells_per_task,
+                                    "format" : output_format,
+                                    "inverter_models" : config.get('inverter_models', {})})
+    except ValueError as e:
+        sys.exit(str(e))
+
+    pool = None
+    if args.processes > 0:
+        pool = multiprocessing.Pool(args.processes, InitWorker,
+                                    (store_path, solar_table_path, pars_grid, inverters))
+    status = Backfill(installations, args.output, store_path, solar_table_path, pars_grid,
+                      inverters, args.begin, args.end, pool, output_format,
+                      args.cells_per_task, args.performance_ratio, args.max_values, Report)
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    print("computed %d tasks (%d were done) of %d installations into %s in %.1f s, "
+          "%.1f installation-years/min"
+          % (status["done"], status["skipped"], len(installations["id"]), args.output,
+             status["seconds"], InstallationYearsPerMinute(status)))
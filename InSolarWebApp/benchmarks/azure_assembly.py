@@ -0,0 +1,68 @@
+"""
+Times placing the Azure query result in the radiation dataframe: the
+previous merge of two dataframes against AssembleRadiation, e.g.
+
+    python benchmarks/azure_assembly.py --repeat 5
+
+Both get the same RowKeys, a 15-minute grid with some missing entities,
+and must return the same dataframe.
+"""
+
+import argparse
+import datetime as dt
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from InSolarWebApp.helper_functions import perdelta
+from InSolarWebApp.radiation_on_azure import AssembleRadiation
+from timing import Best
+
+def MergeRadiation(time_begin, time_end, timestamp, diffuse, downwelling):
+    """ the assembly of GetRadiationFromAzure before AssembleRadiation """
+    datetimes = [x for x in perdelta(time_begin, time_end, dt.timedelta(minutes=15), include = True)]
+    df = pd.DataFrame(index  = datetimes)
+
+    df_azure = pd.DataFrame({"downwelling": downwelling, "diffuse": diffuse})
+    timestamp = [pd.to_datetime(x.replace("_", ""), format =  '%Y%m%d%H%M%S') for x in timestamp]
+    df_azure.index = pd.DatetimeIndex(timestamp , tz = "UTC")
+
+    df = pd.merge(df, df_azure, how='left', left_index=True, right_index = True)
+    return df.ix[time_begin:time_end]
+
+def QueryResult(time_begin, time_end, missing = 0.05, seed = 0):
+    """ returns RowKeys, diffuse and downwelling like DoAzureQuery, with a
+    fraction missing of the entities left out
+    """
+    random = np.random.RandomState(seed)
+    index = pd.date_range(time_begin, time_end, freq = '15min')
+    index = index[random.rand(len(index)) >= missing]
+    timestamp = [x.strftime('%Y%m%d_%H%M%S') for x in index]
+    return timestamp, random.rand(len(index)).tolist(), random.rand(len(index)).tolist()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "benchmark the assembly of the Azure radiation")
+    parser.add_argument("--repeat", type = int, default = 3)
+    args = parser.parse_args()
+
+    time_begin = pd.Timestamp("2015-01-01 00:00", tz = "UTC")
+    for days in [1, 7, 31, 365]:
+        time_end = time_begin + pd.Timedelta(days = days) - pd.Timedelta(minutes = 15)
+        timestamp, diffuse, downwelling = QueryResult(time_begin, time_end)
+
+        merged, merge_time = Best(lambda: MergeRadiation(time_begin, time_end, timestamp,
+                                                         diffuse, downwelling), args.repeat)
+        index = pd.date_range(time_begin, time_end, freq = '15min')
+        assembled, assemble_time = Best(lambda: AssembleRadiation(index, timestamp,
+                                                                  diffuse, downwelling), args.repeat)
+
+        identical = list(merged.columns) == list(assembled.columns) and \
+                    (merged.index == assembled.index).all() and \
+                    np.array_equal(np.isnan(merged.values), np.isnan(assembled.values)) and \
+                    (np.nan_to_num(merged.values) == np.nan_to_num(assembled.values)).all()
+        print("%4d days: merge %8.2f ms, aligned arrays %6.2f ms, %6.1f x, identical: %s" %
+              (days, 1000*merge_time, 1000*assemble_time, merge_time / assemble_time, identical))
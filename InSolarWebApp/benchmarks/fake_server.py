@@ -0,0 +1,61 @@
+"""
+Runs the application against a FakeTableService filled with
+MeteoSat_29696.csv, for load tests without Azure, e.g.
+
+    python benchmarks/fake_server.py gevent --port 5556 --latency 0.05
+
+The server is the development server of runserver.py (sync) or the gevent
+server of serve_async.py (gevent). Every query of the fake table sleeps
+--latency seconds, like a round trip to Azure. The radiation and response
+caches are off unless --cache is given, so every request queries the table.
+"""
+
+import sys
+if __name__ == '__main__' and sys.argv[1:2] == ["gevent"]:
+    # before anything imports socket or threading
+    from gevent import monkey
+    monkey.patch_all(thread = False)
+
+import argparse
+import os
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from InSolarWebApp import app, warm_up
+from InSolarWebApp.fake_table_service import LoadFakeTableService
+from InSolarWebApp.grid import Grid
+from InSolarWebApp.resources import get_config, set_table_service
+
+CSV_FILE = os.path.join(ROOT, "InSolarWebApp", "MeteoSat_29696.csv")
+
+def LoadTestCells(pars_grid, n_cells):
+    """ returns the gridpoints with radiation in the fake table """
+    return np.linspace(0, Grid(pars_grid).n_gridpoints - 1, n_cells).astype(int)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "serve the application on a fake Azure table")
+    parser.add_argument("mode", choices = ["sync", "gevent"])
+    parser.add_argument("--host", default = "localhost")
+    parser.add_argument("--port", type = int, default = 5556)
+    parser.add_argument("--latency", type = float, default = 0.05, help = "seconds per table query")
+    parser.add_argument("--cells", type = int, default = 20, help = "gridpoints with radiation")
+    parser.add_argument("--cache", action = "store_true", help = "keep the radiation and response caches")
+    args = parser.parse_args()
+
+    config = get_config()
+    if not args.cache:
+        config['radiation_cache_size'] = 0
+        config['response_cache_size'] = 0
+    config['radiation_backend'] = 'azure'
+    set_table_service(LoadFakeTableService(CSV_FILE, LoadTestCells(config['pars_grid'], args.cells),
+                                           args.latency))
+
+    if args.mode == "gevent":
+        from serve_async import serve
+        serve(args.host, args.port, log = None)
+    else:
+        warm_up()
+        app.run(args.host, args.port)
@@ -0,0 +1,126 @@
+"""
+Load test of /GetPVProduction on the development server (sync) and the
+gevent server (gevent), both reading from a fake Azure table with a round
+trip latency, see fake_server.py, e.g.
+
+    python benchmarks/load_test.py --concurrency 1 10 50 --requests 200
+
+For every server and concurrency, --requests requests for different
+installations are sent by --concurrency client threads. Reported are the
+throughput, latency percentiles and errors, and whether both servers
+returned the same responses. Results are JSON, see timing.py.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from InSolarWebApp.grid import Grid
+from InSolarWebApp.resources import get_config
+from fake_server import LoadTestCells
+from timing import Environment, WriteResults
+
+def StartServer(mode, port, latency, cells):
+    """ starts fake_server.py and waits until it answers /hw """
+    server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_server.py"),
+                               mode, "--port", str(port), "--latency", str(latency), "--cells", str(cells)])
+    for i in range(600):
+        try:
+            if requests.get("http://localhost:%d/hw" % port, timeout = 1).text == "hello":
+                return server
+        except requests.ConnectionError:
+            pass
+        if server.poll() is not None:
+            break
+        time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("%s server did not start" % mode)
+
+def Bodies(pars_grid, n_cells, n, days):
+    """ returns n request bodies for installations at the fake cells """
+    grid = Grid(pars_grid)
+    geo_long, geo_lat = grid.centres(LoadTestCells(pars_grid, n_cells))
+    begin = np.datetime64("2015-05-03T00:00Z")
+    bodies = []
+    for i in range(n):
+        time_begin = begin + np.timedelta64(i % 60, 'D')
+        time_end = time_begin + np.timedelta64(days * 24 * 60 - 15, 'm')
+        bodies.append({"dateTimeBegin" : str(time_begin).replace("+0000", "Z"),
+                       "dateTimeEnd" : str(time_end).replace("+0000", "Z"),
+                       "longitude" : float(geo_long[i % len(geo_long)]),
+                       "latitude" : float(geo_lat[i % len(geo_lat)]),
+                       "orientation" : 90 + (i * 7) % 180,
+                       "tilt" : 10 + i % 40,
+                       "installationCapacity" : 1000 + 10 * i})
+    return bodies
+
+def Run(port, bodies, concurrency):
+    """ sends the requests and returns throughput, latencies and responses """
+    url = "http://localhost:%d/GetPVProduction" % port
+    def post(body):
+        start = time.time()
+        response = requests.post(url, data = json.dumps(body),
+                                 headers = {"Content-Type" : "application/json"})
+        ok = response.status_code == 200 and response.text.startswith("{")
+        return time.time() - start, ok, hashlib.sha1(response.content).hexdigest()
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers = concurrency) as executor:
+        results = list(executor.map(post, bodies))
+    seconds = time.time() - start
+
+    latency = np.array([r[0] for r in results])
+    return {"concurrency" : concurrency,
+            "requests" : len(bodies),
+            "seconds" : seconds,
+            "requests_per_second" : len(bodies) / seconds,
+            "latency_p50" : float(np.percentile(latency, 50)),
+            "latency_p95" : float(np.percentile(latency, 95)),
+            "latency_max" : float(latency.max()),
+            "errors" : sum(1 for r in results if not r[1])}, [r[2] for r in results]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "load test of the sync and gevent servers")
+    parser.add_argument("--modes", nargs = "+", choices = ["sync", "gevent"], default = ["sync", "gevent"])
+    parser.add_argument("--concurrency", type = int, nargs = "+", default = [1, 10, 50])
+    parser.add_argument("--requests", type = int, default = 200)
+    parser.add_argument("--days", type = int, default = 7, help = "days per request")
+    parser.add_argument("--latency", type = float, default = 0.05, help = "seconds per table query")
+    parser.add_argument("--cells", type = int, default = 20)
+    parser.add_argument("--port", type = int, default = 5556)
+    parser.add_argument("--output", help = "JSON file for the results, default stdout")
+    args = parser.parse_args()
+
+    bodies = Bodies(get_config()['pars_grid'], args.cells, args.requests, args.days)
+    results = {"environment" : Environment(),
+               "latency" : args.latency,
+               "days" : args.days,
+               "cases" : []}
+    responses = dict()
+    for mode in args.modes:
+        server = StartServer(mode, args.port, args.latency, args.cells)
+        try:
+            for concurrency in args.concurrency:
+                case, hashes = Run(args.port, bodies, concurrency)
+                case["mode"] = mode
+                results["cases"].append(case)
+                responses.setdefault(mode, hashes)
+                sys.stderr.write("%-6s concurrency %3d: %7.1f requests/s, p95 %.3f s, %d errors\n" %
+                                 (mode, concurrency, case["requests_per_second"],
+                                  case["latency_p95"], case["errors"]))
+        finally:
+            server.terminate()
+            server.wait()
+
+    results["identical_responses"] = len(set(tuple(h) for h in responses.values())) <= 1
+    WriteResults(results, args.output)
@@ -0,0 +1,159 @@
+"""
+Times the stages of the GetPVProduction pipeline separately, for request
+periods from a day to a year and from 1 to 10000 installations, e.g.
+
+    python benchmarks/pipeline.py --output results.json
+    python benchmarks/pipeline.py --days 1 31 --installations 1 100 --repeat 5
+
+The radiation is read from a FakeTableService filled with MeteoSat_29696.csv,
+repeated to cover a year. Installations are spread over --cells gridpoints.
+Every stage reports the fastest of --repeat runs in seconds:
+
+- grid_lookup: nearest gridpoint of every installation
+- radiation_fetch: GetRadiationFromAzure of every cell, without caches
+- solar_position: fnSunPosition of every cell centre
+- gti: fnGTIMatrix of all installations
+- dc_ac: fnGTI2DC and fnDC2AC of all installations
+- json: ConvertToJSON of the first --json-installations installations
+
+The results are written as JSON, together with the commit and library
+versions, so runs of different versions can be compared.
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from InSolarWebApp.fake_table_service import LoadFakeTableService
+from InSolarWebApp.grid import Grid
+from InSolarWebApp.helper_functions import ConvertToJSON
+from InSolarWebApp.model import fnGTIMatrix, fnGTI2DC, fnDC2AC
+from InSolarWebApp.radiation_on_azure import GetRadiationFromAzure
+from InSolarWebApp.resources import get_config
+from InSolarWebApp.solar_position import fnSunPosition
+from timing import Best, Environment, WriteResults
+
+CSV_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "InSolarWebApp", "MeteoSat_29696.csv")
+TIME_BEGIN = pd.Timestamp("2015-05-02 00:00", tz = "UTC")
+
+def Installations(grid, cells, n, seed = 0):
+    """ returns n random installations, spread round robin over cells,
+    located within the cell
+    """
+    random = np.random.RandomState(seed)
+    cell = np.arange(n) % len(cells)
+    geo_long, geo_lat = grid.centres(np.asarray(cells)[cell])
+    return {"cell" : cell,
+            "longitude" : geo_long + random.uniform(-0.4, 0.4, n) * grid.dlong,
+            "latitude" : geo_lat + random.uniform(-0.4, 0.4, n) * grid.dlat,
+            "orientation" : random.uniform(90, 270, n),
+            "tilt" : random.uniform(0, 60, n),
+            "installation_capacity" : random.uniform(1000, 10000, n)}
+
+def InColumns(n, slots, max_values):
+    """ returns slices of installations, so a block [time x installation]
+    holds at most max_values values
+    """
+    step = int(max(1, max_values // max(slots, 1)))
+    return [slice(begin, min(begin + step, n)) for begin in range(0, n, step)]
+
+def RunCase(grid, table_service, cells, days, n, repeat, max_values, json_installations):
+    """ times the stages for one request period and number of installations
+
+    @returns: dict: case and seconds per stage
+    """
+    time_end = TIME_BEGIN + pd.Timedelta(days = days) - pd.Timedelta(minutes = 15)
+    installations = Installations(grid, cells, n)
+    stages = dict()
+
+    # grid lookup
+    gridpoints, stages["grid_lookup"] = Best(
+        lambda: grid.gridpoints(installations["longitude"], installations["latitude"]), repeat)
+    cells_used = np.unique(gridpoints)
+
+    # radiation of every cell as a block [time x cell]
+    def fetch():
+        return [GetRadiationFromAzure(gridpoint, TIME_BEGIN, time_end, "benchmark", table_service)
+                for gridpoint in cells_used]
+    frames, stages["radiation_fetch"] = Best(fetch, repeat)
+    index = frames[0].index
+    downwelling = np.column_stack([df.downwelling.values for df in frames])
+    diffuse = np.column_stack([df.diffuse.values for df in frames])
+
+    # solar position of the cell centres
+    def solar_position():
+        positions = [fnSunPosition(index, geo_lat, geo_long)
+                     for geo_long, geo_lat in zip(*grid.centres(cells_used))]
+        return np.column_stack([p[0] for p in positions]), np.column_stack([p[1] for p in positions])
+    (zenith, azimuth), stages["solar_position"] = Best(solar_position, repeat)
+
+    # the model, in blocks of installations to bound the memory, only the
+    # first block is kept for the serialization
+    cell = np.searchsorted(cells_used, gridpoints)
+    capacity = installations["installation_capacity"]
+    stages["gti"] = stages["dc_ac"] = 0.0
+    for c in InColumns(n, len(index), max_values):
+        GTI, seconds = Best(lambda: fnGTIMatrix(zenith, azimuth, downwelling, diffuse, cell[c],
+                                                installations["orientation"][c],
+                                                installations["tilt"][c]), repeat)
+        stages["gti"] += seconds
+        block, seconds = Best(lambda: fnDC2AC(fnGTI2DC(GTI, capacity[c]), capacity[c]), repeat)
+        stages["dc_ac"] += seconds
+        if c.start == 0:
+            power = block
+
+    # serialization of the responses
+    n_json = min(n, json_installations, power.shape[1])
+    def serialize():
+        return [ConvertToJSON(pd.DataFrame({"power" : power[:, j]}, index = index))
+                for j in range(n_json)]
+    output, stages["json"] = Best(serialize, repeat)
+
+    return {"days" : days,
+            "installations" : n,
+            "cells" : len(cells_used),
+            "slots" : len(index),
+            "json_installations" : n_json,
+            "json_bytes" : sum(len(x) for x in output),
+            "seconds" : stages,
+            "total_seconds" : sum(stages.values())}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "benchmark the stages of GetPVProduction")
+    parser.add_argument("--days", type = int, nargs = "+", default = [1, 7, 31, 365])
+    parser.add_argument("--installations", type = int, nargs = "+", default = [1, 10, 100, 1000, 10000])
+    parser.add_argument("--cells", type = int, default = 10, help = "gridpoints with installations")
+    parser.add_argument("--repeat", type = int, default = 3)
+    parser.add_argument("--max-values", type = float, default = 1e7,
+                        help = "largest block [time x installation] computed at once")
+    parser.add_argument("--json-installations", type = int, default = 10,
+                        help = "installations serialized per case")
+    parser.add_argument("--csv", default = CSV_FILE, help = "MeteoSat csv with the radiation")
+    parser.add_argument("--output", help = "JSON file for the results, default stdout")
+    args = parser.parse_args()
+
+    grid = Grid(get_config()['pars_grid'])
+    cells = np.linspace(0, grid.n_gridpoints - 1, args.cells).astype(int)
+
+    # enough copies of the csv to cover the longest period
+    csv_days = pd.read_csv(args.csv, usecols = ["datetime"]).datetime
+    csv_days = (pd.Timestamp(csv_days.iloc[-1]).normalize() - pd.Timestamp(csv_days.iloc[0]).normalize()).days + 1
+    table_service = LoadFakeTableService(args.csv, cells, repeat = -(-max(args.days) // csv_days))
+
+    results = {"environment" : Environment(),
+               "repeat" : args.repeat,
+               "cases" : []}
+    for days in args.days:
+        for n in args.installations:
+            case = RunCase(grid, table_service, cells[:n], days, n, args.repeat,
+                           args.max_values, args.json_installations)
+            results["cases"].append(case)
+            sys.stderr.write("%4d days %6d installations: %.3f s\n" % (days, n, case["total_seconds"]))
+
+    WriteResults(results, args.output)
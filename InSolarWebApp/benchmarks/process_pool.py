@@ -0,0 +1,115 @@
+"""
+Scaling of the model over worker processes, see ProcessPool in executor.py,
+e.g.
+
+    python benchmarks/process_pool.py --processes 1 2 4 8 --calls 32 --days 31
+
+--calls installations at one gridpoint are computed with fnGetExpectedProduction
+through map_model, first in the calling process (processes 0, the thread
+backend, which uses one core whatever the number of threads), then in a
+ProcessPool of every number of --processes, by default 1 to the number of
+cores. The radiation is read from a FakeTableService filled with
+MeteoSat_29696.csv.
+
+Reported per case are the fastest of --repeat runs, the installations per
+second and the speedup over processes 0, and whether the results equal those
+of processes 0. Results are JSON, see timing.py.
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from InSolarWebApp.executor import map_model, set_process_pool, ProcessPool
+from InSolarWebApp.fake_table_service import LoadFakeTableService
+from InSolarWebApp.grid import Grid
+from InSolarWebApp.model import fnGetExpectedProduction
+from InSolarWebApp.radiation_on_azure import GetRadiationFromAzure
+from InSolarWebApp.resources import get_config, get_inverters
+from timing import Best, Environment, WriteResults
+
+CSV_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "InSolarWebApp", "MeteoSat_29696.csv")
+TIME_BEGIN = pd.Timestamp("2015-05-02 00:00", tz = "UTC")
+
+def Calls(df, geo_long, geo_lat, n, pars_grid, inverters, seed = 0):
+    """ returns the arguments of fnGetExpectedProduction for n random
+    installations at the same location, every one with its own copy of df,
+    the model adds its columns to df
+    """
+    random = np.random.RandomState(seed)
+    return [(df.copy(), geo_long, geo_lat, orientation, tilt, capacity, pars_grid,
+             None, None, None, 0, inverters)
+            for orientation, tilt, capacity in zip(random.uniform(90, 270, n),
+                                                   random.uniform(0, 60, n),
+                                                   random.uniform(1000, 10000, n))]
+
+def RunCase(processes, calls, repeat):
+    """ times map_model of calls, in a ProcessPool of processes workers, or
+    without processes 0
+
+    @returns: dict: case and seconds, and the results
+    """
+    pool = ProcessPool(processes) if processes > 0 else None
+    set_process_pool(pool)
+    try:
+        if pool is not None:
+            # starts the workers and loads pvlib in all of them
+            map_model(fnGetExpectedProduction, calls[:processes])
+        results, seconds = Best(lambda: map_model(fnGetExpectedProduction, calls), repeat)
+    finally:
+        set_process_pool(None)
+        if pool is not None:
+            pool.close()
+    return {"processes" : processes,
+            "seconds" : seconds,
+            "installations_per_second" : len(calls) / seconds}, results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "benchmark the model in worker processes")
+    parser.add_argument("--processes", type = int, nargs = "+",
+                        default = range(1, multiprocessing.cpu_count() + 1))
+    parser.add_argument("--calls", type = int, default = 32, help = "installations computed")
+    parser.add_argument("--days", type = int, default = 31, help = "days of every installation")
+    parser.add_argument("--repeat", type = int, default = 3)
+    parser.add_argument("--csv", default = CSV_FILE, help = "MeteoSat csv with the radiation")
+    parser.add_argument("--output", help = "JSON file for the results, default stdout")
+    args = parser.parse_args()
+
+    config = get_config()
+    grid = Grid(config['pars_grid'])
+    gridpoint = grid.n_gridpoints // 2
+    geo_long, geo_lat = grid.centre(gridpoint)
+
+    csv_days = pd.read_csv(args.csv, usecols = ["datetime"]).datetime
+    csv_days = (pd.Timestamp(csv_days.iloc[-1]).normalize() - pd.Timestamp(csv_days.iloc[0]).normalize()).days + 1
+    table_service = LoadFakeTableService(args.csv, [gridpoint], repeat = -(-args.days // csv_days))
+    time_end = TIME_BEGIN + pd.Timedelta(days = args.days) - pd.Timedelta(minutes = 15)
+    df = GetRadiationFromAzure(gridpoint, TIME_BEGIN, time_end, "benchmark", table_service)
+    calls = Calls(df, geo_long, geo_lat, args.calls, config['pars_grid'], get_inverters())
+
+    results = {"environment" : Environment(),
+               "cpu_count" : multiprocessing.cpu_count(),
+               "calls" : args.calls,
+               "days" : args.days,
+               "slots" : len(df),
+               "repeat" : args.repeat,
+               "cases" : []}
+    reference = None
+    for processes in [0] + [p for p in args.processes if p > 0]:
+        case, output = RunCase(processes, calls, args.repeat)
+        if reference is None:
+            reference, base_seconds = output, case["seconds"]
+        case["speedup"] = base_seconds / case["seconds"]
+        case["same_results"] = all(a.equals(b) for a, b in zip(reference, output))
+        results["cases"].append(case)
+        sys.stderr.write("%3d processes: %.3f s, %.1f installations/s, speedup %.2f\n"
+                         % (processes, case["seconds"], case["installations_per_second"], case["speedup"]))
+
+    WriteResults(results, args.output)
@@ -0,0 +1,47 @@
+"""
+Timing helpers shared by the benchmark scripts.
+"""
+
+import json
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+def Best(function, repeat):
+    """ returns the result of function and the fastest of repeat runs (s) """
+    timings = []
+    for i in range(repeat):
+        start = time.time()
+        result = function()
+        timings.append(time.time() - start)
+    return result, min(timings)
+
+def Environment():
+    """ returns the version of the code and the libraries, stored with the
+    results so runs of different versions can be compared
+    """
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"]).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {"commit" : commit,
+            "date" : time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python" : platform.python_version(),
+            "numpy" : np.__version__,
+            "pandas" : pd.__version__,
+            "machine" : platform.machine(),
+            "processor" : platform.processor()}
+
+def WriteResults(results, output = None):
+    """ writes results as JSON to the file output, or to stdout """
+    text = json.dumps(results, indent = 2, sort_keys = True)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
@@ -0,0 +1,56 @@
+"""
+This script fills the local radiation store from MeteoSat csv files or from
+the Azure table, e.g.
+
+    python import_radiation.py csv InSolarWebApp/MeteoSat_29696.csv --gridpoint 4242
+    python import_radiation.py azure --gridpoints 0 7999 --begin 2015-01-01 --end 2015-12-31
+    python import_radiation.py frames new_radiation.csv
+
+frames imports csv files with the radiation of many gridpoints (column
+longlat) as whole grid frames, see InSolarWebApp/ingestion.py, running
+servers reading the store see them without a restart.
+"""
+
+import argparse
+import os
+import time
+
+from InSolarWebApp.ingestion import IngestFrames, ReadFramesCSV
+from InSolarWebApp.radiation_store import RadiationStore, ImportRadiationCSV, ImportRadiationAzure
+from InSolarWebApp.resources import CONFIG_FILE, get_config, get_table_service
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "import radiation into the local radiation store")
+    parser.add_argument("source", choices = ["csv", "azure", "frames"])
+    parser.add_argument("files", nargs = "*", help = "csv files to import")
+    parser.add_argument("--store", help = "store directory, default radiation_store_path of config.py")
+    parser.add_argument("--gridpoint", type = int, help = "gridpoint of all rows in the csv files")
+    parser.add_argument("--dayfirst", action = "store_true", help = "csv dates are day first")
+    parser.add_argument("--gridpoints", type = int, nargs = 2, metavar = ("FIRST", "LAST"),
+                        help = "range of gridpoints to import from Azure (inclusive)")
+    parser.add_argument("--begin", help = "first day to import from Azure, YYYY-MM-DD")
+    parser.add_argument("--end", help = "last day to import from Azure, YYYY-MM-DD")
+    args = parser.parse_args()
+
+    config = get_config()
+    pars_grid = config['pars_grid']
+    path = args.store or os.path.join(os.path.dirname(CONFIG_FILE), config['radiation_store_path'])
+    store = RadiationStore(path, pars_grid["N_width"]*pars_grid["N_height"])
+
+    start = time.time()
+    if args.source == "csv":
+        n = 0
+        for csv_file in args.files:
+            n += ImportRadiationCSV(store, csv_file, args.gridpoint, args.dayfirst)
+    elif args.source == "frames":
+        n = 0
+        for csv_file in args.files:
+            index, values = ReadFramesCSV(csv_file, store.n_gridpoints, args.dayfirst)
+            n += IngestFrames(store, index, values)
+    else:
+        gridpoints = range(args.gridpoints[0], args.gridpoints[1] + 1)
+        n = ImportRadiationAzure(store, get_table_service(), config['storage_name'],
+                                 gridpoints, args.begin, args.end)
+
+    print("imported %d %s into %s in %.1f s" % (n, "frames" if args.source == "frames" else "rows",
+                                                 path, time.time() - start))
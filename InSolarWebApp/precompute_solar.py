@@ -0,0 +1,64 @@
+"""
+This script precomputes the solar geometry of all gridpoint centres for a
+year into the solar tables read by the solar position cache, e.g. nightly
+
+    python precompute_solar.py 2016 --processes 8
+
+Gridpoints that are complete are skipped, so an interrupted run continues
+where it stopped.
+"""
+
+import argparse
+import multiprocessing
+import os
+import time
+
+from InSolarWebApp.grid import Grid
+from InSolarWebApp.resources import CONFIG_FILE, get_config
+from InSolarWebApp.solar_position import SolarTable
+
+def ComputeGridpoints(args):
+    """ computes a list of gridpoints, in its own process
+
+    @returns: int: number of gridpoints computed
+    """
+    path, pars_grid, year, gridpoints = args
+    grid = Grid(pars_grid)
+    table = SolarTable(path, grid.n_gridpoints)
+    n = 0
+    for gridpoint in gridpoints:
+        if table.is_complete(gridpoint, year):
+            continue
+        geo_long, geo_lat = grid.centre(gridpoint)
+        table.compute(gridpoint, geo_long, geo_lat, year)
+        n += 1
+    table.flush()
+    return n
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "precompute the solar geometry of the grid")
+    parser.add_argument("years", type = int, nargs = "+")
+    parser.add_argument("--store", help = "table directory, default solar_table_path of config.py")
+    parser.add_argument("--gridpoints", type = int, nargs = 2, metavar = ("FIRST", "LAST"),
+                        help = "range of gridpoints to compute (inclusive), default all")
+    parser.add_argument("--processes", type = int, default = multiprocessing.cpu_count())
+    args = parser.parse_args()
+
+    config = get_config()
+    pars_grid = config['pars_grid']
+    path = args.store or os.path.join(os.path.dirname(CONFIG_FILE), config['solar_table_path'])
+    n_gridpoints = Grid(pars_grid).n_gridpoints
+    first, last = args.gridpoints or (0, n_gridpoints - 1)
+    gridpoints = list(range(first, last + 1))
+
+    pool = multiprocessing.Pool(args.processes)
+    for year in args.years:
+        start = time.time()
+        # the files are created once, the processes only write to them
+        SolarTable(path, n_gridpoints).allocate(year)
+        chunks = [(path, pars_grid, year, gridpoints[i::args.processes * 4])
+                  for i in range(args.processes * 4)]
+        n = sum(pool.map(ComputeGridpoints, chunks))
+        print("computed %d gridpoints of %d into %s in %.1f s" % (n, year, path, time.time() - start))
+    pool.close()
+    pool.join()
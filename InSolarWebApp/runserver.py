@@ -3,7 +3,9 @@ This script runs the InSolarWebApp application using a development server.
 """
 
 from os import environ
-from InSolarWebApp import app
+from InSolarWebApp import app, warm_up
+from InSolarWebApp.executor import set_process_pool, ProcessPool
+from InSolarWebApp.resources import get_config
 
 if __name__ == '__main__':
     HOST = environ.get('SERVER_HOST', 'localhost')
@@ -11,4 +13,9 @@ if __name__ == '__main__':
         PORT = int(environ.get('SERVER_PORT', '5555'))
     except ValueError:
         PORT = 5555
-    app.run(HOST, PORT)
+    warm_up()
+    processes = get_config().get('cpu_processes', 0)
+    if processes > 0:
+        # requests in threads, the model in the worker processes
+        set_process_pool(ProcessPool(processes))
+    app.run(HOST, PORT, threaded = processes > 0)
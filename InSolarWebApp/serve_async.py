@@ -0,0 +1,38 @@
+"""
+This script runs the InSolarWebApp application with the gevent WSGI server.
+Every request is handled by a greenlet, so the Azure queries of concurrent
+requests overlap, and the model runs in a pool of cpu_workers threads, see
+InSolarWebApp/executor.py. The HTTP interface is the same as runserver.py.
+"""
+
+from gevent import monkey
+# threading is not patched: the locks of the libraries must keep working in 
+# the threads of the model, the greenlets of requests are told apart by 
+# werkzeug and flask themselves
+monkey.patch_all(thread = False)
+
+from os import environ
+from gevent.pool import Pool
+from gevent.pywsgi import WSGIServer
+from gevent.threadpool import ThreadPool
+
+from InSolarWebApp import app, warm_up
+from InSolarWebApp.executor import set_pool, set_io_pool, set_process_pool, ProcessPool
+from InSolarWebApp.resources import get_config
+
+def serve(host, port, log = 'default'):
+    """ serves the application until interrupted, after warm_up """
+    warm_up()
+    if get_config().get('cpu_processes', 0) > 0:
+        set_process_pool(ProcessPool(get_config()['cpu_processes']))
+    set_pool(ThreadPool(get_config().get('cpu_workers', 4)))
+    set_io_pool(Pool)
+    WSGIServer((host, port), app, log = log).serve_forever()
+
+if __name__ == '__main__':
+    HOST = environ.get('SERVER_HOST', 'localhost')
+    try:
+        PORT = int(environ.get('SERVER_PORT', '5555'))
+    except ValueError:
+        PORT = 5555
+    serve(HOST, PORT)
@@ -0,0 +1,8 @@
+"""
+Tests of the InSolarWebApp package, run from the directory of runserver.py
+
+    python -m unittest discover -s tests -t .
+
+They run without Azure, on a FakeTableService or a radiation store in a
+temporary directory.
+"""
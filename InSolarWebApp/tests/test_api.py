@@ -0,0 +1,70 @@
+import json
+import os
+import unittest
+
+from InSolarWebApp import app
+from InSolarWebApp.fake_table_service import LoadFakeTableService
+from InSolarWebApp.resources import get_grid, get_response_cache, set_table_service
+
+CSV_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "InSolarWebApp", "MeteoSat_29696.csv")
+
+class IncrementalTest(unittest.TestCase):
+
+    def setUp(self):
+        grid = get_grid()
+        self.gridpoint = 4242
+        geo_long, geo_lat = grid.centre(self.gridpoint)
+        set_table_service(LoadFakeTableService(CSV_FILE, [self.gridpoint]))
+        get_response_cache().cache.clear()
+        app.testing = True
+        self.client = app.test_client()
+        self.body = {"dateTimeBegin" : "2015-05-10T00:00:00Z",
+                     "dateTimeEnd" : "2015-05-12T23:45:00Z",
+                     "longitude" : geo_long, "latitude" : geo_lat,
+                     "orientation" : 180, "tilt" : 35, "installationCapacity" : 3000}
+
+    def tearDown(self):
+        set_table_service(None)
+        get_response_cache().cache.clear()
+
+    def Post(self, **kwargs):
+        """ returns the body of a POST /GetPVProduction """
+        body = dict(self.body, **kwargs)
+        return self.client.post('/GetPVProduction', data = json.dumps(body),
+                                content_type = 'application/json').data
+
+    def test_window_shift(self):
+        full = json.loads(self.Post())
+        self.assertNotIn("cursor", full)
+        # the same window again, incremental: not the cached plain response
+        whole = json.loads(self.Post(incremental = True))
+        self.assertIn("cursor", whole)
+        self.assertEqual(whole["data"], full["data"])
+        first = json.loads(self.Post(dateTimeEnd = "2015-05-11T11:00:00Z", incremental = True))
+        self.assertIn("cursor", first)
+        self.assertEqual(first["data"][-1]["timestamp"], "2015-05-11T11:00:00+00:00")
+        # the next request starts right after the cursor
+        second = json.loads(self.Post(cursor = first["cursor"]))
+        self.assertEqual(second["data"][0]["timestamp"], "2015-05-11T11:15:00+00:00")
+        self.assertEqual(first["data"] + second["data"], full["data"])
+        # nothing new since the last cursor
+        third = json.loads(self.Post(cursor = second["cursor"]))
+        self.assertEqual(third["recordCount"], 0)
+        self.assertEqual(third["cursor"], second["cursor"])
+
+        since = json.loads(self.Post(since = "2015-05-12T22:00:00Z"))
+        self.assertEqual(since["data"], full["data"][-7:])
+        # another since is another response
+        since = json.loads(self.Post(since = "2015-05-12T23:00:00Z"))
+        self.assertEqual(since["data"], full["data"][-3:])
+
+    def test_rejected(self):
+        first = json.loads(self.Post(incremental = True))
+        for kwargs in ({"cursor" : first["cursor"], "tilt" : 30},
+                       {"cursor" : "garbage"},
+                       {"cursor" : first["cursor"], "resolution" : "hour"}):
+            self.assertTrue(self.Post(**kwargs).startswith("400 Bad Request"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from InSolarWebApp.backfill import OutputFormat, WriteAtomic
+
+class WriteAtomicTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        index = pd.date_range("2015-05-01", periods = 4, freq = "15min", tz = "UTC")
+        self.timestamps = np.repeat(index.asi8.view("datetime64[ns]"), 2)
+        self.df = pd.DataFrame({"id" : np.tile([7, 9], 4),
+                                "timestamp" : self.timestamps,
+                                "power" : np.arange(8) * 125.5},
+                               columns = ["id", "timestamp", "power"])
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def Written(self, output_format):
+        """ writes the frame to a new month directory, returns the path """
+        path = os.path.join(self.path, "month=2015-05", "cells-00001-00002.%s" % output_format)
+        WriteAtomic(self.df, path, output_format)
+        # only the complete file, no temporary one left
+        self.assertEqual(os.listdir(os.path.dirname(path)), [os.path.basename(path)])
+        return path
+
+    def test_csv(self):
+        self.df["timestamp"] = np.datetime_as_string(self.timestamps, unit = 's',
+                                                     timezone = 'UTC').astype(object)
+        df = pd.read_csv(self.Written("csv"))
+        self.assertEqual(list(df.columns), ["id", "timestamp", "power"])
+        self.assertEqual(list(df.id), list(self.df.id))
+        self.assertEqual(list(df.timestamp), list(self.df.timestamp))
+        np.testing.assert_array_equal(df.power.values, self.df.power.values)
+
+    def test_parquet(self):
+        try:
+            OutputFormat("parquet")
+        except ValueError:
+            self.skipTest("pyarrow is not installed")
+        import pyarrow.parquet
+        df = pyarrow.parquet.read_table(self.Written("parquet")).to_pandas()
+        self.assertEqual(list(df.columns), ["id", "timestamp", "power"])
+        self.assertEqual(list(df.id), list(self.df.id))
+        np.testing.assert_array_equal(df.timestamp.values, self.timestamps)
+        np.testing.assert_array_equal(df.power.values, self.df.power.values)
+
+    def test_output_format(self):
+        self.assertEqual(OutputFormat(), "csv")
+        self.assertRaises(ValueError, OutputFormat, "auto")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+
+import pandas as pd
+
+from InSolarWebApp.cache import LRUCache, ResponseCache
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_max_size(self):
+        cache = LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        self.assertEqual((cache.get("a"), cache.get("b"), cache.get("c")), (1, None, 3))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_max_bytes(self):
+        cache = LRUCache(100, max_bytes = 10)
+        cache.put("a", "aaaa", size = 4)
+        cache.put("b", "bbbb", size = 4)
+        cache.put("c", "cccc", size = 4)
+        # the least recently used entry makes room
+        self.assertEqual((cache.get("a"), cache.get("b"), cache.get("c")), (None, "bbbb", "cccc"))
+        self.assertEqual(cache.bytes, 8)
+        # replacing an entry counts its new size only
+        cache.put("b", "bb", size = 2)
+        self.assertEqual(cache.bytes, 6)
+        cache.delete("c")
+        self.assertEqual(cache.bytes, 2)
+        # larger than the whole cache: not stored, nothing evicted
+        cache.put("d", "d" * 11, size = 11)
+        self.assertEqual((cache.get("b"), cache.get("d")), ("bb", None))
+        self.assertEqual(cache.stats()["bytes"], 2)
+        cache.clear()
+        self.assertEqual(cache.bytes, 0)
+
+    def test_expired(self):
+        cache = LRUCache(100, max_bytes = 10)
+        cache.put("a", "aaaa", ttl = -1, size = 4)
+        self.assertEqual(cache.get("a"), None)
+        self.assertEqual(cache.bytes, 0)
+        self.assertEqual(cache.stats()["expirations"], 1)
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def test_bytes(self):
+        cache = ResponseCache(max_size = 100, max_bytes = 1000)
+        time_end = pd.Timestamp("2015-01-01", tz = "UTC")
+        for i in range(5):
+            cache.put(("day", i), "x" * 300, time_end)
+        self.assertEqual(cache.stats()["size"], 3)
+        self.assertEqual(cache.stats()["bytes"], 900)
+        self.assertEqual(cache.get(("day", 4)), "x" * 300)
+        # a response of a long window is not cached, the others stay
+        cache.put(("year",), "x" * 1001, time_end)
+        self.assertEqual(cache.get(("year",)), None)
+        self.assertEqual(cache.stats()["size"], 3)
+
+    def test_request_key(self):
+        self.assertEqual(ResponseCache.request_key(pd.Timestamp("1970-01-01 00:00:01", tz = "UTC"), 3, "a"),
+                         (10**9, 3, "a"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from InSolarWebApp.gap_filling import FillGaps, fnClearSkyGHI, fnGaps
+
+def RadiationFrame(diffuse, downwelling = None):
+    """ returns a 15-minute frame of radiation from 2015-06-21 """
+    if downwelling is None:
+        downwelling = diffuse
+    index = pd.date_range("2015-06-21", periods = len(diffuse), freq = "15min", tz = "UTC")
+    return pd.DataFrame({"diffuse" : np.array(diffuse, dtype = float),
+                         "downwelling" : np.array(downwelling, dtype = float)},
+                        index = index, columns = ["diffuse", "downwelling"])
+
+class FillGapsTest(unittest.TestCase):
+
+    def test_gaps(self):
+        missing = np.array([1, 0, 1, 1, 0, 1, 1, 1, 0, 0, 1], dtype = bool)
+        # gaps at the start and the end have a value on one side only
+        self.assertEqual(list(fnGaps(missing, 3).astype(int)), [0, 0, 1, 1, 0, 1, 1, 1, 0, 0, 0])
+        self.assertEqual(list(fnGaps(missing, 2).astype(int)), [0, 0, 1, 1, 0, 0, 0, 0, 0, 0, 0])
+        self.assertFalse(fnGaps(np.ones(4, dtype = bool), 10).any())
+
+    def test_interpolate(self):
+        nan = np.nan
+        df = RadiationFrame([nan, 10, nan, nan, 40, nan, nan, nan, 80, nan],
+                            [0, 10, 20, 30, nan, 50, 60, 70, 80, 90])
+        filled = FillGaps(df, "interpolate", 2)
+        np.testing.assert_array_equal(filled.diffuse.values,
+                                      [nan, 10, 20, 30, 40, nan, nan, nan, 80, nan])
+        np.testing.assert_array_equal(filled.downwelling.values, np.arange(0, 100, 10))
+        # the gap of 3 slots is filled with max_gap 3
+        np.testing.assert_array_equal(FillGaps(df, "interpolate", 3).diffuse.values,
+                                      [nan, 10, 20, 30, 40, 50, 60, 70, 80, nan])
+        # the input is left alone
+        self.assertTrue(np.isnan(df.diffuse.values[2]))
+
+    def test_nothing_to_fill(self):
+        df = RadiationFrame([1.0, 2.0, 3.0])
+        self.assertIs(FillGaps(df, "interpolate", 8), df)
+        self.assertIs(FillGaps(df, "none", 8), df)
+        self.assertRaises(ValueError, FillGaps, RadiationFrame([1.0, np.nan, 3.0]), "spline", 8)
+
+    def test_clearsky(self):
+        # a day with the sun at 30 degrees zenith at noon, a clear sky index of 0.5
+        hours = np.arange(96) / 4.0
+        zenith = 30.0 + 120.0 * abs(hours - 12.0) / 12.0
+        clearsky = fnClearSkyGHI(zenith)
+        self.assertTrue((clearsky[zenith >= 90] == 0).all())
+        self.assertTrue((clearsky[zenith < 90] > 0).all())
+
+        radiation = 0.5 * clearsky
+        # gaps over the night, around sunrise and around noon
+        gaps = np.zeros(96, dtype = bool)
+        gaps[[4, 5, 6, 29, 30, 46, 47, 48, 49]] = True
+        radiation[gaps] = np.nan
+        filled = FillGaps(RadiationFrame(radiation), "clearsky", 8, zenith)
+        night = gaps & (zenith >= 90)
+        self.assertTrue(night.any())
+        np.testing.assert_array_equal(filled.diffuse.values[night], 0.0)
+        np.testing.assert_allclose(filled.diffuse.values[gaps], 0.5 * clearsky[gaps])
+        np.testing.assert_array_equal(filled.downwelling.values, filled.diffuse.values)
+
+        # gaps longer than max_gap stay missing
+        filled = FillGaps(RadiationFrame(radiation), "clearsky", 3, zenith)
+        self.assertTrue(np.isnan(filled.diffuse.values[46:50]).all())
+        self.assertFalse(np.isnan(filled.diffuse.values[29:31]).any())
+
+if __name__ == '__main__':
+    unittest.main()
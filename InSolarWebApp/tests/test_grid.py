@@ -0,0 +1,130 @@
+import unittest
+
+import numpy as np
+
+from InSolarWebApp.grid import Grid
+
+PARS_GRID = {"glong_min" : 2.45, "glat_min" : 49.3, "glong_max" : 7.3, "glat_max" : 54.0,
+             "N_width" : 100, "N_height" : 80}
+
+def BaselineGridPoint(pars_grid, geo_long, geo_lat):
+    """ the nearest gridpoint by the city block distance to every centre,
+    the lookup of the grid before Grid
+    """
+    glong_min, glong_max = pars_grid["glong_min"], pars_grid["glong_max"]
+    glat_min, glat_max = pars_grid["glat_min"], pars_grid["glat_max"]
+    N_width, N_height = pars_grid["N_width"], pars_grid["N_height"]
+    dlong = (glong_max - glong_min)/ N_width
+    dlat = (glat_max - glat_min)/ N_height
+    long_grid = np.linspace(glong_min + 0.5*dlong, glong_max - 0.5*dlong, N_width)
+    lat_grid = np.linspace(glat_min + 0.5*dlat, glat_max - 0.5*dlat, N_height)
+    long_distance = np.tile(abs(long_grid - geo_long), N_height)
+    lat_distance = np.repeat(abs(lat_grid - geo_lat), N_width)
+    return (long_distance + lat_distance).argmin()
+
+class GridTest(unittest.TestCase):
+
+    def setUp(self):
+        self.grid = Grid(PARS_GRID)
+        self.random = np.random.RandomState(6)
+
+    def assertBaseline(self, geo_long, geo_lat, pars_grid = PARS_GRID):
+        expected = [BaselineGridPoint(pars_grid, x, y) for x, y in zip(geo_long, geo_lat)]
+        self.assertEqual(list(Grid(pars_grid).gridpoints(geo_long, geo_lat)), expected)
+
+    def test_random_points(self):
+        geo_long = self.random.uniform(2.45, 7.3, 5000)
+        geo_lat = self.random.uniform(49.3, 54.0, 5000)
+        self.assertBaseline(geo_long, geo_lat)
+
+    def test_cell_edges(self):
+        grid = self.grid
+        edges_long = grid.glong_min + grid.dlong * np.arange(grid.N_width + 1)
+        edges_lat = grid.glat_min + grid.dlat * np.arange(grid.N_height + 1)
+        # on a longitude edge, on a latitude edge and on the corners
+        geo_long = np.concatenate([edges_long, grid.long_centres[:81], edges_long[:81]])
+        geo_lat = np.concatenate([grid.lat_centres[self.random.randint(0, 80, 101)],
+                                  edges_lat, edges_lat])
+        self.assertBaseline(geo_long, geo_lat)
+        self.assertBaseline(grid.long_centres[:80], grid.lat_centres)
+
+    def test_ties(self):
+        # cells of whole degrees, so many locations are as far from 2 centres
+        pars_grid = {"glong_min" : 0.0, "glat_min" : 0.0, "glong_max" : 8.0, "glat_max" : 6.0,
+                     "N_width" : 8, "N_height" : 6}
+        geo_long, geo_lat = np.meshgrid(np.arange(0.0, 8.25, 0.25), np.arange(0.0, 6.25, 0.25))
+        self.assertBaseline(geo_long.ravel(), geo_lat.ravel(), pars_grid)
+
+    def test_clip(self):
+        geo_long = np.array([0.0, 10.0, 5.0, 5.0, -180.0, 7.31])
+        geo_lat = np.array([51.0, 51.0, 40.0, 60.0, -90.0, 54.01])
+        self.assertBaseline(geo_long, geo_lat)
+
+    def test_mask(self):
+        gridpoints = self.grid.gridpoints([0.0, 5.0, 5.0, 7.3], [51.0, 51.0, 54.1, 54.0],
+                                          out_of_bounds = 'mask')
+        self.assertEqual(list(gridpoints), [-1, BaselineGridPoint(PARS_GRID, 5.0, 51.0), -1,
+                                            self.grid.n_gridpoints - 1])
+
+    def test_raise(self):
+        self.assertRaises(ValueError, self.grid.gridpoints, [5.0, 10.0], [51.0, 51.0],
+                          out_of_bounds = 'raise')
+        self.assertEqual(self.grid.gridpoint(2.45, 49.3, out_of_bounds = 'raise'), 0)
+        self.assertRaises(ValueError, self.grid.gridpoint, np.nan, 51.0)
+
+    def test_centres(self):
+        gridpoints = self.random.randint(0, self.grid.n_gridpoints, 100)
+        geo_long, geo_lat = self.grid.centres(gridpoints)
+        self.assertEqual(list(self.grid.gridpoints(geo_long, geo_lat)), list(gridpoints))
+        self.assertEqual(self.grid.centre(101), (self.grid.long_centres[1], self.grid.lat_centres[1]))
+
+    def test_neighbours(self):
+        geo_long = self.random.uniform(2.45, 7.3, 1000)
+        geo_lat = self.random.uniform(49.3, 54.0, 1000)
+        for method in ('bilinear', 'idw'):
+            gridpoints, weights = self.grid.neighbours(geo_long, geo_lat, method)
+            self.assertEqual(gridpoints.shape, (1000, 4))
+            np.testing.assert_allclose(weights.sum(axis=1), 1.0)
+            self.assertTrue((weights >= 0).all())
+            # the centres of the gridpoints with weight enclose the location,
+            # moved onto the outer centres when it lies beyond them
+            centre_long, centre_lat = self.grid.centres(gridpoints)
+            used = weights > 0
+            for centre, location, centres, size in \
+                    ((centre_long, geo_long, self.grid.long_centres, self.grid.dlong),
+                     (centre_lat, geo_lat, self.grid.lat_centres, self.grid.dlat)):
+                location = np.clip(location, centres[0], centres[-1])
+                distance = abs(centre - location[:, np.newaxis])[used]
+                self.assertTrue((distance <= size * (1 + 1e-9)).all())
+
+    def test_bilinear_weights(self):
+        grid = self.grid
+        geo_long = grid.long_centres[10] + 0.25 * grid.dlong
+        geo_lat = grid.lat_centres[20] + 0.5 * grid.dlat
+        gridpoints, weights = grid.neighbours(geo_long, geo_lat, 'bilinear')
+        self.assertEqual(list(gridpoints[0]), [2010, 2011, 2110, 2111])
+        np.testing.assert_allclose(weights[0], [0.375, 0.125, 0.375, 0.125])
+        # interpolating the coordinates gives the location back
+        centre_long, centre_lat = grid.centres(gridpoints[0])
+        self.assertAlmostEqual((weights[0] * centre_long).sum(), geo_long)
+        self.assertAlmostEqual((weights[0] * centre_lat).sum(), geo_lat)
+
+    def test_on_centre(self):
+        gridpoint = 43 * self.grid.N_width + 17
+        geo_long, geo_lat = self.grid.centre(gridpoint)
+        for method in ('bilinear', 'idw'):
+            gridpoints, weights = self.grid.neighbours(geo_long, geo_lat, method)
+            # gridpoints without weight are replaced, so only one is read
+            self.assertEqual(list(gridpoints[0]), [gridpoint] * 4)
+            self.assertEqual(weights[0].sum(), 1.0)
+            self.assertEqual(weights[0].max(), 1.0)
+
+    def test_outer_edge(self):
+        # between the last centre and the edge of the grid box
+        gridpoints, weights = self.grid.neighbours(7.299, 53.999, 'idw')
+        self.assertEqual(set(gridpoints[0]), set([self.grid.n_gridpoints - 1]))
+        np.testing.assert_allclose(weights.sum(), 1.0)
+        self.assertRaises(ValueError, self.grid.neighbours, 5.0, 51.0, 'cubic')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+import base64
+import json
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from InSolarWebApp.helper_functions import ConvertFromBinary, ConvertToBinary, ConvertToDict, \
+                                           ConvertToJSON, ConvertToJSONStream, ConvertToSummary, \
+                                           DecodeCursor, EncodeCursor, INTERVAL_SECONDS, Resample
+
+def PowerFrame(periods, random, begin = "2015-05-01 00:00"):
+    """ returns a frame of random 15-minute power with NaN slots """
+    index = pd.date_range(begin, periods = periods, freq = "15min", tz = "UTC")
+    power = random.uniform(0, 5000, periods)
+    power[random.uniform(size = periods) < 0.2] = np.nan
+    return pd.DataFrame({"power" : power}, index = index)
+
+class ResampleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.random = np.random.RandomState(18)
+
+    def test_partial_bins(self):
+        # starts and ends in the middle of an hour
+        df = PowerFrame(12, self.random, "2015-05-01 00:30")
+        df.power.values[:] = np.arange(12.0)
+        hourly = Resample(df, "hour")
+        self.assertEqual(list(hourly.index), list(pd.date_range("2015-05-01 00:00", "2015-05-01 03:00",
+                                                                freq = "H", tz = "UTC")))
+        self.assertEqual(list(hourly.power), [0.5, 3.5, 7.5, 10.5])
+        self.assertEqual(list(hourly.energy), [0.25, 3.5, 7.5, 5.25])
+
+    def test_utc_bins(self):
+        # days begin at 00:00 UTC, whatever the time zone of the index
+        df = PowerFrame(4 * 96, self.random, "2015-03-28 12:00")
+        local = df.tz_convert("Europe/Amsterdam")
+        for frame in (df, local):
+            daily = Resample(frame, "day")
+            self.assertEqual(list(daily.index), list(pd.date_range("2015-03-28", "2015-04-01",
+                                                                   freq = "D", tz = "UTC")))
+        np.testing.assert_array_equal(Resample(local, "day").values, Resample(df, "day").values)
+
+    def test_conservation(self):
+        df = PowerFrame(70 * 96 - 5, self.random, "2015-01-20 03:15")
+        # 24 January without any power
+        df.power.values[371:467] = np.nan
+        for resolution in ("hour", "day", "month"):
+            resampled = Resample(df, resolution)
+            # the energy of all slots with power, in Wh
+            self.assertAlmostEqual(resampled.energy.sum(), np.nansum(df.power.values) / 4, 6)
+            ends = list(resampled.index[1:]) + [df.index[-1] + pd.Timedelta(minutes = 15)]
+            for begin, end, power, energy in zip(resampled.index, ends, resampled.power, 
+                                                 resampled.energy):
+                slots = df.power[(df.index >= begin) & (df.index < end)].values
+                if np.isnan(slots).all():
+                    self.assertTrue(np.isnan(power))
+                    self.assertEqual(energy, 0.0)
+                else:
+                    self.assertAlmostEqual(power, np.nanmean(slots), 6)
+                    self.assertAlmostEqual(energy, np.nansum(slots) / 4, 6)
+        self.assertTrue(np.isnan(Resample(df, "day").power["2015-01-24"]).all())
+        months = Resample(df, "month").index
+        self.assertEqual([str(month.date()) for month in months],
+                         ["2015-01-01", "2015-02-01", "2015-03-01"])
+        self.assertIs(Resample(df, "15min"), df)
+        self.assertRaises(ValueError, Resample, df, "week")
+
+class ConvertToJSONStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.random = np.random.RandomState(9)
+        self.df = PowerFrame(500, self.random)
+
+    def Frames(self):
+        """ returns (frame, resolution, cursor) to convert """
+        return [(self.df, "15min", None),
+                (self.df, "15min", "MTQzMDQ0MTIwMDpjMGZmZWU"),
+                (Resample(self.df, "hour"), "hour", None),
+                (Resample(self.df, "day"), "day", "cursor"),
+                (self.df.iloc[:0], "15min", None)]
+
+    def test_document(self):
+        for df, resolution, cursor in self.Frames():
+            expected = ConvertToJSON(df.copy(), resolution, cursor)
+            for chunk_size in (1, 7, 2000):
+                streamed = "".join(ConvertToJSONStream(df.copy(), False, chunk_size,
+                                                       resolution, cursor))
+                self.assertEqual(streamed, expected)
+
+    def test_ndjson(self):
+        for df, resolution, cursor in self.Frames():
+            expected = ConvertToDict(df.copy(), resolution, cursor)
+            lines = "".join(ConvertToJSONStream(df.copy(), True, 64, resolution, cursor)).split("\n")
+            # the summary, a line per record and the final newline
+            self.assertEqual(lines[0], json.dumps(ConvertToSummary(df.copy(), resolution, cursor)))
+            self.assertEqual(lines[1:-1], [json.dumps(record) for record in expected["data"]])
+            self.assertEqual(lines[-1], "")
+
+class ConvertToBinaryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.random = np.random.RandomState(10)
+
+    def test_layout(self):
+        df = PowerFrame(300, self.random)
+        body = ConvertToBinary(df.copy(), "15min", "cursor")
+        self.assertEqual(body[:4], b"INSP")
+        length = np.frombuffer(body, "<u4", 1, 4)[0]
+        # the header is followed by exactly one float32 per record
+        self.assertEqual(len(body), 8 + length + 4 * len(df))
+        header = json.loads(body[8:8 + length].decode("utf-8"))
+        self.assertEqual(header["dtype"], "<f4")
+        power = np.frombuffer(body, "<f4", len(df), 8 + length)
+        np.testing.assert_array_equal(power, df.power.values.astype(np.float32))
+
+    def test_same_as_json(self):
+        df = PowerFrame(300, self.random, "2015-05-01 06:30")
+        # 2 May without power, so every resolution has a NaN slot
+        df.iloc[70:166] = np.nan
+        for frame, resolution, cursor in ((df, "15min", "MTQzMDQ0MTIwMDpjMGZmZWU"),
+                                          (Resample(df, "hour"), "hour", None),
+                                          (Resample(df, "day"), "day", None)):
+            header, power = ConvertFromBinary(ConvertToBinary(frame.copy(), resolution, cursor))
+            document = json.loads(ConvertToJSON(frame.copy(), resolution, cursor))
+            data = document.pop("data")
+            self.assertEqual(dict((key, header.pop(key)) for key in
+                                  ("startEpoch", "intervalSeconds", "dtype")),
+                             {"startEpoch" : frame.index[0].value // 10**9,
+                              "intervalSeconds" : INTERVAL_SECONDS[resolution],
+                              "dtype" : "<f4"})
+            self.assertEqual(header, document)
+            self.assertEqual(header.get("cursor"), cursor)
+            # the i-th value is for startEpoch + i * intervalSeconds
+            expected = np.array([np.nan if record["power"] is None else record["power"]
+                                 for record in data], dtype = np.float32)
+            np.testing.assert_array_equal(power, expected)
+            self.assertTrue(np.isnan(power).any())
+            timestamps = pd.to_datetime([record["timestamp"] for record in data], utc = True)
+            self.assertEqual(list(timestamps.asi8 // 10**9),
+                             list(frame.index[0].value // 10**9 +
+                                  np.arange(len(power)) * INTERVAL_SECONDS[resolution]))
+
+    def test_empty(self):
+        df = PowerFrame(10, self.random).iloc[:0]
+        header, power = ConvertFromBinary(ConvertToBinary(df.copy()))
+        self.assertEqual((header["recordCount"], header["startEpoch"], len(power)), (0, None, 0))
+        self.assertRaises(ValueError, ConvertToBinary, df.copy(), "month")
+        self.assertRaises(ValueError, ConvertFromBinary, b"JSON")
+
+class CursorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.parameters = (4242, 180.0, 35.0, 3000.0, 3000.0, "SMA", "none")
+        self.last = pd.Timestamp("2015-05-15 11:00", tz = "UTC")
+
+    def test_round_trip(self):
+        cursor = EncodeCursor(self.last, self.parameters)
+        self.assertEqual(DecodeCursor(cursor, self.parameters), self.last)
+        self.assertEqual(DecodeCursor(unicode(cursor), self.parameters), self.last)
+
+    def test_tampered(self):
+        cursor = EncodeCursor(self.last, self.parameters)
+        seconds, digest = base64.urlsafe_b64decode(str(cursor)).split(":")
+        # another slot with the digest of the installation
+        forged = base64.urlsafe_b64encode("%d:%s" % (int(seconds) + 900, digest[::-1]))
+        for bad in (forged, cursor[:-2], "garbage", ""):
+            self.assertRaises(ValueError, DecodeCursor, bad, self.parameters)
+
+    def test_other_parameters(self):
+        cursor = EncodeCursor(self.last, self.parameters)
+        other = (4243,) + self.parameters[1:]
+        self.assertRaises(ValueError, DecodeCursor, cursor, other)
+        self.assertRaises(ValueError, DecodeCursor, cursor, self.parameters + (5.1, 52.0, "bilinear"))
+
+if __name__ == '__main__':
+    unittest.main()
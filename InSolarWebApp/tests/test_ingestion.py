@@ -0,0 +1,182 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from InSolarWebApp.cache import ResponseCache
+from InSolarWebApp.helper_functions import DAY_NS
+from InSolarWebApp.ingestion import FramesFromRows, IngestFrames
+from InSolarWebApp.radiation_cache import RadiationCache
+from InSolarWebApp.radiation_store import RadiationStore
+
+N_GRIDPOINTS = 6
+
+# writes one frame of constant radiation from another process
+WRITE_FRAME = """
+import sys
+import numpy as np
+import pandas as pd
+from InSolarWebApp.radiation_store import RadiationStore
+path, n_gridpoints, timestamp, value = sys.argv[1:]
+store = RadiationStore(path, int(n_gridpoints))
+values = np.ones((1, int(n_gridpoints))) * float(value)
+store.write_frames(pd.DatetimeIndex([timestamp]).tz_localize('UTC'),
+                   {"diffuse" : values, "downwelling" : 2 * values})
+store.flush()
+"""
+
+class RecordingStore(RadiationStore):
+    """ RadiationStore that records the days of every read """
+
+    def __init__(self, path, n_gridpoints):
+        RadiationStore.__init__(self, path, n_gridpoints)
+        self.reads = []
+
+    def get_radiation(self, gridpoint, time_begin, time_end):
+        self.reads.append((gridpoint, time_begin.value // DAY_NS, time_end.value // DAY_NS))
+        return RadiationStore.get_radiation(self, gridpoint, time_begin, time_end)
+
+    def get_radiation_block(self, gridpoints, time_begin, time_end):
+        for gridpoint in gridpoints:
+            self.reads.append((gridpoint, time_begin.value // DAY_NS, time_end.value // DAY_NS))
+        return RadiationStore.get_radiation_block(self, gridpoints, time_begin, time_end)
+
+def Frames(index, value):
+    """ returns frames of constant radiation of all gridpoints """
+    values = np.ones((len(index), N_GRIDPOINTS)) * value
+    return {"diffuse" : values, "downwelling" : 2 * values}
+
+def Day(timestamp):
+    """ returns the day since epoch of a timestamp """
+    return pd.Timestamp(timestamp).value // DAY_NS
+
+class IngestionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.store = RecordingStore(self.path, N_GRIDPOINTS)
+        # three days of radiation
+        self.index = pd.date_range("2015-03-01", "2015-03-03 23:45", freq = "15min", tz = "UTC")
+        IngestFrames(self.store, self.index, Frames(self.index, 10.0), flush = False)
+        self.begin = pd.Timestamp("2015-03-01", tz = "UTC")
+        self.end = pd.Timestamp("2015-03-03 23:45", tz = "UTC")
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def Ingest(self, timestamp, value):
+        """ ingests one frame of constant radiation """
+        index = pd.DatetimeIndex([timestamp]).tz_localize('UTC')
+        return IngestFrames(self.store, index, Frames(index, value), flush = False)
+
+    def test_versions(self):
+        day = Day("2015-03-02")
+        before = self.store.versions(day - 1, day + 1)
+        self.assertEqual(self.Ingest("2015-03-02 12:00", 20.0), 1)
+        self.assertEqual(list(self.store.versions(day - 1, day + 1) - before), [0, 1, 0])
+        # days never written
+        self.assertEqual(list(self.store.versions(day + 5, day + 6)), [0, 0])
+
+    def test_radiation_cache(self):
+        cache = RadiationCache(self.store, ttl = 60)
+        gridpoints = np.array([1, 4])
+        cache.get_radiation_block(gridpoints, self.begin, self.end)
+        cache.get_radiation(2, self.begin, self.end)
+        del self.store.reads[:]
+        cache.get_radiation_block(gridpoints, self.begin, self.end)
+        cache.get_radiation(2, self.begin, self.end)
+        self.assertEqual(self.store.reads, [])
+
+        self.Ingest("2015-03-02 12:00", 20.0)
+        index, values = cache.get_radiation_block(gridpoints, self.begin, self.end)
+        df = cache.get_radiation(2, self.begin, self.end)
+        # only the day written is read again
+        day = Day("2015-03-02")
+        self.assertEqual(sorted(self.store.reads), [(1, day, day), (2, day, day), (4, day, day)])
+        written = index == pd.Timestamp("2015-03-02 12:00", tz = "UTC")
+        np.testing.assert_array_equal(values["diffuse"][written], [[20.0, 20.0]])
+        np.testing.assert_array_equal(values["diffuse"][~written], 10.0)
+        self.assertEqual(df.diffuse[written].tolist(), [20.0])
+
+    def test_response_cache_key(self):
+        responses = ResponseCache()
+        cache = RadiationCache(self.store)
+        windows = [(pd.Timestamp(begin, tz = "UTC"), pd.Timestamp(end, tz = "UTC"))
+                   for begin, end in (("2015-03-01", "2015-03-01 23:45"),
+                                      ("2015-03-02", "2015-03-02 23:45"),
+                                      ("2015-03-01", "2015-03-03 23:45"),
+                                      ("2015-03-03", "2015-03-03 23:45"))]
+        def keys():
+            return [responses.request_key(begin, end, 3, cache.data_version(begin, end))
+                    for begin, end in windows]
+
+        before = keys()
+        self.Ingest("2015-03-02 06:00", 20.0)
+        changed = [key != old for key, old in zip(keys(), before)]
+        self.assertEqual(changed, [False, True, True, False])
+
+    def test_other_process(self):
+        cache = RadiationCache(self.store)
+        index, values = cache.get_radiation_block([0, 5], self.begin, self.end)
+        self.assertTrue((values["diffuse"] == 10.0).all())
+        version = cache.data_version(self.begin, self.end)
+
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        subprocess.check_call([sys.executable, "-c", WRITE_FRAME, self.path, str(N_GRIDPOINTS),
+                               "2015-03-03 08:15", "30.0"], cwd = root)
+
+        # the same store and cache, without opening them again
+        self.assertEqual(cache.data_version(self.begin, self.end), version + 1)
+        index, values = cache.get_radiation_block([0, 5], self.begin, self.end)
+        written = index == pd.Timestamp("2015-03-03 08:15", tz = "UTC")
+        np.testing.assert_array_equal(values["diffuse"][written], [[30.0, 30.0]])
+        np.testing.assert_array_equal(values["downwelling"][written], [[60.0, 60.0]])
+        self.assertTrue((values["diffuse"][~written] == 10.0).all())
+
+    def test_missing_values_kept(self):
+        index = pd.DatetimeIndex(["2015-03-01 10:00"]).tz_localize('UTC')
+        values = Frames(index, 20.0)
+        values["diffuse"][0, 3] = np.nan
+        self.store.write_frames(index, values)
+        df = self.store.get_radiation(3, index[0], index[0])
+        self.assertEqual(df.diffuse.tolist(), [10.0])
+        self.assertEqual(df.downwelling.tolist(), [40.0])
+
+    def test_wrong_shape(self):
+        index = pd.DatetimeIndex(["2015-03-01 10:00"]).tz_localize('UTC')
+        values = {"diffuse" : np.zeros((1, N_GRIDPOINTS - 1)),
+                  "downwelling" : np.zeros((1, N_GRIDPOINTS - 1))}
+        self.assertRaises(ValueError, self.store.write_frames, index, values)
+        self.assertRaises(ValueError, self.store.write_frames,
+                          pd.DatetimeIndex(["2015-03-01 10:05"]).tz_localize('UTC'),
+                          Frames(index, 1.0))
+
+class FramesFromRowsTest(unittest.TestCase):
+
+    def test_frames(self):
+        df = pd.DataFrame({"datetime" : ["2015-03-01 10:01", "2015-03-01 10:14", "2015-03-01 09:59"],
+                           "longlat" : [2, 0, 5],
+                           "diffuse" : [1.0, 2.0, 3.0],
+                           "downwelling" : [4.0, 5.0, 6.0]})
+        index, values = FramesFromRows(df, N_GRIDPOINTS)
+        self.assertEqual(list(index), [pd.Timestamp("2015-03-01 10:00", tz = "UTC"),
+                                       pd.Timestamp("2015-03-01 10:15", tz = "UTC")])
+        np.testing.assert_array_equal(values["diffuse"],
+                                      [[np.nan, np.nan, 1.0, np.nan, np.nan, 3.0],
+                                       [2.0, np.nan, np.nan, np.nan, np.nan, np.nan]])
+
+    def test_outside_grid(self):
+        for gridpoint in (-1, N_GRIDPOINTS):
+            df = pd.DataFrame({"datetime" : ["2015-03-01 10:00", "2015-03-01 10:00"],
+                               "longlat" : [0, gridpoint],
+                               "diffuse" : [1.0, 2.0],
+                               "downwelling" : [3.0, 4.0]})
+            self.assertRaises(ValueError, FramesFromRows, df, N_GRIDPOINTS)
+
+if __name__ == '__main__':
+    unittest.main()
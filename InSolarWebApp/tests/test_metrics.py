@@ -0,0 +1,86 @@
+import unittest
+
+from InSolarWebApp.metrics import Registry, format_cache_stats, format_server_timing, \
+                                  set_timings, start_timings, stop_timings, timed
+
+class RegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        # a registry of its own, the metrics of the process are left alone
+        self.registry = Registry()
+
+    def test_counter(self):
+        requests = self.registry.counter("requests_total", "Requests", ("endpoint", "status"))
+        requests.inc(endpoint = "/b", status = 200)
+        requests.inc(2, endpoint = "/a", status = 400)
+        requests.inc(endpoint = "/b", status = 200)
+        self.assertIs(self.registry.counter("requests_total", "Requests", ("endpoint", "status")),
+                      requests)
+        self.assertEqual(self.registry.render(),
+                         '# HELP requests_total Requests\n'
+                         '# TYPE requests_total counter\n'
+                         'requests_total{endpoint="/a",status="400"} 2\n'
+                         'requests_total{endpoint="/b",status="200"} 2\n')
+
+    def test_gauge(self):
+        startup = self.registry.gauge("startup_seconds", "Startup", ("phase",))
+        startup.set(3.0, phase = "total")
+        startup.set(0.25, phase = "total")
+        self.registry.gauge("entries", "Entries").set(7)
+        self.assertEqual(self.registry.render(),
+                         '# HELP startup_seconds Startup\n'
+                         '# TYPE startup_seconds gauge\n'
+                         'startup_seconds{phase="total"} 0.25\n'
+                         '# HELP entries Entries\n'
+                         '# TYPE entries gauge\n'
+                         'entries 7\n')
+
+    def test_label_escaping(self):
+        self.registry.counter("errors_total", "Errors", ("error",)).inc(error = 'a "b" \\c')
+        self.assertIn('errors_total{error="a \\"b\\" \\\\c"} 1\n', self.registry.render())
+
+    def test_histogram(self):
+        latency = self.registry.histogram("latency_seconds", "Latency", ("stage",),
+                                          buckets = (1.0, 0.1))
+        for seconds in (0.05, 0.1, 0.5, 2.0):
+            latency.observe(seconds, stage = "gti")
+        self.assertEqual(self.registry.render(),
+                         '# HELP latency_seconds Latency\n'
+                         '# TYPE latency_seconds histogram\n'
+                         'latency_seconds_bucket{stage="gti",le="0.1"} 2\n'
+                         'latency_seconds_bucket{stage="gti",le="1.0"} 3\n'
+                         'latency_seconds_bucket{stage="gti",le="+Inf"} 4\n'
+                         'latency_seconds_sum{stage="gti"} 2.65\n'
+                         'latency_seconds_count{stage="gti"} 4\n')
+
+    def test_empty(self):
+        self.registry.histogram("latency_seconds", "Latency")
+        self.assertEqual(self.registry.render(),
+                         '# HELP latency_seconds Latency\n'
+                         '# TYPE latency_seconds histogram\n')
+
+class FormatTest(unittest.TestCase):
+
+    def test_cache_stats(self):
+        stats = {"solar" : {"hits" : 3, "misses" : 1, "evictions" : 0, "expirations" : 2, "size" : 5},
+                 "radiation" : {"hits" : 1, "misses" : 4, "evictions" : 1, "expirations" : 0, "size" : 9}}
+        lines = format_cache_stats(stats).splitlines()
+        self.assertEqual(lines[:4], ['# HELP insolar_cache_hits_total Cache hits',
+                                     '# TYPE insolar_cache_hits_total counter',
+                                     'insolar_cache_hits_total{cache="radiation"} 1',
+                                     'insolar_cache_hits_total{cache="solar"} 3'])
+        self.assertEqual(lines[-3:], ['# TYPE insolar_cache_entries gauge',
+                                      'insolar_cache_entries{cache="radiation"} 9',
+                                      'insolar_cache_entries{cache="solar"} 5'])
+
+    def test_server_timing(self):
+        start_timings()
+        with timed("gti"):
+            pass
+        timings = stop_timings()
+        self.assertEqual([stage for stage, seconds in timings], ["gti"])
+        set_timings([("a", 0.001), ("b", 0.5), ("a", 0.002)])
+        self.assertEqual(format_server_timing(stop_timings()), "a;dur=3.000, b;dur=500.000")
+
+if __name__ == '__main__':
+    unittest.main()
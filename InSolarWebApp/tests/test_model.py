@@ -0,0 +1,198 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from InSolarWebApp.inverters import InverterRegistry
+from InSolarWebApp.model import fnBlendRadiation, fnGetAggregatedProduction, \
+                                fnGetExpectedProduction, fnGetExpectedProductionMatrix, \
+                                fnGroupInstallations
+from InSolarWebApp.solar_position import fnSunPosition
+
+PARS_GRID = {"glong_min" : 2.45, "glat_min" : 49.3, "glong_max" : 7.3, "glat_max" : 54.0,
+             "N_width" : 100, "N_height" : 80}
+
+def RadiationBlock(index, n_cells, random, gaps = 0.1):
+    """ returns random downwelling and diffuse [time x cell] of a clear day
+    shape, with a fraction gaps of the slots NaN
+    """
+    hours = np.asarray(index.hour) + np.asarray(index.minute) / 60.0
+    daylight = np.clip(np.sin((hours - 4) / 16.0 * np.pi), 0, None)
+    downwelling = 900 * daylight[:, np.newaxis] * random.uniform(0.2, 1, (len(index), n_cells))
+    diffuse = downwelling * random.uniform(0.1, 0.6, (len(index), n_cells))
+    downwelling[random.uniform(size = downwelling.shape) < gaps] = np.nan
+    diffuse[random.uniform(size = diffuse.shape) < gaps] = np.nan
+    return downwelling, diffuse
+
+class ExpectedProductionMatrixTest(unittest.TestCase):
+
+    def setUp(self):
+        self.random = np.random.RandomState(11)
+        self.index = pd.date_range("2015-06-20", periods = 2 * 96, freq = "15min", tz = "UTC")
+        self.inverters = InverterRegistry()
+        self.inverters.register("flat", [0, 0.1, 1], [0.8, 0.95, 0.97])
+        # one location per cell, across the grid
+        self.locations = [(2.6, 49.4), (4.9, 52.4), (7.2, 53.9)]
+
+    def test_parity(self):
+        n_cells = len(self.locations)
+        downwelling, diffuse = RadiationBlock(self.index, n_cells, self.random)
+        positions = [fnSunPosition(self.index, geo_lat, geo_long) for geo_long, geo_lat in self.locations]
+        zenith = np.column_stack([position[0] for position in positions])
+        azimuth = np.column_stack([position[1] for position in positions])
+
+        n = 12
+        installations = {"cell" : np.arange(n) % n_cells,
+                         "orientation" : self.random.uniform(60, 300, n),
+                         "tilt" : self.random.uniform(0, 90, n),
+                         "installation_capacity" : self.random.uniform(500, 20000, n),
+                         "inverter_model" : self.random.randint(0, 2, n)}
+        installations["inverter_capacity"] = installations["installation_capacity"] * \
+                                             self.random.uniform(0.6, 1.2, n)
+        power = fnGetExpectedProductionMatrix(downwelling, diffuse, zenith, azimuth,
+                                              installations, inverters = self.inverters)
+        self.assertEqual(power.shape, (len(self.index), n))
+
+        for i in range(n):
+            cell = installations["cell"][i]
+            geo_long, geo_lat = self.locations[cell]
+            df = pd.DataFrame({"downwelling" : downwelling[:, cell],
+                               "diffuse" : diffuse[:, cell]}, index = self.index)
+            expected = fnGetExpectedProduction(df.copy(), geo_long, geo_lat,
+                                               installations["orientation"][i],
+                                               installations["tilt"][i],
+                                               installations["installation_capacity"][i],
+                                               PARS_GRID,
+                                               inverter_capacity = installations["inverter_capacity"][i],
+                                               inverter_model = installations["inverter_model"][i],
+                                               inverters = self.inverters).power.values
+            # gaps in either radiation are gaps in the power
+            np.testing.assert_array_equal(np.isnan(power[:, i]), np.isnan(expected))
+            np.testing.assert_allclose(power[:, i], expected, rtol = 1e-9, atol = 1e-6)
+
+    def test_default_inverter(self):
+        downwelling, diffuse = RadiationBlock(self.index, 1, self.random, gaps = 0)
+        zenith, azimuth = fnSunPosition(self.index, 52.4, 4.9)
+        df = pd.DataFrame({"downwelling" : downwelling[:, 0], "diffuse" : diffuse[:, 0]},
+                          index = self.index)
+        expected = fnGetExpectedProduction(df, 4.9, 52.4, 200.0, 35.0, 4000.0, PARS_GRID).power.values
+        power = fnGetExpectedProductionMatrix(downwelling, diffuse, zenith[:, np.newaxis],
+                                              azimuth[:, np.newaxis],
+                                              {"cell" : [0], "orientation" : [200.0],
+                                               "tilt" : [35.0], "installation_capacity" : [4000.0]})
+        np.testing.assert_allclose(power[:, 0], expected, rtol = 1e-9, atol = 1e-6)
+
+class BlendRadiationTest(unittest.TestCase):
+
+    def test_weights(self):
+        values = np.array([[100.0, 200.0, 300.0, 400.0],
+                           [0.0, 10.0, 20.0, 30.0]])
+        neighbours = np.array([[0, 1, 2, 3], [3, 3, 3, 3], [1, 0, 1, 0]])
+        weights = np.array([[0.1, 0.2, 0.3, 0.4], [0.25, 0.25, 0.25, 0.25], [0.5, 0.25, 0.25, 0.0]])
+        np.testing.assert_allclose(fnBlendRadiation(values, neighbours, weights),
+                                   [[300.0, 400.0, 175.0], [20.0, 30.0, 7.5]])
+
+    def test_missing_neighbours(self):
+        values = np.array([[100.0, np.nan, 300.0, 400.0],
+                           [np.nan, np.nan, np.nan, np.nan],
+                           [np.nan, np.nan, np.nan, 40.0]])
+        neighbours = np.array([[0, 1, 2, 3], [1, 1, 0, 0]])
+        weights = np.array([[0.1, 0.2, 0.3, 0.4], [0.4, 0.4, 0.1, 0.1]])
+        blended = fnBlendRadiation(values, neighbours, weights)
+        # the weights of the cells with radiation are scaled to 1
+        np.testing.assert_allclose(blended[0], [(10.0 + 90.0 + 160.0) / 0.8, 100.0])
+        # no radiation in any neighbour
+        self.assertTrue(np.isnan(blended[1]).all())
+        np.testing.assert_allclose(blended[2, 0], 40.0)
+        self.assertTrue(np.isnan(blended[2, 1]))
+
+class AggregatedProductionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.random = np.random.RandomState(22)
+        self.inverters = InverterRegistry()
+        self.inverters.register("flat", [0, 0.1, 1], [0.8, 0.95, 0.97])
+
+    def Installations(self, n, n_cells):
+        """ returns random installations with repeated angles and capacity
+        ratios, so many of them group
+        """
+        installation_capacity = self.random.choice([1000.0, 2500.0, 4000.0], n)
+        return {"cell" : self.random.randint(0, n_cells, n),
+                "orientation" : self.random.choice([90.0, 180.0, 181.0, 270.0], n),
+                "tilt" : self.random.choice([15.0, 35.0], n),
+                "installation_capacity" : installation_capacity,
+                "inverter_capacity" : installation_capacity * self.random.choice([0.8, 1.0], n),
+                "inverter_model" : self.random.randint(0, 2, n)}
+
+    def test_groups(self):
+        columns = {"cell" : [0, 0, 1, 0, 0, 0],
+                   "orientation" : [180.0, 180.0, 180.0, 180.0, 190.0, 180.0],
+                   "tilt" : [30.0] * 6,
+                   "installation_capacity" : [1000.0, 3000.0, 1000.0, 2000.0, 1000.0, 1000.0],
+                   "inverter_capacity" : [1000.0, 3000.0, 1000.0, 1000.0, 1000.0, 1000.0],
+                   "inverter_model" : [0, 0, 0, 0, 0, 1]}
+        groups = fnGroupInstallations(**columns)
+        # only the first two have the same cell, angles, inverter model and
+        # capacity ratio
+        group = groups["group"]
+        self.assertEqual(group[0], group[1])
+        self.assertEqual(len(set(group)), 5)
+        self.assertEqual(len(groups["cell"]), 5)
+        for name in ("cell", "orientation", "tilt", "inverter_model"):
+            self.assertEqual(list(groups[name][group]), columns[name])
+        self.assertEqual(groups["installation_capacity"][group[0]], 4000.0)
+        self.assertEqual(groups["inverter_capacity"][group[0]], 4000.0)
+        self.assertEqual(groups["installation_capacity"].sum(), 9000.0)
+
+    def test_angle_step(self):
+        groups = fnGroupInstallations([3, 3, 3], [178.0, 182.0, 200.0], [30.0, 34.0, 30.0],
+                                      [1000.0, 3000.0, 1000.0], [1000.0, 3000.0, 1000.0],
+                                      [0, 0, 0], angle_step = 10.0)
+        group = groups["group"]
+        self.assertEqual(group[0], group[1])
+        self.assertNotEqual(group[0], group[2])
+        # capacity weighted mean angles
+        self.assertAlmostEqual(groups["orientation"][group[0]], 181.0)
+        self.assertAlmostEqual(groups["tilt"][group[0]], 33.0)
+        self.assertEqual(groups["orientation"][group[2]], 200.0)
+        self.assertEqual(groups["installation_capacity"][group[0]], 4000.0)
+
+    def test_empty(self):
+        groups = fnGroupInstallations([], [], [], [], [], [])
+        self.assertEqual(len(groups["cell"]), 0)
+        self.assertEqual(len(groups["group"]), 0)
+
+    def test_sums(self):
+        index = pd.date_range("2015-06-20", periods = 96, freq = "15min", tz = "UTC")
+        n_cells = 4
+        downwelling, diffuse = RadiationBlock(index, n_cells, self.random)
+        positions = [fnSunPosition(index, 50.0 + cell, 3.0 + cell) for cell in range(n_cells)]
+        zenith = np.column_stack([position[0] for position in positions])
+        azimuth = np.column_stack([position[1] for position in positions])
+        installations = self.Installations(200, n_cells - 1)
+
+        power = fnGetExpectedProductionMatrix(downwelling, diffuse, zenith, azimuth,
+                                              installations, inverters = self.inverters)
+        expected = np.zeros((len(index), n_cells))
+        for cell in range(n_cells):
+            expected[:, cell] = power[:, installations["cell"] == cell].sum(axis=1)
+
+        groups = fnGroupInstallations(installations["cell"], installations["orientation"],
+                                      installations["tilt"], installations["installation_capacity"],
+                                      installations["inverter_capacity"],
+                                      installations["inverter_model"])
+        self.assertTrue(len(groups["cell"]) < 200)
+        # blocks of one group, of a few groups and all groups at once
+        for max_values in (1, 5 * len(index), 1e7):
+            aggregated = fnGetAggregatedProduction(downwelling, diffuse, zenith, azimuth, groups,
+                                                   n_cells, inverters = self.inverters,
+                                                   max_values = max_values)
+            self.assertEqual(aggregated.shape, (len(index), n_cells))
+            np.testing.assert_array_equal(np.isnan(aggregated), np.isnan(expected))
+            np.testing.assert_allclose(aggregated, expected, rtol = 1e-9, atol = 1e-6)
+        # the cell without installations
+        np.testing.assert_array_equal(aggregated[:, n_cells - 1], 0.0)
+
+if __name__ == '__main__':
+    unittest.main()
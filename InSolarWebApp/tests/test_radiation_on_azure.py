@@ -0,0 +1,111 @@
+import datetime as dt
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from InSolarWebApp.fake_table_service import FakeTableService
+from InSolarWebApp.radiation_on_azure import DoAzureQuery, DoAzureQueryConcurrent, fnRowKeys2Time
+
+class RecordingTableService(FakeTableService):
+    """ FakeTableService that records the filter and continuation token of
+    every query
+    """
+
+    def __init__(self):
+        FakeTableService.__init__(self)
+        self.queries = []
+
+    def query_entities(self, table_name, filter = None, select = None, top = None,
+                       next_partition_key = None, next_row_key = None):
+        with self._lock:
+            self.queries.append((filter, next_partition_key, next_row_key))
+        return FakeTableService.query_entities(self, table_name, filter, select, top,
+                                               next_partition_key, next_row_key)
+
+def FillDays(table_service, gridpoint, date_begin, n_days):
+    """ inserts the 96 entities of every day, diffuse counts the entities """
+    n = 0
+    for i in range(n_days):
+        day = date_begin + dt.timedelta(days = i)
+        for slot in range(96):
+            row_key = "%s_%02d%02d00" % (day.strftime("%Y%m%d"), slot // 4, 15 * (slot % 4))
+            table_service.insert_entity(None, {"PartitionKey" : "%06d_%s" % (gridpoint, row_key[:8]),
+                                               "RowKey" : row_key,
+                                               "diffuse" : n,
+                                               "downwelling" : 2 * n})
+            n += 1
+
+class DoAzureQueryConcurrentTest(unittest.TestCase):
+
+    def setUp(self):
+        self.table_service = RecordingTableService()
+        # neighbouring gridpoints must not leak into the sub-ranges
+        for gridpoint in (41, 42, 43):
+            FillDays(self.table_service, gridpoint, dt.date(2015, 2, 25), 30)
+
+    def test_sub_ranges(self):
+        DoAzureQueryConcurrent(self.table_service, "test", 42, dt.date(2015, 3, 1),
+                               dt.date(2015, 3, 7), 4, days_per_query = 3)
+        filters = sorted(query[0] for query in self.table_service.queries)
+        self.assertEqual(filters,
+            ["PartitionKey ge '000042_20150301' and PartitionKey lt '000042_20150304'",
+             "PartitionKey ge '000042_20150304' and PartitionKey lt '000042_20150307'",
+             "PartitionKey ge '000042_20150307' and PartitionKey lt '000042_20150308'"])
+
+    def test_continuation_tokens(self):
+        # 11 days of 96 entities do not fit in one page of 1000
+        timestamp, diffuse, downwelling = DoAzureQueryConcurrent(
+            self.table_service, "test", 42, dt.date(2015, 2, 28), dt.date(2015, 3, 21),
+            4, days_per_query = 11)
+        continued = [query for query in self.table_service.queries if query[1] is not None]
+        self.assertEqual(len(self.table_service.queries), 4)
+        self.assertEqual(sorted(query[1:] for query in continued),
+                         [("000042_20150310", "20150310_100000"),
+                          ("000042_20150321", "20150321_100000")])
+        self.assertEqual(len(timestamp), 22 * 96)
+
+    def test_merged_in_order(self):
+        sequential = DoAzureQuery(self.table_service, "test",
+                                  "PartitionKey ge '000042_20150226' and PartitionKey lt '000042_20150322'")
+        for max_workers in (1, 8):
+            result = DoAzureQueryConcurrent(self.table_service, "test", 42, dt.date(2015, 2, 26),
+                                            dt.date(2015, 3, 21), max_workers, days_per_query = 4)
+            self.assertEqual(result, sequential)
+            timestamp = result[0]
+            self.assertEqual(timestamp, sorted(set(timestamp)))
+            self.assertEqual(len(timestamp), 24 * 96)
+
+    def test_empty_range(self):
+        self.assertEqual(DoAzureQueryConcurrent(self.table_service, "test", 42, dt.date(2016, 1, 1),
+                                                dt.date(2016, 1, 9), 4, days_per_query = 3),
+                         ([], [], []))
+
+class RowKeys2TimeTest(unittest.TestCase):
+
+    def assertParsed(self, row_keys):
+        expected = pd.to_datetime(row_keys, format = "%Y%m%d_%H%M%S").asi8
+        np.testing.assert_array_equal(fnRowKeys2Time(row_keys), expected)
+
+    def test_calendar(self):
+        # leap days, ends of months and years, the epoch and every hour
+        self.assertParsed(["20160228_235959", "20160229_000000", "20160301_000000",
+                           "20150228_234500", "20150301_000000", "20000229_120000",
+                           "21000228_120000", "21000301_120000", "19700101_000000",
+                           "19691231_234500", "20141231_234500", "20150101_000000",
+                           "20150131_120000", "20150201_001500", "20151130_101010"])
+        self.assertParsed(["20150629_%02d%02d%02d" % (hour, minute, second)
+                           for hour in range(24) for minute in (0, 15, 59) for second in (0, 30, 59)])
+
+    def test_random(self):
+        random = np.random.RandomState(13)
+        times = pd.to_datetime(random.randint(0, 2**31, 2000).astype(np.int64) * 10**9)
+        self.assertParsed([time.strftime("%Y%m%d_%H%M%S") for time in times])
+
+    def test_empty(self):
+        parsed = fnRowKeys2Time([])
+        self.assertEqual(parsed.dtype, np.int64)
+        self.assertEqual(len(parsed), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from InSolarWebApp.helper_functions import DAY_NS
+from InSolarWebApp.solar_position import SolarPositionCache, SolarTable, fnSunPosition
+
+class RecordingCache(SolarPositionCache):
+    """ SolarPositionCache that records the days it computes """
+
+    def __init__(self, *args):
+        SolarPositionCache.__init__(self, *args)
+        self.computed = []
+
+    def _compute(self, gridpoint, geo_long, geo_lat, day_begin, day_end):
+        self.computed.append((day_begin, day_end))
+        return SolarPositionCache._compute(self, gridpoint, geo_long, geo_lat, day_begin, day_end)
+
+class SolarPositionCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = RecordingCache()
+        self.index = pd.date_range("2015-04-01", "2015-04-30 23:45", freq = "15min", tz = "UTC")
+        self.first = self.index[0].value // DAY_NS
+
+    def test_same_as_ephemeris(self):
+        zenith, azimuth = self.cache.get(7, 4.9, 52.4, self.index[::7])
+        expected_zenith, expected_azimuth = fnSunPosition(self.index[::7], 52.4, 4.9)
+        np.testing.assert_allclose(zenith, expected_zenith, atol = 1e-9)
+        np.testing.assert_allclose(azimuth, expected_azimuth, atol = 1e-9)
+
+    def test_runs_of_missing_days(self):
+        # cached days in the middle are not computed again
+        self.cache.get(7, 4.9, 52.4, self.index[10*96:11*96])
+        self.cache.get(7, 4.9, 52.4, self.index[20*96:22*96])
+        del self.cache.computed[:]
+        zenith, azimuth = self.cache.get(7, 4.9, 52.4, self.index)
+        self.assertEqual([(int(begin - self.first), int(end - self.first))
+                          for begin, end in self.cache.computed],
+                         [(0, 9), (11, 19), (22, 29)])
+        np.testing.assert_allclose(zenith, fnSunPosition(self.index, 52.4, 4.9)[0], atol = 1e-9)
+
+        del self.cache.computed[:]
+        self.cache.get(7, 4.9, 52.4, self.index)
+        self.assertEqual(self.cache.computed, [])
+
+class SolarTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_read_through_cache(self):
+        table = SolarTable(self.path, 2)
+        table.compute(1, 4.9, 52.4, 2015)
+        self.assertTrue(table.is_complete(1, 2015))
+        self.assertFalse(table.is_complete(0, 2015))
+        # zenith and azimuth only, the clear sky irradiance follows from the zenith
+        self.assertEqual(sorted(os.listdir(os.path.join(self.path, "2015"))),
+                         ["azimuth.npy", "present.npy", "versions.npy", "zenith.npy"])
+
+        cache = RecordingCache(50000, table)
+        index = pd.date_range("2015-06-01", "2015-06-03 23:45", freq = "15min", tz = "UTC")
+        zenith, azimuth = cache.get(1, 4.9, 52.4, index)
+        self.assertEqual(cache.computed, [])
+        expected_zenith, expected_azimuth = fnSunPosition(index, 52.4, 4.9)
+        np.testing.assert_allclose(zenith, expected_zenith, atol = 1e-4)
+        np.testing.assert_allclose(azimuth, expected_azimuth, atol = 1e-4)
+        # not in the table
+        cache.get(0, 2.6, 49.4, index)
+        self.assertEqual(len(cache.computed), 1)
+
+if __name__ == '__main__':
+    unittest.main()